@@ -0,0 +1,138 @@
+from elleelleaime.core.utils.jsonl import stream_jsonl
+from elleelleaime.generate.strategies.models.huggingface.batching import (
+    tokenize,
+    generate_batched,
+    assisted_generation_kwargs,
+)
+from elleelleaime.generate.strategies.models.huggingface.model_registry import (
+    HuggingFaceModelRegistry,
+)
+
+from typing import Any, Dict, List, Optional
+
+import fire
+import sys
+import time
+import logging
+
+
+def _prompt(prompt: str, tokenizer: Any) -> str:
+    # Only the CodeLLaMA tokenizers infill <FILL_ME>, other models complete the prefix
+    if "<FILL_ME>" in prompt and getattr(tokenizer, "fill_token", None) is None:
+        return prompt.split("<FILL_ME>")[0]
+    return prompt
+
+
+def _run(
+    model: Any, tokenizer: Any, prompts: List[str], max_new_tokens: int, **kwargs
+) -> Dict[str, Any]:
+    n_tokens = 0
+
+    def decode(outputs: Any, inputs: Any) -> List[str]:
+        nonlocal n_tokens
+        generated_ids = outputs[:, inputs["input_ids"].shape[1] :]
+        n_tokens += int((generated_ids != tokenizer.pad_token_id).sum())
+        return tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+
+    input_ids = tokenize(tokenizer, prompts)
+    start = time.perf_counter()
+    generations = generate_batched(
+        model,
+        tokenizer,
+        input_ids,
+        batch_size=1,
+        max_tokens_per_batch=None,
+        num_return_sequences=1,
+        decode=decode,
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        num_beams=1,
+        use_cache=True,
+        **kwargs,
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "generations": [generation[0] for generation in generations],
+        "tokens": n_tokens,
+        "seconds": elapsed,
+        "tokens_per_second": n_tokens / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def entry_point(
+    samples_path: str,
+    model_name: str = "bigcode/tiny_starcoder_py",
+    n_samples: int = 20,
+    max_new_tokens: int = 128,
+    prompt_lookup_num_tokens: Optional[int] = 10,
+    assistant_model_name: Optional[str] = None,
+    dtype: str = "float32",
+):
+    """
+    Measures the generation throughput (in tokens per second) of assisted generation
+    against the current generation path, with greedy decoding and one prompt at a time,
+    on the first `n_samples` prompts of a samples file generated with generate_samples.py.
+
+    Prompt lookup decoding is measured unless `prompt_lookup_num_tokens` is None, and
+    generation with a draft model when `assistant_model_name` is set.
+    """
+    prompts = []
+    for sample in stream_jsonl(samples_path):
+        if sample["prompt"] is not None:
+            prompts.append(sample["prompt"])
+        if len(prompts) >= n_samples:
+            break
+
+    model, tokenizer = HuggingFaceModelRegistry.acquire(model_name, dtype=dtype)
+    prompts = [_prompt(prompt, tokenizer) for prompt in prompts]
+    modes = {"baseline": dict()}
+    if prompt_lookup_num_tokens is not None:
+        modes["prompt_lookup"] = assisted_generation_kwargs(
+            prompt_lookup_num_tokens=prompt_lookup_num_tokens
+        )
+    if assistant_model_name is not None:
+        assistant_model, _ = HuggingFaceModelRegistry.acquire(
+            assistant_model_name, dtype=dtype
+        )
+        modes["assistant_model"] = assisted_generation_kwargs(assistant_model)
+
+    # Warm up, so that the first mode is not penalized by lazy initialization
+    _run(model, tokenizer, prompts[:1], max_new_tokens)
+
+    results = {}
+    for mode, kwargs in modes.items():
+        logging.info(f"Benchmarking {mode} on {len(prompts)} prompts...")
+        results[mode] = _run(model, tokenizer, prompts, max_new_tokens, **kwargs)
+
+    baseline = results["baseline"]
+    print(f"{'mode':<16}{'tokens':>10}{'seconds':>10}{'tokens/s':>10}{'speedup':>10}")
+    for mode, result in results.items():
+        speedup = result["tokens_per_second"] / max(baseline["tokens_per_second"], 1e-9)
+        print(
+            f"{mode:<16}{result['tokens']:>10}{result['seconds']:>10.2f}"
+            f"{result['tokens_per_second']:>10.1f}{speedup:>10.2f}"
+        )
+        # Greedy assisted generation must not change the generations
+        n_same = sum(
+            generation == expected
+            for generation, expected in zip(
+                result["generations"], baseline["generations"]
+            )
+        )
+        if n_same < len(prompts):
+            logging.warning(
+                f"{mode}: {len(prompts) - n_same} generations differ from the baseline"
+            )
+
+    HuggingFaceModelRegistry.release(model_name, dtype=dtype)
+    if assistant_model_name is not None:
+        HuggingFaceModelRegistry.release(assistant_model_name, dtype=dtype)
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    fire.Fire(entry_point)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
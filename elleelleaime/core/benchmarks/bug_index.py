@@ -0,0 +1,77 @@
+import os
+import json
+import logging
+import subprocess
+
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+
+# Bumped when the layout of the indexed metadata changes, to invalidate older indexes
+INDEX_FORMAT = 1
+
+
+def get_commit(path: Path) -> Optional[str]:
+    """
+    Returns the commit checked out in the git repository (e.g. a benchmark submodule) at
+    the given path, or None if it is not a git repository.
+    """
+    try:
+        run = subprocess.run(
+            ["git", "-C", str(path), "rev-parse", "--show-toplevel", "HEAD"],
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    toplevel, commit = run.stdout.decode("utf-8").splitlines()
+    # A directory inside another repository (e.g. a submodule that is not checked out)
+    # has no version of its own
+    if Path(toplevel).resolve() != Path(path).resolve():
+        return None
+    return commit
+
+
+class BugIndex:
+    """
+    On-disk index of the metadata of the bugs of a benchmark (e.g. ground truth and
+    failing tests), so that the benchmark is initialized without running its tooling.
+
+    The index is valid for one version of the benchmark (e.g. the commit of its
+    submodule), and is ignored when the benchmark is at another version.
+    """
+
+    def __init__(self, index_path: Path):
+        self.index_path = Path(index_path).absolute()
+
+    def load(self, version: str) -> Optional[Dict[str, dict]]:
+        """
+        Returns the metadata of the bugs indexed for the given version, by bug identifier,
+        or None if there is no index for that version.
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get("format") != INDEX_FORMAT or index.get("version") != version:
+            logging.info(f"Ignoring outdated bug index {self.index_path}")
+            return None
+        return index["bugs"]
+
+    def save(self, version: str, bugs: Dict[str, dict]) -> None:
+        """
+        Saves the metadata of the bugs for the given version, replacing the index.
+        """
+        # Never let the index end up in a git repository (e.g. the benchmarks directory)
+        if not self.index_path.parent.exists():
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(Path(self.index_path.parent, ".gitignore"), "w") as f:
+                f.write("*\n")
+
+        # Write to a temporary file and move it in place atomically, so that concurrent
+        # processes never read a partial index
+        tmp_path = Path(self.index_path.parent, f".{self.index_path.name}-{uuid4()}")
+        with open(tmp_path, "w") as f:
+            json.dump({"format": INDEX_FORMAT, "version": version, "bugs": bugs}, f)
+        os.replace(tmp_path, self.index_path)
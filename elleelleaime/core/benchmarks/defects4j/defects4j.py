@@ -1,7 +1,9 @@
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.core.benchmarks.bug_index import BugIndex, get_commit
 from elleelleaime.core.benchmarks.defects4j.defects4jbug import Defects4JBug
 
 import subprocess
@@ -14,75 +16,130 @@ import pandas as pd
 class Defects4J(Benchmark):
     """
     The class for representing the Defects4J benchmark.
+
+    The metadata of the bugs is indexed in `index_path` for the commit of the benchmark,
+    so that initializing the benchmark again does not run Defects4J.
     """
 
-    def __init__(self, path: Path = Path("benchmarks/defects4j").absolute()) -> None:
+    def __init__(
+        self,
+        path: Path = Path("benchmarks/defects4j").absolute(),
+        index_path: Optional[Path] = None,
+        n_workers: Optional[int] = None,
+    ) -> None:
         super().__init__("defects4j", path)
+        self.index = BugIndex(
+            index_path or Path(self.path.parent, ".index", "defects4j.json")
+        )
+        self.n_workers = n_workers or os.cpu_count() or 1
 
     def get_bin(self, options: str = "") -> Optional[str]:
         return f'{Path(self.path, "framework/bin/defects4j")}'
 
-    def initialize(self) -> None:
+    @staticmethod
+    def __parse_failing_tests(failing_test_cases: str, trigger_cause: str) -> dict:
+        failing_tests = {}
+        for failing_test_case in failing_test_cases.split(";"):
+            cause = trigger_cause.split(f"{failing_test_case} --> ")[1]
+            # The trigger cause list elements are separated by ";" but sometimes this char is also included in the element itself and is not espaced
+            # To avoid this we check if there are more any remaining elements and remove them from the string.
+            if " --> " in cause:
+                while " --> " in cause:
+                    cause = cause.split(" --> ")[1]
+                for test in failing_test_case.split(";"):
+                    if test in cause:
+                        cause = cause.replace(test, "")
+            failing_tests[failing_test_case] = cause.strip()
+        return failing_tests
+
+    def __load_project(self, pid: str) -> Dict[str, dict]:
         """
-        Initializes the Defects4J benchmark object by collecting the list of all projects and bugs.
+        Returns the metadata of the bugs of a project, by bug identifier.
         """
-        logging.info("Initializing Defects4J benchmark...")
+        # Get all bug ids
+        run = subprocess.run(
+            f"{self.get_bin()} bids -p {pid}",
+            shell=True,
+            capture_output=True,
+            check=True,
+        )
+        bids: Set[int] = {int(bid.decode("utf-8")) for bid in run.stdout.split()}
+        logging.info("Found %3d bugs for project %s" % (len(bids), pid))
 
-        # Get all project ids
+        # Extract failing test and trigger cause
         run = subprocess.run(
-            f"{self.get_bin()} pids",
+            f"{self.get_bin()} query -p {pid} -q 'tests.trigger,tests.trigger.cause'",
             shell=True,
             capture_output=True,
             check=True,
         )
-        pids = {pid.decode("utf-8") for pid in run.stdout.split()}
-        logging.info("Found %3d projects" % len(pids))
+        data = run.stdout.decode("utf-8")
+        df = pd.read_csv(StringIO(data), sep=",", names=["bid", "tests", "errors"])
+        # Index the failing tests and trigger causes by bug id once
+        triggers: Dict[int, Tuple[str, str]] = {
+            int(bid): (tests, errors)
+            for bid, tests, errors in df.itertuples(index=False)
+        }
 
-        # Get all bug ids for all pids
         bugs = {}
-        for pid in tqdm.tqdm(pids):
-            run = subprocess.run(
-                f"{self.get_bin()} bids -p {pid}",
-                shell=True,
-                capture_output=True,
-                check=True,
+        for bid in bids:
+            # Extract ground truth diff
+            diff_path = Path(
+                self.path, "framework/projects", pid, "patches", f"{bid}.src.patch"
             )
-            bugs[pid] = {int(bid.decode("utf-8")) for bid in run.stdout.split()}
-            logging.info("Found %3d bugs for project %s" % (len(bugs[pid]), pid))
+            with open(diff_path, "r", encoding="ISO-8859-1") as diff_file:
+                diff = diff_file.read()
+
+            failing_test_cases, trigger_cause = triggers[bid]
+            bugs[f"{pid}-{bid}"] = {
+                "pid": pid,
+                "bid": bid,
+                "ground_truth": diff,
+                "failing_tests": self.__parse_failing_tests(
+                    failing_test_cases, trigger_cause
+                ),
+            }
+        return bugs
 
-        # Initialize dataset
-        for pid in pids:
-            # Extract failing test and trigger cause
+    def initialize(self) -> None:
+        """
+        Initializes the Defects4J benchmark object by collecting the list of all projects and bugs.
+        """
+        logging.info("Initializing Defects4J benchmark...")
+
+        # Load the bugs from the index of this version of Defects4J, if any
+        version = get_commit(self.path)
+        bugs = self.index.load(version) if version is not None else None
+
+        if bugs is None:
+            # Get all project ids
             run = subprocess.run(
-                f"{self.get_bin()} query -p {pid} -q 'tests.trigger,tests.trigger.cause'",
+                f"{self.get_bin()} pids",
                 shell=True,
                 capture_output=True,
                 check=True,
             )
-            data = run.stdout.decode("utf-8")
-            df = pd.read_csv(StringIO(data), sep=",", names=["bid", "tests", "errors"])
-
-            for bid in bugs[pid]:
-                # Extract ground truth diff
-                diff_path = f"benchmarks/defects4j/framework/projects/{pid}/patches/{bid}.src.patch"
-                with open(diff_path, "r", encoding="ISO-8859-1") as diff_file:
-                    diff = diff_file.read()
-
-                # Extract failing test cases and trigger causes
-                failing_test_cases = df[df["bid"] == bid]["tests"].values[0]
-                trigger_cause = df[df["bid"] == bid]["errors"].values[0]
-
-                failing_tests = {}
-                for failing_test_case in failing_test_cases.split(";"):
-                    cause = trigger_cause.split(f"{failing_test_case} --> ")[1]
-                    # The trigger cause list elements are separated by ";" but sometimes this char is also included in the element itself and is not espaced
-                    # To avoid this we check if there are more any remaining elements and remove them from the string.
-                    if " --> " in cause:
-                        while " --> " in cause:
-                            cause = cause.split(" --> ")[1]
-                        for test in failing_test_case.split(";"):
-                            if test in cause:
-                                cause = cause.replace(test, "")
-                    failing_tests[failing_test_case] = cause.strip()
-
-                self.add_bug(Defects4JBug(self, pid, bid, diff, failing_tests))
+            pids = sorted({pid.decode("utf-8") for pid in run.stdout.split()})
+            logging.info("Found %3d projects" % len(pids))
+
+            # Query the projects concurrently
+            bugs = {}
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                for project_bugs in tqdm.tqdm(
+                    executor.map(self.__load_project, pids), total=len(pids)
+                ):
+                    bugs.update(project_bugs)
+
+            if version is not None:
+                self.index.save(version, bugs)
+
+        for bug in bugs.values():
+            self.add_bug(
+                Defects4JBug(
+                    self,
+                    bug["pid"],
+                    bug["bid"],
+                    bug["ground_truth"],
+                    bug["failing_tests"],
+                )
+            )
@@ -1,5 +1,7 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.core.benchmarks.bug_index import BugIndex, get_commit
 from elleelleaime.core.benchmarks.gitbugjava.gitbugjavabug import GitBugJavaBug
 
 from typing import Optional
@@ -14,11 +16,24 @@ import os
 class GitBugJava(Benchmark):
     """
     The class for representing the GitBug-Java benchmark.
+
+    The metadata of the bugs is indexed in `index_path` for the revision of the benchmark,
+    so that initializing the benchmark again does not run GitBug-Java.
     """
 
-    def __init__(self, path: Path = Path("benchmarks/gitbug-java").absolute()) -> None:
+    def __init__(
+        self,
+        path: Path = Path("benchmarks/gitbug-java").absolute(),
+        index_path: Optional[Path] = None,
+        n_workers: Optional[int] = None,
+    ) -> None:
         super().__init__("gitbugjava", path)
         self.bin = f"cd {self.path} && poetry run {path.joinpath('gitbug-java')}"
+        self.index = BugIndex(
+            index_path or Path(self.path.parent, ".index", "gitbugjava.json")
+        )
+        # Each info command starts its own interpreter, so their number is bounded
+        self.n_workers = n_workers or os.cpu_count() or 1
 
     def get_bin(self, options: str = "") -> Optional[str]:
         return self.bin
@@ -41,53 +56,81 @@ class GitBugJava(Benchmark):
             timeout=timeout,
         )
 
+    def __load_bug(self, bid: str) -> dict:
+        """
+        Returns the metadata of a bug, parsed from the output of the info command.
+        """
+        run = self.run_command(
+            f"info {bid}",
+            check=True,
+        )
+        stdout = run.stdout.decode("utf-8")
+
+        # Get diff (after "### Bug Patch", between triple ticks)
+        diff = stdout.split("### Bug Patch")[1].split("```diff")[1].split("```")[0]
+
+        # Get failing tests
+        # The info command prints out the failing tests in the following format
+        # - failing test
+        #   - type of failure
+        #   - failure message
+        failing_tests = {}
+        stdout = stdout.split("### Failing Tests")[1]
+        for test in re.split(r"(^-)", stdout):
+            # Split the three lines
+            info = test.strip().split("\n")
+
+            # Extract failing test class and method
+            failing_test_case = info[0].replace("-", "", 1).strip()
+            failing_test_case = (
+                failing_test_case.replace(":", "::")
+                .replace("#", "::")
+                .replace("()", "")
+            )
+            # Remove value between '$' and '::' if it exists (happens for jitterted tests)
+            failing_test_case = re.sub(r"\$.*?::", "::", failing_test_case)
+
+            # Extract cause
+            cause = info[2].replace("-", "", 1).strip()
+            if cause == "None":
+                cause = info[1].replace("-", "", 1).strip()
+            failing_tests[failing_test_case] = cause
+
+        return {"ground_truth": diff, "failing_tests": failing_tests}
+
     def initialize(self) -> None:
         """
         Initializes the GitBug-Java benchmark object by collecting the list of all projects and bugs.
         """
         logging.info("Initializing GitBug-Java benchmark...")
 
-        # Get all bug ids
-        run = self.run_command("bids")
-        bids = {bid.decode("utf-8") for bid in run.stdout.split()}
-        logging.info("Found %3d bugs" % len(bids))
+        # Load the bugs from the index of this revision of GitBug-Java, if any
+        version = get_commit(self.path)
+        bugs = self.index.load(version) if version is not None else None
 
-        for bid in tqdm.tqdm(bids, "Loading GitBug-Java"):
-            # Run info command
-            run = self.run_command(
-                f"info {bid}",
-                check=True,
-            )
-            stdout = run.stdout.decode("utf-8")
-
-            # Get diff (after "### Bug Patch", between triple ticks)
-            diff = stdout.split("### Bug Patch")[1].split("```diff")[1].split("```")[0]
-
-            # Get failing tests
-            # The info command prints out the failing tests in the following format
-            # - failing test
-            #   - type of failure
-            #   - failure message
-            failing_tests = {}
-            stdout = stdout.split("### Failing Tests")[1]
-            for test in re.split(r"(^-)", stdout):
-                # Split the three lines
-                info = test.strip().split("\n")
-
-                # Extract failing test class and method
-                failing_test_case = info[0].replace("-", "", 1).strip()
-                failing_test_case = (
-                    failing_test_case.replace(":", "::")
-                    .replace("#", "::")
-                    .replace("()", "")
+        if bugs is None:
+            # Get all bug ids
+            run = self.run_command("bids")
+            bids = sorted({bid.decode("utf-8") for bid in run.stdout.split()})
+            logging.info("Found %3d bugs" % len(bids))
+
+            # Run the info commands concurrently
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                bugs = dict(
+                    zip(
+                        bids,
+                        tqdm.tqdm(
+                            executor.map(self.__load_bug, bids),
+                            "Loading GitBug-Java",
+                            total=len(bids),
+                        ),
+                    )
                 )
-                # Remove value between '$' and '::' if it exists (happens for jitterted tests)
-                failing_test_case = re.sub(r"\$.*?::", "::", failing_test_case)
 
-                # Extract cause
-                cause = info[2].replace("-", "", 1).strip()
-                if cause == "None":
-                    cause = info[1].replace("-", "", 1).strip()
-                failing_tests[failing_test_case] = cause
+            if version is not None:
+                self.index.save(version, bugs)
 
-            self.add_bug(GitBugJavaBug(self, bid, diff, failing_tests))
+        for bid, bug in bugs.items():
+            self.add_bug(
+                GitBugJavaBug(self, bid, bug["ground_truth"], bug["failing_tests"])
+            )
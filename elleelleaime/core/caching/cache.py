@@ -1,17 +1,17 @@
-import json
 import hashlib
 import logging
 
-from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 from elleelleaime.core.utils.benchmarks import get_benchmark
 from elleelleaime.core.benchmarks.bug import Bug
+from elleelleaime.core.caching.cache_backend import get_cache_backend
 
 
 class Cache:
-    def __init__(self, cache_path: str):
+    def __init__(self, cache_path: str, backend: Optional[str] = None):
         self.cache_path = cache_path
+        self.backend = get_cache_backend(cache_path, backend)
 
     def __hash_generation(self, generation: str) -> str:
         """Hash generation to create a unique identifier for the patch"""
@@ -20,52 +20,76 @@ class Cache:
     def load_from_cache(
         self, benchmark: str, bid: str, generation: str
     ) -> Optional[dict]:
-        # Compute directory, check if it exists
-        bug_path = Path(self.cache_path, benchmark, bid)
-        if not bug_path.exists():
-            return None
+        return self.load_many_from_cache(benchmark, bid, [generation])[0]
 
-        # Check if the generation is cached
-        generation_hash = self.__hash_generation(generation)
-        if not (bug_path / generation_hash).exists():
-            return None
-
-        # Load the cached evaluation
-        logging.info(f"Loading evaluation from cache for {bid}")
-        with open(bug_path / generation_hash, "r") as f:
-            evaluation = json.load(f)
-
-        return evaluation
+    def load_many_from_cache(
+        self, benchmark: str, bid: str, generations: List[str]
+    ) -> List[Optional[dict]]:
+        evaluations = self.backend.get_many(
+            [
+                (benchmark, bid, self.__hash_generation(generation))
+                for generation in generations
+            ]
+        )
+        if any(evaluation is not None for evaluation in evaluations):
+            logging.info(f"Loading evaluation from cache for {bid}")
+        return evaluations
 
     def load_from_cache_from_bug(self, bug: Bug, generation: str) -> Optional[dict]:
         return self.load_from_cache(
             bug.benchmark.get_identifier(), bug.get_identifier(), generation
         )
 
+    def load_many_from_cache_from_bug(
+        self, bug: Bug, generations: List[str]
+    ) -> List[Optional[dict]]:
+        return self.load_many_from_cache(
+            bug.benchmark.get_identifier(), bug.get_identifier(), generations
+        )
+
     def save_to_cache(
         self, benchmark: str, bid: str, generation: str, evaluation: dict
     ):
-        # Compute directory, check if it exists
-        bug_path = Path(self.cache_path, benchmark, bid)
-        if not bug_path.exists():
-            bug_path.mkdir(parents=True)
+        self.save_many_to_cache(benchmark, bid, [generation], [evaluation])
 
-        # Check if the evaluation already exists
-        evaluation_path = bug_path / self.__hash_generation(generation)
-        if evaluation_path.exists():
-            with open(evaluation_path, "r") as f:
-                existing_evaluation = json.load(f)
-                # Check if the existing evaluation is the same as the new one
+    def save_many_to_cache(
+        self, benchmark: str, bid: str, generations: List[str], evaluations: List[dict]
+    ):
+        keys = [
+            (benchmark, bid, self.__hash_generation(generation))
+            for generation in generations
+        ]
+
+        # Only save the evaluations that do not exist. The bug is usually in memory
+        # since it was loaded from the cache, and then the backend is not queried
+        new_evaluations = {}
+        existing_evaluations = self.backend.get_many(keys, record=False)
+        for key, generation, evaluation, existing_evaluation in zip(
+            keys, generations, evaluations, existing_evaluations
+        ):
+            # Check if the existing evaluation is the same as the new one
+            if existing_evaluation is not None:
                 if existing_evaluation != evaluation:
                     logging.error(
-                        f"Evaluation for {bid} and generation {generation} already exists but is different. Hash: {self.__hash_generation(generation)}"
+                        f"Evaluation for {bid} and generation {generation} already exists but is different. Hash: {key[2]}"
                     )
-        else:
-            # Save the evaluation if it does not exist
-            with open(evaluation_path, "w") as f:
-                json.dump(evaluation, f, indent=4)
+            else:
+                new_evaluations[key] = evaluation
+
+        if len(new_evaluations) > 0:
+            self.backend.put_many(list(new_evaluations.items()))
 
     def save_to_cache_from_bug(self, bug: Bug, generation: str, evaluation: dict):
         self.save_to_cache(
             bug.benchmark.get_identifier(), bug.get_identifier(), generation, evaluation
         )
+
+    def save_many_to_cache_from_bug(
+        self, bug: Bug, generations: List[str], evaluations: List[dict]
+    ):
+        self.save_many_to_cache(
+            bug.benchmark.get_identifier(),
+            bug.get_identifier(),
+            generations,
+            evaluations,
+        )
@@ -0,0 +1,367 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# A cache key is a tuple of the form (benchmark, bug identifier, generation hash)
+CacheKey = Tuple[str, str, str]
+
+
+class CacheBackend(ABC):
+    """
+    Storage of cached evaluations, addressed by benchmark, bug identifier and
+    hash of the generation.
+    """
+
+    @abstractmethod
+    def get(self, key: CacheKey) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def put(self, key: CacheKey, evaluation: dict) -> None:
+        pass
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[dict]]:
+        return [self.get(key) for key in keys]
+
+    def put_many(self, items: List[Tuple[CacheKey, dict]]) -> None:
+        for key, evaluation in items:
+            self.put(key, evaluation)
+
+    @abstractmethod
+    def get_all(self, benchmark: str, bid: str) -> Dict[str, dict]:
+        """
+        Returns all cached evaluations of the given bug, keyed by generation hash.
+        """
+        pass
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[CacheKey, dict]]:
+        """
+        Iterates over all cached evaluations.
+        """
+        pass
+
+
+class DirectoryCacheBackend(CacheBackend):
+    """
+    Stores each evaluation in its own JSON file at `{cache_path}/{benchmark}/{bid}/{hash}`.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+
+    def get(self, key: CacheKey) -> Optional[dict]:
+        try:
+            with open(Path(self.cache_path, *key), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: CacheKey, evaluation: dict) -> None:
+        evaluation_path = Path(self.cache_path, *key)
+        evaluation_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(evaluation_path, "w") as f:
+            json.dump(evaluation, f, indent=4)
+
+    def get_all(self, benchmark: str, bid: str) -> Dict[str, dict]:
+        bug_path = Path(self.cache_path, benchmark, bid)
+        if not bug_path.is_dir():
+            return {}
+        return {
+            key[2]: evaluation for key, evaluation in self.__bug_items(benchmark, bid)
+        }
+
+    def __bug_items(self, benchmark: str, bid: str) -> Iterator[Tuple[CacheKey, dict]]:
+        bug_path = Path(self.cache_path, benchmark, bid)
+        for generation_hash in sorted(os.listdir(bug_path)):
+            # Skip anything that is not an evaluation (e.g. the checkout store)
+            if not Path(bug_path, generation_hash).is_file():
+                continue
+            key = (benchmark, bid, generation_hash)
+            try:
+                evaluation = self.get(key)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping cache entry {key}: {e}")
+                continue
+            if evaluation is not None:
+                yield key, evaluation
+
+    def items(self) -> Iterator[Tuple[CacheKey, dict]]:
+        for benchmark in sorted(os.listdir(self.cache_path)):
+            benchmark_path = Path(self.cache_path, benchmark)
+            # Skip files and hidden directories (e.g. .git) at the root of the cache
+            if benchmark.startswith(".") or not benchmark_path.is_dir():
+                continue
+            for bid in sorted(os.listdir(benchmark_path)):
+                bug_path = Path(benchmark_path, bid)
+                if not bug_path.is_dir():
+                    continue
+                yield from self.__bug_items(benchmark, bid)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Stores all evaluations in a single SQLite database, with one row per key.
+
+    The database uses write-ahead logging, so that concurrent readers do not block
+    the writer, and each thread uses its own connection.
+    """
+
+    # Maximum number of keys per query (SQLite limits the number of parameters)
+    MAX_KEYS_PER_QUERY = 256
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.__local = threading.local()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self.__connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    benchmark TEXT NOT NULL,
+                    bid TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    evaluation TEXT NOT NULL,
+                    PRIMARY KEY (benchmark, bid, hash)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def __connection(self) -> sqlite3.Connection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.__local.connection = connection
+        return connection
+
+    def get(self, key: CacheKey) -> Optional[dict]:
+        row = (
+            self.__connection()
+            .execute(
+                "SELECT evaluation FROM evaluations WHERE benchmark = ? AND bid = ? AND hash = ?",
+                key,
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: CacheKey, evaluation: dict) -> None:
+        self.put_many([(key, evaluation)])
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[dict]]:
+        found: Dict[CacheKey, dict] = {}
+        connection = self.__connection()
+        # Keys are looked up per bug, which is how they are requested in practice
+        keys_per_bug: Dict[Tuple[str, str], List[str]] = {}
+        for benchmark, bid, generation_hash in keys:
+            keys_per_bug.setdefault((benchmark, bid), []).append(generation_hash)
+        for (benchmark, bid), hashes in keys_per_bug.items():
+            for i in range(0, len(hashes), self.MAX_KEYS_PER_QUERY):
+                chunk = hashes[i : i + self.MAX_KEYS_PER_QUERY]
+                rows = connection.execute(
+                    "SELECT hash, evaluation FROM evaluations WHERE benchmark = ? AND bid = ?"
+                    + f" AND hash IN ({', '.join('?' * len(chunk))})",
+                    (benchmark, bid, *chunk),
+                )
+                for generation_hash, evaluation in rows:
+                    found[(benchmark, bid, generation_hash)] = json.loads(evaluation)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items: List[Tuple[CacheKey, dict]]) -> None:
+        with self.__connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO evaluations (benchmark, bid, hash, evaluation) VALUES (?, ?, ?, ?)",
+                [(*key, json.dumps(evaluation)) for key, evaluation in items],
+            )
+
+    def get_all(self, benchmark: str, bid: str) -> Dict[str, dict]:
+        rows = self.__connection().execute(
+            "SELECT hash, evaluation FROM evaluations WHERE benchmark = ? AND bid = ?",
+            (benchmark, bid),
+        )
+        return {
+            generation_hash: json.loads(evaluation)
+            for generation_hash, evaluation in rows
+        }
+
+    def items(self) -> Iterator[Tuple[CacheKey, dict]]:
+        rows = self.__connection().execute(
+            "SELECT benchmark, bid, hash, evaluation FROM evaluations ORDER BY benchmark, bid, hash"
+        )
+        for benchmark, bid, generation_hash, evaluation in rows:
+            yield (benchmark, bid, generation_hash), json.loads(evaluation)
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    In-memory front of another backend.
+
+    The first time an evaluation of a bug is requested, all the evaluations of the bug
+    are read from the backend at once. Evaluations are kept in a bounded LRU, and a bug
+    is read again only if some of its evaluations have been evicted, or if evaluations
+    of it have been written since. Until then, evaluations of the bug that are not in
+    memory are missing, without looking them up in the backend. Writes go through to
+    the backend.
+    """
+
+    def __init__(self, backend: CacheBackend, max_entries: int = 100_000):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[CacheKey, dict] = OrderedDict()
+        # Bugs whose evaluations are all in memory
+        self.__prefetched: Set[Tuple[str, str]] = set()
+        self.__lock = threading.Lock()
+
+    def __insert(self, key: CacheKey, evaluation: dict) -> None:
+        self.__entries[key] = evaluation
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            (benchmark, bid, _), _ = self.__entries.popitem(last=False)
+            self.__prefetched.discard((benchmark, bid))
+
+    def __prefetch(self, keys: List[CacheKey]) -> None:
+        with self.__lock:
+            bugs = {(benchmark, bid) for benchmark, bid, _ in keys}
+            bugs -= self.__prefetched
+        for benchmark, bid in bugs:
+            evaluations = self.backend.get_all(benchmark, bid)
+            with self.__lock:
+                for generation_hash, evaluation in evaluations.items():
+                    key = (benchmark, bid, generation_hash)
+                    if key not in self.__entries:
+                        self.__insert(key, evaluation)
+                # Only mark the bug as prefetched if all its evaluations fit in memory
+                if len(evaluations) <= self.max_entries:
+                    self.__prefetched.add((benchmark, bid))
+
+    def get(self, key: CacheKey) -> Optional[dict]:
+        return self.get_many([key])[0]
+
+    def get_many(
+        self, keys: List[CacheKey], record: bool = True
+    ) -> List[Optional[dict]]:
+        """
+        Returns the evaluations of the given keys. Lookups are counted as hits or
+        misses only if `record` is set.
+        """
+        self.__prefetch(keys)
+        hits, misses = 0, 0
+        evaluations: List[Optional[dict]] = []
+        missing: List[int] = []
+        with self.__lock:
+            for i, key in enumerate(keys):
+                if key in self.__entries:
+                    self.__entries.move_to_end(key)
+                    evaluations.append(dict(self.__entries[key]))
+                    hits += 1
+                else:
+                    evaluations.append(None)
+                    misses += 1
+                    # If the bug was evicted, the evaluation might still be in the backend
+                    if (key[0], key[1]) not in self.__prefetched:
+                        missing.append(i)
+
+        if len(missing) > 0:
+            found = self.backend.get_many([keys[i] for i in missing])
+            with self.__lock:
+                for i, evaluation in zip(missing, found):
+                    if evaluation is not None:
+                        self.__insert(keys[i], evaluation)
+                        evaluations[i] = dict(evaluation)
+                        hits += 1
+                        misses -= 1
+
+        if record:
+            with self.__lock:
+                self.hits += hits
+                self.misses += misses
+        return evaluations
+
+    def put(self, key: CacheKey, evaluation: dict) -> None:
+        self.put_many([(key, evaluation)])
+
+    def put_many(self, items: List[Tuple[CacheKey, dict]]) -> None:
+        self.backend.put_many(items)
+        with self.__lock:
+            for key, evaluation in items:
+                self.__insert(key, dict(evaluation))
+                # Read the bug again on its next lookup, as other processes evaluating
+                # it may have written evaluations since it was read
+                self.__prefetched.discard((key[0], key[1]))
+
+    def get_all(self, benchmark: str, bid: str) -> Dict[str, dict]:
+        return self.backend.get_all(benchmark, bid)
+
+    def items(self) -> Iterator[Tuple[CacheKey, dict]]:
+        return self.backend.items()
+
+    def get_statistics(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.__entries),
+            }
+
+
+# Name of the database of the SQLite backend, under the cache directory
+SQLITE_CACHE_FILE = "evaluations.sqlite3"
+
+# Backends are shared per path so that connections are reused across strategies
+_CACHE_BACKENDS: Dict[Tuple[str, Path], LRUCacheBackend] = {}
+_CACHE_BACKENDS_LOCK = threading.Lock()
+
+
+def get_cache_backend(
+    cache_path: str, backend: Optional[str] = None
+) -> LRUCacheBackend:
+    """
+    Returns the cache backend for the given cache directory, behind an in-memory LRU.
+
+    Args:
+        cache_path (str): The cache directory
+        backend (str): "directory", "sqlite", or None to use the SQLite database if it exists
+    """
+    if backend is None:
+        backend = (
+            "sqlite" if Path(cache_path, SQLITE_CACHE_FILE).exists() else "directory"
+        )
+
+    key = (backend, Path(cache_path).absolute())
+    with _CACHE_BACKENDS_LOCK:
+        if key not in _CACHE_BACKENDS:
+            if backend == "directory":
+                _CACHE_BACKENDS[key] = LRUCacheBackend(
+                    DirectoryCacheBackend(cache_path)
+                )
+            elif backend == "sqlite":
+                _CACHE_BACKENDS[key] = LRUCacheBackend(
+                    SQLiteCacheBackend(str(Path(cache_path, SQLITE_CACHE_FILE)))
+                )
+            else:
+                raise ValueError(f"Unknown cache backend {backend}")
+        return _CACHE_BACKENDS[key]
+
+
+def get_cache_statistics() -> Dict[str, int]:
+    """
+    Returns the number of hits, misses and entries in memory of all cache backends.
+    """
+    statistics = {"hits": 0, "misses": 0, "entries": 0}
+    with _CACHE_BACKENDS_LOCK:
+        backends = list(_CACHE_BACKENDS.values())
+    for backend in backends:
+        for key, value in backend.get_statistics().items():
+            statistics[key] += value
+    return statistics
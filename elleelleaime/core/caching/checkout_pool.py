@@ -0,0 +1,172 @@
+import os
+import atexit
+import shutil
+import getpass
+import logging
+import tempfile
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from uuid import uuid4
+
+from elleelleaime.core.benchmarks.bug import Bug
+from elleelleaime.core.caching.checkout_store import CheckoutStore
+
+
+class WorkingCopy:
+    """
+    A checked-out bug that can be reused across evaluations.
+
+    Files modified through `write_file` are restored to their pristine content
+    (kept in memory) by `reset`, so that the working copy can be handed out again
+    without checking out the bug from scratch.
+    """
+
+    def __init__(self, bug: Bug, path: str, fixed: bool = False):
+        self.bug = bug
+        self.path = path
+        self.fixed = fixed
+        self.__pristine: Dict[str, bytes] = {}
+
+    def get_path(self) -> str:
+        return self.path
+
+    def read_file(self, relative_path: str, encoding: str = "ISO-8859-1") -> str:
+        with open(os.path.join(self.path, relative_path), "r", encoding=encoding) as f:
+            return f.read()
+
+    def write_file(
+        self, relative_path: str, content: str, encoding: str = "ISO-8859-1"
+    ) -> None:
+        file_path = os.path.join(self.path, relative_path)
+        # Keep the pristine content of the file the first time it is modified
+        if relative_path not in self.__pristine:
+            with open(file_path, "rb") as f:
+                self.__pristine[relative_path] = f.read()
+        with open(file_path, "w", encoding=encoding, errors="replace") as f:
+            f.write(content)
+
+    def reset(self) -> None:
+        """
+        Restores all modified files to their pristine content.
+        """
+        for relative_path, content in self.__pristine.items():
+            with open(os.path.join(self.path, relative_path), "wb") as f:
+                f.write(content)
+        self.__pristine.clear()
+
+    def remove(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class CheckoutPool:
+    """
+    Pool of working copies of bugs.
+
+    Working copies are checked out once and then reused: acquiring a working copy
+    returns an idle one for the same bug if available, and releasing it restores the
+    modified files instead of deleting the checkout. At most `max_idle` idle working
+    copies are kept, the least recently used ones being removed first.
+
+    If a checkout store is given, new working copies are cloned from its pristine
+    trees instead of being checked out with `Bug.checkout`.
+    """
+
+    def __init__(self, max_idle: int = 16, store: Optional[CheckoutStore] = None):
+        self.max_idle = max_idle
+        self.store = store
+        self.__idle: OrderedDict[str, List[WorkingCopy]] = OrderedDict()
+        self.__n_idle = 0
+        self.__lock = threading.Lock()
+        atexit.register(self.clear)
+
+    def __key(self, bug: Bug, fixed: bool) -> str:
+        return f"{bug.benchmark.get_identifier()}/{bug.get_identifier()}/{'fixed' if fixed else 'buggy'}"
+
+    def __new_path(self, bug: Bug) -> str:
+        return os.path.join(
+            tempfile.gettempdir(),
+            f"elleelleaime-{getpass.getuser()}",
+            bug.get_identifier(),
+            str(uuid4()),
+        )
+
+    def acquire(self, bug: Bug, fixed: bool = False) -> WorkingCopy:
+        """
+        Returns a working copy of the bug, checking it out only if no idle one exists.
+        """
+        key = self.__key(bug, fixed)
+        with self.__lock:
+            while key in self.__idle:
+                working_copy = self.__idle[key].pop()
+                if len(self.__idle[key]) == 0:
+                    del self.__idle[key]
+                self.__n_idle -= 1
+                # Idle copies can be removed by someone else (e.g. a temporary directory
+                # cleaner), in which case they are dropped
+                if os.path.isdir(working_copy.get_path()):
+                    return working_copy
+
+        working_copy = WorkingCopy(bug, self.__new_path(bug), fixed)
+        try:
+            if self.store is not None:
+                self.store.checkout(bug, working_copy.get_path(), fixed=fixed)
+            else:
+                bug.checkout(working_copy.get_path(), fixed=fixed)
+        except Exception:
+            working_copy.remove()
+            raise
+        return working_copy
+
+    def release(self, working_copy: WorkingCopy) -> None:
+        """
+        Restores the working copy and makes it available to later `acquire` calls.
+        """
+        try:
+            working_copy.reset()
+        except Exception as e:
+            logging.warning(
+                f"Could not reset working copy {working_copy.get_path()}, removing it: {e}"
+            )
+            working_copy.remove()
+            return
+
+        key = self.__key(working_copy.bug, working_copy.fixed)
+        evicted: List[WorkingCopy] = []
+        with self.__lock:
+            self.__idle.setdefault(key, []).append(working_copy)
+            self.__idle.move_to_end(key)
+            self.__n_idle += 1
+            while self.__n_idle > self.max_idle:
+                oldest_key, oldest = next(iter(self.__idle.items()))
+                evicted.append(oldest.pop(0))
+                if len(oldest) == 0:
+                    del self.__idle[oldest_key]
+                self.__n_idle -= 1
+
+        for evicted_copy in evicted:
+            evicted_copy.remove()
+
+    @contextmanager
+    def checkout(self, bug: Bug, fixed: bool = False) -> Iterator[WorkingCopy]:
+        """
+        Context manager that acquires a working copy and releases it on exit.
+        """
+        working_copy = self.acquire(bug, fixed)
+        try:
+            yield working_copy
+        finally:
+            self.release(working_copy)
+
+    def clear(self) -> None:
+        """
+        Removes all idle working copies.
+        """
+        with self.__lock:
+            idle = [wc for copies in self.__idle.values() for wc in copies]
+            self.__idle.clear()
+            self.__n_idle = 0
+        for working_copy in idle:
+            working_copy.remove()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import logging
+import threading
+import subprocess
+
+from pathlib import Path
+from typing import Dict, Optional
+from uuid import uuid4
+
+from elleelleaime.core.benchmarks.bug import Bug
+
+
+class CheckoutStore:
+    """
+    Local store of pristine checkouts.
+
+    The store holds at most one buggy and one fixed tree per bug, addressed by
+    benchmark identifier, bug identifier and version. Trees are materialized with
+    `Bug.checkout` the first time they are requested, and new working copies are
+    then produced by cloning them (`cp --reflink=auto`, i.e. copy-on-write on
+    filesystems that support it, and a plain copy otherwise).
+    """
+
+    def __init__(self, store_path: str):
+        self.store_path = Path(store_path).absolute()
+        self.__locks: Dict[Path, threading.Lock] = {}
+        self.__locks_lock = threading.Lock()
+
+    def __lock(self, path: Path) -> threading.Lock:
+        with self.__locks_lock:
+            return self.__locks.setdefault(path, threading.Lock())
+
+    def get_pristine_path(self, bug: Bug, fixed: bool = False) -> Path:
+        """
+        Returns the path of the pristine tree of the bug, materializing it if needed.
+        """
+        pristine_path = Path(
+            self.store_path,
+            bug.benchmark.get_identifier(),
+            bug.get_identifier(),
+            "fixed" if fixed else "buggy",
+        )
+        if pristine_path.exists():
+            return pristine_path
+
+        with self.__lock(pristine_path):
+            if pristine_path.exists():
+                return pristine_path
+
+            # Never let the store end up in a git repository (e.g. the cache submodule)
+            if not self.store_path.exists():
+                self.store_path.mkdir(parents=True, exist_ok=True)
+                with open(Path(self.store_path, ".gitignore"), "w") as f:
+                    f.write("*\n")
+
+            # Checkout to a temporary directory and move it in place atomically,
+            # so that concurrent processes never see a partial tree
+            tmp_path = Path(pristine_path.parent, f".{pristine_path.name}-{uuid4()}")
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                bug.checkout(str(tmp_path), fixed=fixed)
+                os.rename(tmp_path, pristine_path)
+            except OSError:
+                # Another process materialized the tree first
+                if not pristine_path.exists():
+                    raise
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+        return pristine_path
+
+    def checkout(self, bug: Bug, path: str, fixed: bool = False) -> bool:
+        """
+        Clones the pristine tree of the bug to the given path.
+        """
+        pristine_path = self.get_pristine_path(bug, fixed)
+
+        # Remove the directory if it exists
+        shutil.rmtree(path, ignore_errors=True)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        run = subprocess.run(
+            f'cp -a --reflink=auto "{pristine_path}" "{path}"',
+            shell=True,
+            capture_output=True,
+        )
+        if run.returncode != 0:
+            # cp might not support --reflink (e.g. on macOS)
+            logging.debug(
+                f"Falling back to a full copy of {pristine_path}: {run.stderr.decode('utf-8')}"
+            )
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.copytree(pristine_path, path, symlinks=True)
+
+        return True
+
+    def clear(self, bug: Optional[Bug] = None) -> None:
+        """
+        Removes the pristine trees of the given bug, or of all bugs.
+        """
+        if bug is None:
+            shutil.rmtree(self.store_path, ignore_errors=True)
+        else:
+            shutil.rmtree(
+                Path(
+                    self.store_path,
+                    bug.benchmark.get_identifier(),
+                    bug.get_identifier(),
+                ),
+                ignore_errors=True,
+            )
+
+
+DEFAULT_CHECKOUT_STORE_PATH = (
+    Path(__file__).parent.parent.parent.parent / "cache" / "checkouts"
+)
+
+# Stores are shared per path so that concurrent materializations are serialized
+_CHECKOUT_STORES: Dict[Path, CheckoutStore] = {}
+_CHECKOUT_STORES_LOCK = threading.Lock()
+
+
+def get_checkout_store(store_path: Optional[str] = None) -> CheckoutStore:
+    """
+    Returns the checkout store at the given path (by default, under the cache directory).
+    """
+    path = Path(store_path or DEFAULT_CHECKOUT_STORE_PATH).absolute()
+    with _CHECKOUT_STORES_LOCK:
+        if path not in _CHECKOUT_STORES:
+            _CHECKOUT_STORES[path] = CheckoutStore(str(path))
+        return _CHECKOUT_STORES[path]
@@ -0,0 +1,220 @@
+from pathlib import Path
+from queue import Queue, Empty
+from typing import List, Optional, Tuple
+
+import os
+import json
+import shlex
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+
+
+class JarServer:
+    """
+    Client of a long-lived JVM running `JarServer.java`, which keeps the main class of
+    a jar loaded and runs it on each request, avoiding the container and JVM startup
+    of a one-shot `docker run ... java -jar` call.
+
+    The server only sees the working directory and the temporary directory, which is
+    where checkouts and temporary files are created.
+    """
+
+    SERVER_SOURCE_DIR = Path(__file__).parent / "server"
+
+    def __init__(self, jar: str):
+        self.jar = jar
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        tmp = tempfile.gettempdir()
+        self.process = subprocess.Popen(
+            f'docker run -i --rm --volume ".:/elleelleaime" --volume "{tmp}:{tmp}" --volume "{self.SERVER_SOURCE_DIR}:/jarserver" --workdir "/elleelleaime"'
+            + f" openjdk:11 java /jarserver/JarServer.java {self.jar}",
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+        )
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, args: List[str]) -> Optional[Tuple[int, str]]:
+        """
+        Runs the main class of the jar with the given arguments.
+        Returns a tuple of the form (returncode, stdout), or None if the server is not running.
+        """
+        if not self.is_alive():
+            return None
+        assert self.process is not None and self.process.stdin and self.process.stdout
+
+        try:
+            self.process.stdin.write(json.dumps(args) + "\n")
+            self.process.stdin.flush()
+            while True:
+                line = self.process.stdout.readline()
+                if line == "":
+                    # The server died
+                    return None
+                # Skip anything the jar wrote directly to the process' stdout
+                if line.startswith('{"returncode": '):
+                    response = json.loads(line)
+                    return response["returncode"], response["stdout"]
+        except (OSError, ValueError) as e:
+            logging.warning(f"Jar server for {self.jar} failed: {e}")
+            self.stop()
+            return None
+
+    def stop(self) -> None:
+        if self.process is not None:
+            try:
+                if self.process.stdin:
+                    self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+            self.process = None
+
+
+class JarServerPool:
+    """
+    Pool of servers for the same jar. Each server handles one request at a time.
+    """
+
+    def __init__(self, jar: str, size: int):
+        self.jar = jar
+        self.servers: List[JarServer] = [JarServer(jar) for _ in range(size)]
+        self.idle: Queue[JarServer] = Queue()
+        for server in self.servers:
+            server.start()
+            self.idle.put(server)
+
+    def run(self, args: List[str]) -> Optional[Tuple[int, str]]:
+        """
+        Runs the jar on an idle server. Returns None if no server is running.
+        """
+        while any(server.is_alive() for server in self.servers):
+            try:
+                server = self.idle.get(timeout=1)
+            except Empty:
+                continue
+            result = server.run(args)
+            # Dead servers are not handed out again
+            if server.is_alive():
+                self.idle.put(server)
+            if result is not None:
+                return result
+        return None
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.stop()
+
+
+# Number of JVMs kept warm per jar. If 0, each call runs a one-shot container.
+JAR_SERVERS = int(os.getenv("ELLEELLEAIME_JAR_SERVERS", "0"))
+
+_POOLS: dict[str, JarServerPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(jar: str) -> Optional[JarServerPool]:
+    if JAR_SERVERS <= 0:
+        return None
+    with _POOLS_LOCK:
+        if jar not in _POOLS:
+            _POOLS[jar] = JarServerPool(jar, JAR_SERVERS)
+            atexit.register(_POOLS[jar].stop)
+        return _POOLS[jar]
+
+
+def run_jar(
+    jar: str, args: List[str], paths: List[Path]
+) -> subprocess.CompletedProcess:
+    """
+    Runs the given jar from the working directory with the given arguments.
+
+    The call is served by a warm jar server if servers are enabled (see `ELLEELLEAIME_JAR_SERVERS`)
+    and all the given paths are under the temporary directory. Otherwise, or if the servers
+    are not running, it falls back to a one-shot container mounting the parent of each path.
+
+    Args:
+        jar (str): The jar to run, relative to the working directory
+        args (List[str]): The arguments of the jar
+        paths (List[Path]): The files the jar needs to access
+    """
+    tmp = Path(tempfile.gettempdir()).absolute()
+    if all(tmp in path.absolute().parents for path in paths):
+        pool = _get_pool(jar)
+        if pool is not None:
+            result = pool.run(args)
+            if result is not None:
+                returncode, stdout = result
+                return subprocess.CompletedProcess(
+                    args, returncode, stdout.encode("utf-8"), b""
+                )
+            logging.warning(f"Jar server for {jar} is not running, falling back")
+
+    volumes = " ".join(
+        {
+            f'--volume "{path.parent.absolute()}:{path.parent.absolute()}"'
+            for path in paths
+        }
+    )
+    quoted_args = " ".join(shlex.quote(arg) for arg in args)
+    return subprocess.run(
+        f'docker run --rm --volume ".:/elleelleaime" {volumes} --workdir "/elleelleaime"'
+        + f" openjdk:11 java -jar {jar} {quoted_args}",
+        shell=True,
+        capture_output=True,
+    )
+
+
+def run_jar_many(
+    jar: str, args_list: List[List[str]], paths: List[Path]
+) -> List[subprocess.CompletedProcess]:
+    """
+    Runs the given jar once for each list of arguments, in a single JVM.
+
+    If jar servers are enabled (see `ELLEELLEAIME_JAR_SERVERS`), the calls are served by
+    them. Otherwise, a jar server is started just for these calls and stopped once they
+    are done, so that the container and the JVM are only started once per batch. Single
+    calls, and calls on files outside the temporary directory, run as one-shot
+    containers.
+
+    Args:
+        jar (str): The jar to run, relative to the working directory
+        args_list (List[List[str]]): The arguments of each call
+        paths (List[Path]): The files the jar needs to access in any of the calls
+    """
+    tmp = Path(tempfile.gettempdir()).absolute()
+    if (
+        len(args_list) <= 1
+        or JAR_SERVERS > 0
+        or not all(tmp in path.absolute().parents for path in paths)
+    ):
+        return [run_jar(jar, args, paths) for args in args_list]
+
+    server = JarServer(jar)
+    server.start()
+    try:
+        results = []
+        for args in args_list:
+            result = server.run(args)
+            if result is None:
+                results.append(run_jar(jar, args, paths))
+            else:
+                returncode, stdout = result
+                results.append(
+                    subprocess.CompletedProcess(
+                        args, returncode, stdout.encode("utf-8"), b""
+                    )
+                )
+        return results
+    finally:
+        server.stop()
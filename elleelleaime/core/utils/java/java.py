@@ -8,6 +8,8 @@ import subprocess
 import re
 
 from elleelleaime.core.benchmarks.bug import Bug, RichBug
+from elleelleaime.core.caching.checkout_store import CheckoutStore
+from elleelleaime.core.utils.java.jar_server import run_jar
 
 
 def compute_diff(
@@ -140,39 +142,120 @@ def get_modified_target_lines(diff: PatchSet) -> List[int]:
     return added_lines if len(added_lines) > 0 else context_lines
 
 
-def extract_single_function(bug: Bug) -> Optional[Tuple[str, str]]:
+def checkout_bug(
+    bug: Bug, path: str, fixed: bool = False, store: Optional[CheckoutStore] = None
+) -> bool:
     """
-    Extracts the buggy and fixed code of single-function bugs.
-    Returns None is bug is not single-function
+    Checks out the bug to the given path, cloning it from the checkout store if one is given.
+    """
+    if store is not None:
+        return store.checkout(bug, path, fixed=fixed)
+    return bug.checkout(path, fixed=fixed)
 
-    Args:
-        bug (Bug): THe bug to extract the code from
 
-    Returns:
-        Optional[Tuple[str, str]]: None if the bug is not single-function, otherwise a tuple of the form (buggy_code, fixed_code)
+def run_extractor(file_path: Path, args: List[str]) -> subprocess.CompletedProcess:
     """
-    buggy_path = Path(
-        tempfile.gettempdir(),
-        f"elleelleaime-{getpass.getuser()}",
-        bug.get_identifier(),
-        str(uuid4()),
-    )
-    fixed_path = Path(
-        tempfile.gettempdir(),
-        f"elleelleaime-{getpass.getuser()}",
-        bug.get_identifier(),
-        str(uuid4()),
+    Runs the code extractor on the given Java file.
+    """
+    return run_jar(
+        "extractor.jar", ["-i", str(file_path.absolute())] + args, [file_path]
     )
 
-    try:
+
+def find_test_class(path: Path, bug, class_name: str) -> Optional[Path]:
+    # Get the base test directory
+    base_test_dir = Path(path, bug.get_src_test_dir(str(path)))
+
+    return _find_test_class(list(base_test_dir.rglob("*.java")), class_name)
+
+
+def _find_test_class(java_files: List[Path], class_name: str) -> Optional[Path]:
+    # Convert class name to the relative path format
+    class_relative_path = f"{class_name.replace('.', '/')}.java"
+
+    # Iterate through all the java files under the base test directory
+    candidates = []
+    for java_file in java_files:
+        # Check if the file ends with the class relative path
+        if java_file.as_posix().endswith(class_relative_path):
+            candidates.append(
+                java_file
+            )  # Return the full path to the matched Java file
+
+    if len(candidates) == 0:
+        logging.error(f"No test class found for {class_name}")
+        return None
+    elif len(candidates) == 1:
+        return candidates[0]
+    else:
+        logging.error(f"Multiple test classes found for {class_name}")
+        return None
+
+
+class ExtractionSession:
+    """
+    Serves all the code extraction of a bug from a single checkout of each version.
+
+    The buggy and fixed versions are checked out lazily, the first time they are needed,
+    and removed when the session is closed. The list of test files is also computed once,
+    so that looking up the class of each failing test does not walk the tree again.
+
+    Usage:
+        with ExtractionSession(bug) as session:
+            buggy_and_fixed_code = session.extract_single_function()
+            failing_test_cases = session.extract_failing_test_cases()
+    """
+
+    def __init__(self, bug: Bug, store: Optional[CheckoutStore] = None):
+        self.bug = bug
+        self.store = store
+        self.__paths: dict[bool, Path] = {}
+        self.__test_files: Optional[List[Path]] = None
+
+    def __enter__(self) -> "ExtractionSession":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Remove the checked-out bugs
+        for path in self.__paths.values():
+            shutil.rmtree(path, ignore_errors=True)
+        self.__paths.clear()
+        self.__test_files = None
+
+    def get_path(self, fixed: bool = False) -> Path:
+        """
+        Returns the path of the checkout of the given version, checking it out if needed.
+        """
+        if fixed not in self.__paths:
+            path = Path(
+                tempfile.gettempdir(),
+                f"elleelleaime-{getpass.getuser()}",
+                self.bug.get_identifier(),
+                str(uuid4()),
+            )
+            self.__paths[fixed] = path
+            checkout_bug(self.bug, str(path), fixed=fixed, store=self.store)
+        return self.__paths[fixed]
+
+    def extract_single_function(self) -> Optional[Tuple[str, str]]:
+        """
+        Extracts the buggy and fixed code of single-function bugs.
+        Returns None is bug is not single-function
+
+        Returns:
+            Optional[Tuple[str, str]]: None if the bug is not single-function, otherwise a tuple of the form (buggy_code, fixed_code)
+        """
         # Checkout the buggy and fixed versions of the bug
-        bug.checkout(str(buggy_path), fixed=False)
-        bug.checkout(str(fixed_path), fixed=True)
+        buggy_path = self.get_path(fixed=False)
+        fixed_path = self.get_path(fixed=True)
 
         # Note: this diff is inverted, i.e. the target file is the buggy file
-        diff = PatchSet(bug.get_ground_truth())
+        diff = PatchSet(self.bug.get_ground_truth())
 
-        if bug.is_ground_truth_inverted():
+        if self.bug.is_ground_truth_inverted():
             buggy_file_path = Path(buggy_path, get_target_filename(diff))
             modified_buggy_lines = get_modified_target_lines(diff)
             fixed_file_path = Path(fixed_path, get_source_filename(diff))
@@ -184,26 +267,20 @@ def extract_single_function(bug: Bug) -> Optional[Tuple[str, str]]:
             modified_fixed_lines = get_modified_target_lines(diff)
 
         # Run code extractor for the buggy function
-        lines_args = " ".join([f"--lines {line}" for line in modified_buggy_lines])
-        run = subprocess.run(
-            f'docker run --rm --volume ".:/elleelleaime" --volume "{buggy_file_path.parent.absolute()}:{buggy_file_path.parent.absolute()}" --workdir "/elleelleaime"'
-            + f" openjdk:11 java -jar extractor.jar -i {buggy_file_path.absolute()} {lines_args}",
-            shell=True,
-            capture_output=True,
-        )
+        lines_args = [
+            arg for line in modified_buggy_lines for arg in ["--lines", str(line)]
+        ]
+        run = run_extractor(buggy_file_path, lines_args)
         if run.returncode != 0:
             buggy_code = ""
         else:
             buggy_code = run.stdout.decode("utf-8")
 
         # Run code extractor for the fixed function
-        lines_args = " ".join([f"--lines {line}" for line in modified_fixed_lines])
-        run = subprocess.run(
-            f'docker run --rm --volume ".:/elleelleaime" --volume "{fixed_file_path.parent.absolute()}:{fixed_file_path.parent.absolute()}" --workdir "/elleelleaime"'
-            + f" openjdk:11 java -jar extractor.jar -i {fixed_file_path.absolute()} {lines_args}",
-            shell=True,
-            capture_output=True,
-        )
+        lines_args = [
+            arg for line in modified_fixed_lines for arg in ["--lines", str(line)]
+        ]
+        run = run_extractor(fixed_file_path, lines_args)
         if run.returncode != 0:
             fixed_code = ""
         else:
@@ -216,17 +293,17 @@ def extract_single_function(bug: Bug) -> Optional[Tuple[str, str]]:
         # If on of these works we assume it as correct (since the diff is now equivalent to the original one)
         fdiff = compute_diff(buggy_code, fixed_code)
         if not assert_same_diff(
-            diff, fdiff, original_inverted=bug.is_ground_truth_inverted()
+            diff, fdiff, original_inverted=self.bug.is_ground_truth_inverted()
         ):
             fdiff = compute_diff(buggy_code, "")
             if assert_same_diff(
-                diff, fdiff, original_inverted=bug.is_ground_truth_inverted()
+                diff, fdiff, original_inverted=self.bug.is_ground_truth_inverted()
             ):
                 fixed_code = ""
             else:
                 fdiff = compute_diff("", fixed_code)
                 if assert_same_diff(
-                    diff, fdiff, original_inverted=bug.is_ground_truth_inverted()
+                    diff, fdiff, original_inverted=self.bug.is_ground_truth_inverted()
                 ):
                     buggy_code = ""
                 else:
@@ -234,81 +311,77 @@ def extract_single_function(bug: Bug) -> Optional[Tuple[str, str]]:
 
         return buggy_code, fixed_code
 
-    finally:
-        # Remove the checked-out bugs
-        shutil.rmtree(buggy_path, ignore_errors=True)
-        shutil.rmtree(fixed_path, ignore_errors=True)
+    def find_test_class(self, class_name: str) -> Optional[Path]:
+        """
+        Finds the file of the given test class in the buggy version of the bug.
+        """
+        if self.__test_files is None:
+            path = self.get_path(fixed=False)
+            base_test_dir = Path(path, self.bug.get_src_test_dir(str(path)))
+            self.__test_files = list(base_test_dir.rglob("*.java"))
 
+        return _find_test_class(self.__test_files, class_name)
 
-def find_test_class(path: Path, bug, class_name: str) -> Optional[Path]:
-    # Get the base test directory
-    base_test_dir = Path(path, bug.get_src_test_dir(str(path)))
+    def extract_failing_test_cases(self) -> dict[str, str]:
+        """
+        Extracts the code of the failing test cases of a bug.
 
-    # Convert class name to the relative path format
-    class_relative_path = f"{class_name.replace('.', '/')}.java"
+        Returns:
+            dict[str, str]: A dictionary mapping failing test cases to their code
+        """
+        failing_test_cases = {}
+        failing_tests = self.bug.get_failing_tests()
 
-    # Iterate through all the subdirectories under the base test directory
-    candidates = []
-    for java_file in base_test_dir.rglob("*.java"):
-        # Check if the file ends with the class relative path
-        if java_file.as_posix().endswith(class_relative_path):
-            candidates.append(
-                java_file
-            )  # Return the full path to the matched Java file
+        for failing_test in failing_tests:
+            class_name, method_name = failing_test.split("::")
 
-    if len(candidates) == 0:
-        logging.error(f"No test class found for {class_name}")
-        return None
-    elif len(candidates) == 1:
-        return candidates[0]
-    else:
-        logging.error(f"Multiple test classes found for {class_name}")
-        return None
+            test_class_path = self.find_test_class(class_name)
+            if test_class_path is None:
+                return {}
 
+            # Run code extractor for the failing test case
+            run = run_extractor(test_class_path, ["--method", method_name])
+            if run.returncode == 0:
+                failing_test_cases[failing_test] = run.stdout.decode("utf-8")
+            else:
+                return {}
+
+        return failing_test_cases
 
-def extract_failing_test_cases(bug: RichBug) -> dict[str, str]:
+
+def extract_single_function(
+    bug: Bug, store: Optional[CheckoutStore] = None
+) -> Optional[Tuple[str, str]]:
     """
-    Extracts the code of the failing test cases of a bug.
+    Extracts the buggy and fixed code of single-function bugs.
+    Returns None is bug is not single-function
 
     Args:
-        bug (Bug): The bug to extract the failing test cases from
+        bug (Bug): THe bug to extract the code from
+        store (Optional[CheckoutStore]): The checkout store to clone the bug from
 
     Returns:
-        dict[str, str]: A dictionary mapping failing test cases to their code
+        Optional[Tuple[str, str]]: None if the bug is not single-function, otherwise a tuple of the form (buggy_code, fixed_code)
     """
-    failing_test_cases = {}
-    failing_tests = bug.get_failing_tests()
+    with ExtractionSession(bug, store=store) as session:
+        return session.extract_single_function()
 
-    for failing_test in failing_tests:
-        class_name, method_name = failing_test.split("::")
 
-        path = Path(
-            tempfile.gettempdir(),
-            f"elleelleaime-{getpass.getuser()}",
-            bug.get_identifier(),
-            str(uuid4()),
-        )
-        try:
-            bug.checkout(str(path), fixed=False)
-            test_class_path = find_test_class(path, bug, class_name)
-            if test_class_path is None:
-                return {}
+def extract_failing_test_cases(
+    bug: RichBug, store: Optional[CheckoutStore] = None
+) -> dict[str, str]:
+    """
+    Extracts the code of the failing test cases of a bug.
 
-            # Run code extractor for the failing test case
-            run = subprocess.run(
-                f'docker run --rm --volume ".:/elleelleaime" --volume "{test_class_path.parent.absolute()}:{test_class_path.parent.absolute()}" --workdir "/elleelleaime"'
-                + f" openjdk:11 java -jar extractor.jar -i {test_class_path.absolute()} --method {method_name}",
-                shell=True,
-                capture_output=True,
-            )
-            if run.returncode == 0:
-                failing_test_cases[failing_test] = run.stdout.decode("utf-8")
-            else:
-                return {}
-        finally:
-            shutil.rmtree(path, ignore_errors=True)
+    Args:
+        bug (Bug): The bug to extract the failing test cases from
+        store (Optional[CheckoutStore]): The checkout store to clone the bug from
 
-    return failing_test_cases
+    Returns:
+        dict[str, str]: A dictionary mapping failing test cases to their code
+    """
+    with ExtractionSession(bug, store=store) as session:
+        return session.extract_failing_test_cases()
 
 
 def remove_java_comments(source: str) -> Optional[str]:
@@ -391,3 +464,16 @@ def remove_java_comments(source: str) -> Optional[str]:
 def remove_empty_lines(source):
     """Remove all empty lines from Java source code."""
     return re.sub(r"^\s*$\n", "", source, flags=re.MULTILINE)
+
+
+def normalize_java_code(source: str) -> str:
+    """
+    Normalizes Java code by removing comments, empty lines, and the leading and trailing
+    whitespace of each line. Code with the same normalized form has the same behaviour.
+    """
+    source_no_comments = remove_java_comments(source)
+    if source_no_comments is None:
+        source_no_comments = source
+    return "\n".join(
+        line.strip() for line in remove_empty_lines(source_no_comments).splitlines()
+    )
@@ -0,0 +1,154 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.jar.JarFile;
+
+/**
+ * Keeps a JVM warm to run the main class of a jar many times.
+ *
+ * Usage: java JarServer.java <jar>
+ *
+ * Each request is a line holding a JSON array with the arguments of the main method.
+ * Each response is a line holding a JSON object of the form {"returncode": int, "stdout": string}.
+ * Calls to System.exit are intercepted and reported as the return code.
+ */
+public class JarServer {
+
+    static class ExitException extends SecurityException {
+        final int status;
+
+        ExitException(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        File jar = new File(args[0]);
+        String mainClassName;
+        try (JarFile jarFile = new JarFile(jar)) {
+            mainClassName = jarFile.getManifest().getMainAttributes().getValue("Main-Class");
+        }
+        URLClassLoader loader = new URLClassLoader(
+                new URL[] {jar.toURI().toURL()}, JarServer.class.getClassLoader());
+        Thread.currentThread().setContextClassLoader(loader);
+        Method main = Class.forName(mainClassName, true, loader).getMethod("main", String[].class);
+
+        System.setSecurityManager(new SecurityManager() {
+            @Override
+            public void checkPermission(Permission perm) {}
+
+            @Override
+            public void checkPermission(Permission perm, Object context) {}
+
+            @Override
+            public void checkExit(int status) {
+                throw new ExitException(status);
+            }
+        });
+
+        PrintStream protocol = System.out;
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isBlank()) {
+                continue;
+            }
+
+            ByteArrayOutputStream stdout = new ByteArrayOutputStream();
+            int returncode = 0;
+            System.setOut(new PrintStream(stdout, true, StandardCharsets.UTF_8));
+            try {
+                main.invoke(null, (Object) parseArguments(line));
+            } catch (InvocationTargetException e) {
+                if (e.getCause() instanceof ExitException) {
+                    returncode = ((ExitException) e.getCause()).status;
+                } else {
+                    e.getCause().printStackTrace();
+                    returncode = 1;
+                }
+            } catch (Exception e) {
+                e.printStackTrace();
+                returncode = 1;
+            } finally {
+                System.out.flush();
+                System.setOut(protocol);
+            }
+
+            protocol.println("{\"returncode\": " + returncode + ", \"stdout\": "
+                    + quote(stdout.toString(StandardCharsets.UTF_8)) + "}");
+            protocol.flush();
+        }
+    }
+
+    /** Parses a JSON array of strings. */
+    static String[] parseArguments(String json) {
+        List<String> arguments = new ArrayList<>();
+        int i = json.indexOf('[') + 1;
+        while (i < json.length()) {
+            char c = json.charAt(i);
+            if (c == '"') {
+                StringBuilder argument = new StringBuilder();
+                i++;
+                while (json.charAt(i) != '"') {
+                    c = json.charAt(i);
+                    if (c == '\\') {
+                        char escaped = json.charAt(++i);
+                        switch (escaped) {
+                            case 'b': argument.append('\b'); break;
+                            case 'f': argument.append('\f'); break;
+                            case 'n': argument.append('\n'); break;
+                            case 'r': argument.append('\r'); break;
+                            case 't': argument.append('\t'); break;
+                            case 'u':
+                                argument.append((char) Integer.parseInt(json.substring(i + 1, i + 5), 16));
+                                i += 4;
+                                break;
+                            default: argument.append(escaped);
+                        }
+                    } else {
+                        argument.append(c);
+                    }
+                    i++;
+                }
+                arguments.add(argument.toString());
+            } else if (c == ']') {
+                break;
+            }
+            i++;
+        }
+        return arguments.toArray(new String[0]);
+    }
+
+    /** Quotes a string as a JSON string. */
+    static String quote(String s) {
+        StringBuilder quoted = new StringBuilder("\"");
+        for (int i = 0; i < s.length(); i++) {
+            char c = s.charAt(i);
+            switch (c) {
+                case '"': quoted.append("\\\""); break;
+                case '\\': quoted.append("\\\\"); break;
+                case '\n': quoted.append("\\n"); break;
+                case '\r': quoted.append("\\r"); break;
+                case '\t': quoted.append("\\t"); break;
+                default:
+                    if (c < 0x20) {
+                        quoted.append(String.format("\\u%04x", (int) c));
+                    } else {
+                        quoted.append(c);
+                    }
+            }
+        }
+        return quoted.append('"').toString();
+    }
+}
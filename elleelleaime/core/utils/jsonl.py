@@ -1,7 +1,8 @@
-from typing import Iterable, Dict
+from typing import Iterable, Dict, List
 import gzip
 import json
 import os
+import logging
 
 """
 Code from HumanEval:
@@ -44,3 +45,22 @@ def write_jsonl(filename: str, data: Iterable[Dict], append: bool = False):
         with open(filename, mode) as fp:
             for x in data:
                 fp.write((json.dumps(x) + "\n").encode("utf-8"))
+
+
+def recover_jsonl(filename: str) -> List[Dict]:
+    """
+    Reads a jsonl file that is appended to incrementally, e.g. by a run that might have
+    been interrupted. If the last line was partially written, it is removed from the file.
+    """
+    if not os.path.exists(filename):
+        return []
+
+    data: List[Dict] = []
+    try:
+        for x in stream_jsonl(filename):
+            data.append(x)
+    except (ValueError, EOFError, OSError) as e:
+        logging.warning(f"Removing the partially written line of {filename}: {e}")
+        write_jsonl(filename, data)
+
+    return data
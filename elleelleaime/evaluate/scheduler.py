@@ -0,0 +1,311 @@
+from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.evaluate.strategies.registry import PatchEvaluationStrategyRegistry
+from elleelleaime.evaluate.strategies.text.replace import ReplaceEvaluationStrategy
+from elleelleaime.core.caching.cache_backend import get_cache_statistics
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import queue
+import logging
+import traceback
+import multiprocessing as mp
+
+# A task is a tuple of the form (task index, sample index, bug identifier, sub-sample)
+Task = Tuple[int, int, str, dict]
+
+
+def split_sample(sample: dict, candidates_per_task: int) -> List[dict]:
+    """
+    Splits a sample into sub-samples holding at most `candidates_per_task` of its generations.
+
+    The evaluation of a sample is the concatenation of the evaluations of its sub-samples.
+    Samples whose generation is not a list (e.g. a single response with many choices)
+    are not split.
+    """
+    generation = sample.get("generation")
+    if (
+        not isinstance(generation, list)
+        or candidates_per_task <= 0
+        or len(generation) <= candidates_per_task
+    ):
+        return [sample]
+
+    return [
+        {**sample, "generation": generation[i : i + candidates_per_task]}
+        for i in range(0, len(generation), candidates_per_task)
+    ]
+
+
+def _worker_main(
+    worker_id: int,
+    benchmark: Benchmark,
+    strategy: str,
+    kwargs: dict,
+    inbox: mp.Queue,
+    outbox: mp.Queue,
+) -> None:
+    """
+    Evaluates the tasks sent to the worker until it receives None.
+    The evaluation strategy is instantiated once and reused for all tasks.
+    """
+    # Forked workers inherit the working copies of the parent process, which the parent
+    # and the other workers may still use, so each worker starts with its own pools
+    ReplaceEvaluationStrategy.reset_checkout_pools()
+    evaluation_strategy = PatchEvaluationStrategyRegistry(**kwargs).get_evaluation(
+        strategy
+    )
+    try:
+        while True:
+            task = inbox.get()
+            if task is None:
+                break
+            task_index, _, bug_identifier, sample = task
+            try:
+                bug = benchmark.get_bug(bug_identifier)
+                if bug is None:
+                    raise ValueError(f"Unknown bug {bug_identifier}")
+                evaluation = evaluation_strategy.evaluate(bug, sample)
+                outbox.put(("result", worker_id, task_index, evaluation))
+            except Exception:
+                outbox.put(("error", worker_id, task_index, traceback.format_exc()))
+    finally:
+        timings = {}
+        if isinstance(evaluation_strategy, ReplaceEvaluationStrategy):
+            timings = evaluation_strategy.get_timings()
+            # Worker processes do not run exit handlers, so working copies are removed here
+            evaluation_strategy.checkout_pool.clear()
+        outbox.put(("statistics", worker_id, None, (timings, get_cache_statistics())))
+
+
+class EvaluationScheduler:
+    """
+    Evaluates samples in a pool of worker processes.
+
+    Each worker instantiates the evaluation strategy once. By default, each sample is one
+    task, so that all its candidates are looked up in the cache, de-duplicated and
+    matched together. With `candidates_per_task`, samples are split into tasks of at most
+    that many candidates, to balance the load of samples with many candidates. The tasks
+    of a bug are sent to the worker that owns the bug, so that its working copies and
+    build outputs are reused. A worker that runs out of work takes the tasks of a new
+    bug, or else the remaining tasks of the busiest bug.
+    """
+
+    def __init__(
+        self,
+        benchmark: Benchmark,
+        strategy: str,
+        n_workers: int = 4,
+        candidates_per_task: int = 0,
+        max_pending: int = 2,
+        max_in_flight: int = 64,
+        **kwargs,
+    ):
+        self.benchmark = benchmark
+        self.strategy = strategy
+        self.n_workers = max(1, n_workers)
+        self.candidates_per_task = candidates_per_task
+        self.max_pending = max_pending
+        self.max_in_flight = max(1, max_in_flight)
+        self.kwargs = kwargs
+        self.timings: Dict[str, Tuple[int, float]] = {}
+        self.cache_statistics: Dict[str, int] = {}
+
+    def __next_task(
+        self,
+        worker_id: int,
+        tasks: "OrderedDict[str, Deque[Task]]",
+        owners: Dict[str, int],
+    ) -> Optional[Task]:
+        # Prefer the bugs owned by the worker
+        for bug_identifier, bug_tasks in tasks.items():
+            if owners.get(bug_identifier) == worker_id:
+                return bug_tasks.popleft()
+        # Then take a bug that is not owned by any worker
+        for bug_identifier, bug_tasks in tasks.items():
+            if bug_identifier not in owners:
+                owners[bug_identifier] = worker_id
+                return bug_tasks.popleft()
+        # Otherwise, help with the bug with the most remaining tasks
+        if len(tasks) > 0:
+            bug_identifier = max(tasks, key=lambda bid: len(tasks[bid]))
+            return tasks[bug_identifier].popleft()
+        return None
+
+    def run(
+        self, samples: Iterable[dict]
+    ) -> Iterator[Tuple[dict, Optional[List[Any]]]]:
+        """
+        Evaluates the given samples, which are read lazily.
+
+        Yields tuples of the form (sample, evaluation) in the order of the input samples,
+        as soon as a sample and all the samples before it are evaluated. At most
+        `max_in_flight` samples are read ahead of the last yielded one.
+        """
+        samples_iterator = iter(samples)
+        exhausted = False
+        # Samples read and not yet yielded, and their evaluations once finished
+        in_flight: Dict[int, dict] = {}
+        finished: Dict[int, Optional[List[Any]]] = {}
+        next_sample_index = 0
+        next_yield_index = 0
+
+        tasks: OrderedDict[str, Deque[Task]] = OrderedDict()
+        n_tasks: Dict[int, int] = {}
+        task_samples: Dict[int, int] = {}
+        task_evaluations: Dict[int, Dict[int, Optional[List[Any]]]] = {}
+        next_task_index = 0
+        owners: Dict[str, int] = {}
+        pending: Dict[int, int] = {worker_id: 0 for worker_id in range(self.n_workers)}
+
+        def read_samples() -> None:
+            # Split the samples into tasks, grouped by bug
+            nonlocal exhausted, next_sample_index, next_task_index
+            while not exhausted and len(in_flight) < self.max_in_flight:
+                try:
+                    sample = next(samples_iterator)
+                except StopIteration:
+                    exhausted = True
+                    return
+                sample_index = next_sample_index
+                next_sample_index += 1
+                in_flight[sample_index] = sample
+                if "generation" not in sample or sample["generation"] is None:
+                    finished[sample_index] = None
+                    continue
+                sub_samples = split_sample(sample, self.candidates_per_task)
+                n_tasks[sample_index] = len(sub_samples)
+                task_evaluations[sample_index] = {}
+                for sub_sample in sub_samples:
+                    tasks.setdefault(sample["identifier"], deque()).append(
+                        (
+                            next_task_index,
+                            sample_index,
+                            sample["identifier"],
+                            sub_sample,
+                        )
+                    )
+                    next_task_index += 1
+
+        def dispatch(worker_id: int) -> None:
+            while pending[worker_id] < self.max_pending:
+                task = self.__next_task(worker_id, tasks, owners)
+                if task is None:
+                    return
+                if len(tasks[task[2]]) == 0:
+                    del tasks[task[2]]
+                task_samples[task[0]] = task[1]
+                inboxes[worker_id].put(task)
+                pending[worker_id] += 1
+
+        # Start the workers
+        outbox: mp.Queue = mp.Queue()
+        inboxes: List[mp.Queue] = [mp.Queue() for _ in range(self.n_workers)]
+        workers = [
+            mp.Process(
+                target=_worker_main,
+                args=(
+                    worker_id,
+                    self.benchmark,
+                    self.strategy,
+                    self.kwargs,
+                    inboxes[worker_id],
+                    outbox,
+                ),
+                daemon=True,
+            )
+            for worker_id in range(self.n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                read_samples()
+                for worker_id in range(self.n_workers):
+                    dispatch(worker_id)
+
+                # Yield the finished samples in order
+                while next_yield_index in finished:
+                    evaluation = finished.pop(next_yield_index)
+                    yield in_flight.pop(next_yield_index), evaluation
+                    next_yield_index += 1
+                if exhausted and len(in_flight) == 0:
+                    break
+                if len(task_samples) == 0 and len(tasks) == 0:
+                    # Nothing is being evaluated, read more samples
+                    continue
+
+                try:
+                    kind, worker_id, done_index, payload = outbox.get(timeout=60)
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in workers):
+                        raise RuntimeError("An evaluation worker died unexpectedly")
+                    continue
+                if kind == "error":
+                    raise RuntimeError(
+                        f"Evaluation of task {done_index} failed in worker {worker_id}:\n{payload}"
+                    )
+                if kind != "result":
+                    continue
+                pending[worker_id] -= 1
+
+                # A sample is finished once all its tasks are done, and its evaluation
+                # is the concatenation of the evaluations of its tasks
+                sample_index = task_samples.pop(done_index)
+                sample_evaluations = task_evaluations[sample_index]
+                sample_evaluations[done_index] = payload
+                if len(sample_evaluations) == n_tasks[sample_index]:
+                    del task_evaluations[sample_index]
+                    del n_tasks[sample_index]
+                    evaluation: Optional[List[Any]] = []
+                    for _, task_evaluation in sorted(sample_evaluations.items()):
+                        if task_evaluation is None:
+                            evaluation = None
+                            break
+                        evaluation.extend(task_evaluation)  # type: ignore
+                    finished[sample_index] = evaluation
+
+            # Stop the workers and collect their statistics
+            for inbox in inboxes:
+                inbox.put(None)
+            n_stopped = 0
+            while n_stopped < self.n_workers:
+                kind, _, _, payload = outbox.get()
+                if kind == "statistics":
+                    n_stopped += 1
+                    timings, cache_statistics = payload
+                    for key, value in cache_statistics.items():
+                        self.cache_statistics[key] = (
+                            self.cache_statistics.get(key, 0) + value
+                        )
+                    for stage, (count, total) in timings.items():
+                        previous_count, previous_total = self.timings.get(
+                            stage, (0, 0.0)
+                        )
+                        self.timings[stage] = (
+                            previous_count + count,
+                            previous_total + total,
+                        )
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+    def log_statistics(self) -> None:
+        """
+        Logs the cache hits and misses, and the number of runs and the time spent
+        in each evaluation stage.
+        """
+        if self.cache_statistics:
+            logging.info(
+                f"Evaluation cache: {self.cache_statistics['hits']} hits, {self.cache_statistics['misses']} misses"
+            )
+        for stage in ["checkout", "compile", "test", "ast"]:
+            if stage in self.timings:
+                count, total = self.timings[stage]
+                logging.info(
+                    f"Stage {stage}: {count} runs, {total:.1f}s total, {total / count:.2f}s per run"
+                )
@@ -9,6 +9,31 @@ class GoogleEvaluationStrategy(InstructEvaluationStrategy):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+    def __get_candidates(self, sample: dict) -> List[Optional[dict]]:
+        """
+        Returns the candidates of all generations, or None for those without content.
+        """
+        return [
+            candidate if "content" in candidate else None
+            for generation in sample["generation"]
+            for candidate in generation["candidates"]
+        ]
+
+    def extract_candidates(self, sample: dict) -> List[Optional[str]]:
+        """
+        Returns the candidate codes extracted from the candidates with content.
+
+        :param sample: The sample to extract the candidates from.
+        """
+        if sample["generation"] is None:
+            return []
+
+        return [
+            self.extract_patch_from_message(candidate["content"]["parts"][0]["text"])
+            for candidate in self.__get_candidates(sample)
+            if candidate is not None
+        ]
+
     def _evaluate_impl(self, bug: Bug, sample: dict) -> Optional[List[dict]]:
         """
         Returns the evaluation for the given bug and sample.
@@ -16,20 +41,14 @@ class GoogleEvaluationStrategy(InstructEvaluationStrategy):
         :param bug: The bug to generate the prompt for.
         :param sample: The sample to evaluate.
         """
-        evaluation = []
-
         if sample["generation"] is None:
-            return evaluation
-
-        for generation in sample["generation"]:
-            for candidate in generation["candidates"]:
-                if "content" not in candidate:
-                    evaluation.append(None)
-                    continue
-                candidate_patch = candidate["content"]["parts"][0]["text"]
-                candidate_patch = self.extract_patch_from_message(candidate_patch)
-                evaluation.append(
-                    self.evaluate_generation(bug, sample, candidate_patch)
-                )
-
-        return evaluation
+            return []
+
+        # Candidates without content are not evaluated
+        evaluation = iter(
+            self.evaluate_generations(bug, sample, self.extract_candidates(sample))
+        )
+        return [
+            next(evaluation) if candidate is not None else None
+            for candidate in self.__get_candidates(sample)
+        ]
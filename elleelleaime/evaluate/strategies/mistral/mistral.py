@@ -1,5 +1,4 @@
 from ..text.instruct import InstructEvaluationStrategy
-from elleelleaime.core.benchmarks.bug import Bug
 
 from typing import Optional, List
 
@@ -9,34 +8,28 @@ class MistralEvaluationStrategy(InstructEvaluationStrategy):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def __evaluate_generation(self, bug: Bug, sample: dict, generation) -> List[dict]:
+    def __extract_candidates(self, generation) -> List[Optional[str]]:
         """
-        Evaluate the generation for the given bug.
+        Extracts the candidate codes from the given generation.
 
-        :param bug: The bug to generate the prompt for.
-        :param generation: The generation to evaluate
+        :param generation: The generation to extract the candidates from.
         """
-        evaluation = []
+        return [
+            self.extract_patch_from_message(choice["message"]["content"])
+            for choice in generation["choices"]
+        ]
 
-        for choice in generation["choices"]:
-            message = choice["message"]["content"]
-            candidate_patch = self.extract_patch_from_message(message)
-            evaluation.append(self.evaluate_generation(bug, sample, candidate_patch))
-
-        return evaluation
-
-    def _evaluate_impl(self, bug: Bug, sample: dict) -> Optional[List[dict]]:
+    def extract_candidates(self, sample: dict) -> List[Optional[str]]:
         """
-        Returns the evaluation for the given bug and sample.
+        Returns the candidate codes extracted from the generated messages.
 
-        :param bug: The bug to generate the prompt for.
-        :param sample: The sample to evaluate.
+        :param sample: The sample to extract the candidates from.
         """
-        evaluation = []
+        candidates: List[Optional[str]] = []
 
         if sample["generation"] is None:
-            return evaluation
+            return candidates
 
-        evaluation.extend(self.__evaluate_generation(bug, sample, sample["generation"]))
+        candidates.extend(self.__extract_candidates(sample["generation"]))
 
-        return evaluation
+        return candidates
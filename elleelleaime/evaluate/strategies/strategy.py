@@ -1,10 +1,12 @@
 import tempfile
-import subprocess
 
 from abc import ABC, abstractmethod
+from pathlib import Path
 from typing import Any, List, Optional, final
 
 from elleelleaime.core.benchmarks.bug import Bug
+from elleelleaime.core.utils.java.jar_server import run_jar_many
+from elleelleaime.core.utils.java.java import normalize_java_code
 
 
 class PatchEvaluationStrategy(ABC):
@@ -26,29 +28,53 @@ class PatchEvaluationStrategy(ABC):
         return None
 
     def ast_match(self, fixed_code: str, candidate_code: str) -> bool:
-        # Write the fixed code to a temporary file
-        fixed_code_file = tempfile.NamedTemporaryFile(
-            mode="w", suffix=".java", delete=True
-        )
-        fixed_code_file.write(fixed_code)
-        fixed_code_file.flush()
+        return self.ast_match_many(fixed_code, [candidate_code])[0]
 
-        # Write the candidate code to a temporary file
-        candidate_code_file = tempfile.NamedTemporaryFile(
-            mode="w", suffix=".java", delete=True
-        )
-        candidate_code_file.write(candidate_code)
-        candidate_code_file.flush()
+    def ast_match_many(self, fixed_code: str, candidates: List[str]) -> List[bool]:
+        """
+        Checks whether each candidate has the same AST as the fixed code.
+        The fixed code is written once, candidates that are identical modulo comments and
+        whitespace are only matched once, and all the matches run in a single JVM.
+
+        :param fixed_code: The fixed code.
+        :param candidates: The candidate codes.
+        :return: A list with the result of the match of each candidate.
+        """
+        # De-duplicate the candidates by their normalized code
+        keys = [normalize_java_code(candidate) for candidate in candidates]
+        unique_candidates = {}
+        for key, candidate in zip(keys, candidates):
+            unique_candidates.setdefault(key, candidate)
+        if len(unique_candidates) == 0:
+            return []
+
+        with tempfile.TemporaryDirectory(suffix="-ast-match") as tmp_dir:
+            # Write the fixed code and the candidate codes to temporary files
+            fixed_code_path = Path(tmp_dir, "fixed.java")
+            with open(fixed_code_path, "w") as f:
+                f.write(fixed_code)
+            candidate_paths = []
+            for i, candidate in enumerate(unique_candidates.values()):
+                candidate_paths.append(Path(tmp_dir, f"candidate_{i}.java"))
+                with open(candidate_paths[-1], "w") as f:
+                    f.write(candidate)
 
-        # Run the AST matcher on the two files
-        run = subprocess.run(
-            f'docker run --rm --volume ".:/elleelleaime" --volume "{tempfile.gettempdir()}:{tempfile.gettempdir()}" --workdir "/elleelleaime" openjdk:11 java -jar gumtree-spoon-ast-diff.jar {fixed_code_file.name} {candidate_code_file.name}',
-            shell=True,
-            capture_output=True,
-        )
+            # Run the AST matcher on each pair of files
+            runs = run_jar_many(
+                "gumtree-spoon-ast-diff.jar",
+                [
+                    [str(fixed_code_path), str(candidate_path)]
+                    for candidate_path in candidate_paths
+                ],
+                [fixed_code_path] + candidate_paths,
+            )
 
-        # Return True if "no AST change" in the output
-        return "no AST change" in run.stdout.decode("utf-8")
+        # Match if "no AST change" in the output
+        matches = {
+            key: "no AST change" in run.stdout.decode("utf-8")
+            for key, run in zip(unique_candidates.keys(), runs)
+        }
+        return [matches[key] for key in keys]
 
     @final
     def evaluate(self, bug: Bug, sample: dict) -> Optional[List[dict]]:
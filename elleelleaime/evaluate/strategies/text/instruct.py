@@ -1,5 +1,4 @@
 from .replace import ReplaceEvaluationStrategy
-from elleelleaime.core.benchmarks.bug import Bug
 
 from typing import Optional, List
 import re
@@ -34,20 +33,16 @@ class InstructEvaluationStrategy(ReplaceEvaluationStrategy):
         else:
             return code_blocks[0][1] if code_blocks else None
 
-    def _evaluate_impl(self, bug: Bug, sample: dict) -> Optional[List[dict]]:
+    def extract_candidates(self, sample: dict) -> List[Optional[str]]:
         """
-        Returns the evaluation for the given bug and sample.
+        Returns the candidate codes extracted from the generated messages.
 
-        :param bug: The bug to generate the prompt for.
-        :param sample: The sample to evaluate.
+        :param sample: The sample to extract the candidates from.
         """
-        evaluation = []
-
         if sample["generation"] is None:
-            return evaluation
-
-        for generation in sample["generation"]:
-            candidate_patch = self.extract_patch_from_message(generation)
-            evaluation.append(self.evaluate_generation(bug, sample, candidate_patch))
+            return []
 
-        return evaluation
+        return [
+            self.extract_patch_from_message(generation)
+            for generation in sample["generation"]
+        ]
@@ -1,18 +1,38 @@
-from typing import Optional, List
+from typing import Dict, Iterator, Optional, List, Tuple
 from unidiff import PatchSet
 from pathlib import Path
-from uuid import uuid4
+from collections import OrderedDict
+from contextlib import contextmanager
 
-import os, tempfile, shutil, logging, getpass
+import time
+import logging
+import hashlib
+import threading
 
 from elleelleaime.evaluate.strategies.strategy import PatchEvaluationStrategy
 from elleelleaime.core.benchmarks.bug import Bug
-from elleelleaime.core.utils.java.java import remove_empty_lines, remove_java_comments
+from elleelleaime.core.utils.java.java import (
+    remove_empty_lines,
+    remove_java_comments,
+    get_source_filename,
+    get_target_filename,
+    normalize_java_code,
+)
 from elleelleaime.core.caching.cache import Cache
+from elleelleaime.core.caching.checkout_pool import CheckoutPool
+from elleelleaime.core.caching.checkout_store import get_checkout_store
 
 
 class ReplaceEvaluationStrategy(PatchEvaluationStrategy):
 
+    # The pools are shared by all instances since strategies are instantiated per sample
+    # They are keyed by (checkout store path, whether working copies are reused)
+    __CHECKOUT_POOLS: dict[Tuple[Optional[str], bool], CheckoutPool] = {}
+    __CHECKOUT_POOLS_LOCK: threading.Lock = threading.Lock()
+
+    # Maximum number of equivalence class results kept by each instance
+    MAX_RESULTS = 10_000
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.use_cache = kwargs.get("use_cache", True)
@@ -20,47 +40,209 @@ class ReplaceEvaluationStrategy(PatchEvaluationStrategy):
             "cache_path", Path(__file__).parent.parent.parent.parent.parent / "cache"
         )
         if self.use_cache:
-            self.cache = Cache(self.cache_path)
+            self.cache = Cache(self.cache_path, kwargs.get("cache_backend", None))
+        self.use_checkout_pool = kwargs.get("use_checkout_pool", True)
+        self.use_checkout_store = kwargs.get("use_checkout_store", True)
+        self.checkout_store_path = kwargs.get(
+            "checkout_store_path", Path(self.cache_path, "checkouts")
+        )
+        self.checkout_pool = self.__get_checkout_pool()
+        # Results of the equivalence classes evaluated by this instance, which lets
+        # long-lived instances de-duplicate candidates across calls
+        self.__results: OrderedDict[Tuple[str, str], Optional[dict]] = OrderedDict()
+        self.__results_lock = threading.Lock()
+        # Total time spent in each stage of the evaluation, and number of runs of each stage
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def __timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.__results_lock:
+                self.timings[stage] = (
+                    self.timings.get(stage, 0.0) + time.perf_counter() - start
+                )
+                self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def get_timings(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Returns the number of runs and the total time (in seconds) of each evaluation stage.
+        """
+        with self.__results_lock:
+            return {
+                stage: (self.counts[stage], self.timings[stage])
+                for stage in self.timings
+            }
+
+    def __result_key(
+        self, bug: Bug, sample: dict, normalized_code: str
+    ) -> Tuple[str, str]:
+        # The result of a candidate depends on the bug and on the code it replaces
+        context = hashlib.sha256(
+            f"{sample['buggy_code']}\0{sample['fixed_code']}\0{normalized_code}".encode()
+        ).hexdigest()
+        return f"{bug.benchmark.get_identifier()}/{bug.get_identifier()}", context
+
+    @classmethod
+    def reset_checkout_pools(cls) -> None:
+        """
+        Forgets the checkout pools inherited from a parent process (e.g. a forked worker),
+        without removing their working copies, which the parent still owns.
+        """
+        with cls.__CHECKOUT_POOLS_LOCK:
+            cls.__CHECKOUT_POOLS = {}
+
+    def __get_checkout_pool(self) -> CheckoutPool:
+        store_path = (
+            str(Path(self.checkout_store_path).absolute())
+            if self.use_checkout_store
+            else None
+        )
+        key = (store_path, self.use_checkout_pool)
+        with self.__CHECKOUT_POOLS_LOCK:
+            if key not in self.__CHECKOUT_POOLS:
+                self.__CHECKOUT_POOLS[key] = CheckoutPool(
+                    # A pool with max_idle=0 removes working copies as soon as they are released
+                    max_idle=16 if self.use_checkout_pool else 0,
+                    store=get_checkout_store(store_path) if store_path else None,
+                )
+            return self.__CHECKOUT_POOLS[key]
 
     def evaluate_generation(
         self, bug: Bug, sample: dict, generation: Optional[str]
     ) -> Optional[dict]:
-        # If the generation is None, we skip the evaluation
-        result = {
+        return self.evaluate_generations(bug, sample, [generation])[0]
+
+    def evaluate_generations(
+        self, bug: Bug, sample: dict, generations: List[Optional[str]]
+    ) -> List[Optional[dict]]:
+        """
+        Returns the evaluation of each generation for the given bug and sample.
+
+        Generations that are equivalent modulo comments and whitespace are only compiled
+        and tested once, and the ASTs of all plausible generations are matched in a single call.
+
+        :param bug: The bug to evaluate the generations for.
+        :param sample: The sample the generations belong to.
+        :param generations: The candidate codes (None if no code could be extracted).
+        """
+        evaluation: List[Optional[dict]] = [None] * len(generations)
+
+        # Look up all the generations in the cache at once
+        cached_evaluations: Dict[int, Optional[dict]] = {}
+        if self.use_cache:
+            indices = [i for i, g in enumerate(generations) if g is not None]
+            cached_evaluations = dict(
+                zip(
+                    indices,
+                    self.cache.load_many_from_cache_from_bug(
+                        bug, [generations[i] for i in indices]  # type: ignore
+                    ),
+                )
+            )
+
+        # Group the generations that are not cached by their normalized code
+        equivalence_classes: Dict[str, List[int]] = {}
+        for i, generation in enumerate(generations):
+            # If the generation is None, we skip the evaluation
+            if generation is None:
+                evaluation[i] = self.__empty_result(generation)
+                continue
+
+            # Check if the evaluation is cached
+            if cached_evaluations.get(i) is not None:
+                evaluation[i] = cached_evaluations[i]
+                continue
+            elif self.use_cache:
+                logging.info(
+                    f"Evaluation for {bug.get_identifier()} not found in cache."
+                )
+
+            equivalence_classes.setdefault(normalize_java_code(generation), []).append(
+                i
+            )
+
+        # Reuse the results of equivalence classes evaluated in previous calls
+        results: Dict[str, Optional[dict]] = {}
+        with self.__results_lock:
+            for key in equivalence_classes:
+                result_key = self.__result_key(bug, sample, key)
+                if result_key in self.__results:
+                    self.__results.move_to_end(result_key)
+                    results[key] = self.__results[result_key]
+
+        # Evaluate one generation of each new equivalence class
+        ast_candidates: Dict[str, Dict[str, str]] = {}
+        for key, indices in equivalence_classes.items():
+            if key in results:
+                continue
+            result, codes = self.__evaluate_candidate(
+                bug, sample, generations[indices[0]]
+            )
+            results[key] = result
+            # Plausible candidates are AST matched together afterwards
+            if codes is not None:
+                fixed_code, candidate_code = codes
+                ast_candidates.setdefault(fixed_code, {})[key] = candidate_code
+
+        # Note: we do not for AST matching before because the ast matcher returns false positives in some cases
+        for fixed_code, candidates in ast_candidates.items():
+            with self.__timed("ast"):
+                matches = self.ast_match_many(fixed_code, list(candidates.values()))
+            for key, match in zip(candidates.keys(), matches):
+                results[key]["ast_match"] = match  # type: ignore
+
+        with self.__results_lock:
+            for key, result in results.items():
+                self.__results[self.__result_key(bug, sample, key)] = result
+            while len(self.__results) > self.MAX_RESULTS:
+                self.__results.popitem(last=False)
+
+        # Fan the results out to all the generations of each equivalence class
+        new_generations, new_evaluations = [], []
+        for key, indices in equivalence_classes.items():
+            result = results[key]
+            if result is None:
+                continue
+            for i in indices:
+                evaluation[i] = {**result, "generation": generations[i]}
+                new_generations.append(generations[i])
+                new_evaluations.append(evaluation[i])
+
+        # Save the new evaluations to the cache
+        if self.use_cache and len(new_generations) > 0:
+            self.cache.save_many_to_cache_from_bug(
+                bug, new_generations, new_evaluations
+            )
+
+        return evaluation
+
+    def __empty_result(self, generation: Optional[str]) -> dict:
+        return {
             "generation": generation,
             "exact_match": False,
             "ast_match": False,
             "compile": False,
             "test": False,
         }
-        if generation is None:
-            return result
 
-        # Check if the evaluation is cached
-        if self.use_cache:
-            evaluation = self.cache.load_from_cache_from_bug(bug, generation)
-            if evaluation is not None:
-                return evaluation
-            else:
-                logging.info(
-                    f"Evaluation for {bug.get_identifier()} not found in cache."
-                )
+    def __evaluate_candidate(
+        self, bug: Bug, sample: dict, generation: str
+    ) -> Tuple[Optional[dict], Optional[Tuple[str, str]]]:
+        """
+        Evaluates a single generation, except for the AST match of plausible generations.
 
-        # Otherwise, we evaluate the generation
-        buggy_path = os.path.join(
-            tempfile.gettempdir(),
-            f"elleelleaime-{getpass.getuser()}",
-            bug.get_identifier(),
-            str(uuid4()),
-        )
+        Returns the evaluation, and the fixed and candidate files if the AST match is pending.
+        """
+        result = self.__empty_result(generation)
 
         # Remove comments and empty lines from the generated code and the fixed code
         generation_no_comments = remove_java_comments(generation)
         if generation_no_comments is None:
-            # Save the evaluation to the cache
-            if self.use_cache:
-                self.cache.save_to_cache_from_bug(bug, generation, result)
-            return result
+            return result, None
         generation_no_comments = remove_empty_lines(generation_no_comments)
         generation_no_comments = generation_no_comments.splitlines()
         fixed_code_no_comments = remove_empty_lines(
@@ -84,48 +266,29 @@ class ReplaceEvaluationStrategy(PatchEvaluationStrategy):
             result["ast_match"] = True
             result["compile"] = True
             result["test"] = True
+            return result, None
 
-            # Save the evaluation to the cache
-            if self.use_cache:
-                self.cache.save_to_cache_from_bug(bug, generation, result)
-            return result
+        # Note: this diff is inverted, i.e. the target file is the buggy file
+        diff = PatchSet(bug.get_ground_truth())
+        if bug.is_ground_truth_inverted():
+            buggy_file_path = get_target_filename(diff)
+        else:
+            buggy_file_path = get_source_filename(diff)
 
+        # Checkout the buggy code (or reuse a working copy of a previous evaluation)
+        # The candidate is written to the working copy, which is restored on release
+        with self.__timed("checkout"):
+            working_copy = self.checkout_pool.acquire(bug, fixed=False)
         try:
-            # Note: this diff is inverted, i.e. the target file is the buggy file
-            diff = PatchSet(bug.get_ground_truth())
-
-            # Checkout the buggy code
-            bug.checkout(buggy_path, fixed=False)
-
-            # Locate and load the buggy file
-            if bug.is_ground_truth_inverted():
-                buggy_file_path = os.path.join(
-                    buggy_path,
-                    (
-                        diff[0].target_file[2:]
-                        if diff[0].target_file.startswith("b/")
-                        else diff[0].target_file
-                    ),
-                )
-            else:
-                buggy_file_path = os.path.join(
-                    buggy_path,
-                    (
-                        diff[0].source_file[2:]
-                        if diff[0].source_file.startswith("a/")
-                        else diff[0].source_file
-                    ),
-                )
-
-            with open(buggy_file_path, "r", encoding="ISO-8859-1") as f:
-                buggy_code = f.read()
+            # Load the buggy file
+            buggy_code = working_copy.read_file(buggy_file_path)
 
             # Check that buggy code exists
             if sample["buggy_code"] not in buggy_code:
                 logging.error(
                     f"Could not find buggy code in {buggy_file_path} for {sample['identifier']}"
                 )
-                return None
+                return None, None
 
             # Get the fixed and candidate code
             fixed_code = buggy_code.replace(sample["buggy_code"], sample["fixed_code"])
@@ -133,32 +296,32 @@ class ReplaceEvaluationStrategy(PatchEvaluationStrategy):
 
             # Compute plausible match
             # Write the generated code to the file
-            with open(
-                buggy_file_path,
-                "w",
-                encoding="ISO-8859-1",
-                errors="replace",
-            ) as f:
-                f.write(candidate_code)
+            working_copy.write_file(buggy_file_path, candidate_code)
 
             # Evaluate the buggy code
-            compilation_result = bug.compile(buggy_path)
+            with self.__timed("compile"):
+                compilation_result = bug.compile(working_copy.get_path())
             result["compile"] = compilation_result.is_passing()
             # If it compiles, test the code
             if result["compile"] or result["compile"] is None:
-                test_result = bug.test(buggy_path)
+                with self.__timed("test"):
+                    test_result = bug.test(working_copy.get_path())
                 result["test"] = test_result.is_passing()
-                # If the tests pass, check if the ASTs match
-                # Note: we do not for AST matching before because the ast matcher returns false positives in some cases
+                # If the tests pass, the ASTs must be matched
                 if result["test"]:
-                    result["ast_match"] = self.ast_match(fixed_code, candidate_code)
+                    return result, (fixed_code, candidate_code)
 
-            # Save the evaluation to the cache
-            if self.use_cache:
-                self.cache.save_to_cache_from_bug(bug, generation, result)
-            return result
+            return result, None
         finally:
-            shutil.rmtree(buggy_path)
+            self.checkout_pool.release(working_copy)
+
+    def extract_candidates(self, sample: dict) -> List[Optional[str]]:
+        """
+        Returns the candidate codes of the given sample.
+
+        :param sample: The sample to extract the candidates from.
+        """
+        return sample["generation"]
 
     def _evaluate_impl(self, bug: Bug, sample: dict) -> Optional[List[dict]]:
         """
@@ -167,9 +330,4 @@ class ReplaceEvaluationStrategy(PatchEvaluationStrategy):
         :param bug: The bug to generate the prompt for.
         :param sample: The sample to evaluate.
         """
-        evaluation = []
-
-        for generation in sample["generation"]:
-            evaluation.append(self.evaluate_generation(bug, sample, generation))
-
-        return evaluation
+        return self.evaluate_generations(bug, sample, self.extract_candidates(sample))
@@ -22,3 +22,14 @@ class CostCalculator:
         if strategy is None:
             return None
         return strategy.compute_costs(samples, model_name)
+
+    @staticmethod
+    def get_prices(provider: str, model_name: str) -> Optional[dict]:
+        """
+        Returns the prices per million tokens of the model of the provider, or None if
+        they are unknown.
+        """
+        strategy = CostCalculator.__COST_STRATEGIES.get(provider)
+        if strategy is None:
+            return None
+        return strategy.get_prices(model_name)
@@ -7,6 +7,11 @@ import logging
 
 class AnthropicCostStrategy(CostStrategy):
 
+    # Writing a prompt to the cache costs 25% more than processing it, and reading it
+    # from the cache costs 10% of the price
+    __CACHE_WRITE_MULTIPLIER = 1.25
+    __CACHE_READ_MULTIPLIER = 0.1
+
     __COST_PER_MILLION_TOKENS = {
         "claude-3-5-sonnet-20240620": {
             "prompt": 3,
@@ -22,6 +27,19 @@ class AnthropicCostStrategy(CostStrategy):
         },
     }
 
+    @staticmethod
+    def get_prices(model_name: str) -> Optional[dict]:
+        prices = AnthropicCostStrategy.__COST_PER_MILLION_TOKENS.get(model_name)
+        if prices is None:
+            return None
+        return {
+            **prices,
+            "cache_write_prompt": prices["prompt"]
+            * AnthropicCostStrategy.__CACHE_WRITE_MULTIPLIER,
+            "cached_prompt": prices["prompt"]
+            * AnthropicCostStrategy.__CACHE_READ_MULTIPLIER,
+        }
+
     @staticmethod
     def compute_costs(samples: list, model_name: str) -> Optional[dict]:
         if model_name not in AnthropicCostStrategy.__COST_PER_MILLION_TOKENS:
@@ -36,12 +54,22 @@ class AnthropicCostStrategy(CostStrategy):
         for sample in tqdm.tqdm(samples, f"Computing costs for {model_name}..."):
             if sample["generation"]:
                 for g in sample["generation"]:
+                    # Requests that failed (e.g. in a batch job) are None
+                    if g is None:
+                        continue
                     if "usage" not in g:
                         logging.warning(
                             f"No usage found for sample: {sample['identifier']}"
                         )
                         continue
+                    # Input tokens do not include the tokens written to or read from the cache
                     prompt_token_count = g["usage"]["input_tokens"]
+                    cache_creation_token_count = (
+                        g["usage"].get("cache_creation_input_tokens") or 0
+                    )
+                    cache_read_token_count = (
+                        g["usage"].get("cache_read_input_tokens") or 0
+                    )
                     candidates_token_count = g["usage"]["output_tokens"]
 
                     prompt_cost = AnthropicCostStrategy.__COST_PER_MILLION_TOKENS[
@@ -51,7 +79,17 @@ class AnthropicCostStrategy(CostStrategy):
                         model_name
                     ]["completion"]
 
-                    costs["prompt_cost"] += prompt_cost * prompt_token_count / 1000000
+                    costs["prompt_cost"] += (
+                        prompt_cost
+                        * (
+                            prompt_token_count
+                            + AnthropicCostStrategy.__CACHE_WRITE_MULTIPLIER
+                            * cache_creation_token_count
+                            + AnthropicCostStrategy.__CACHE_READ_MULTIPLIER
+                            * cache_read_token_count
+                        )
+                        / 1000000
+                    )
                     costs["completion_cost"] += (
                         completion_cost * candidates_token_count / 1000000
                     )
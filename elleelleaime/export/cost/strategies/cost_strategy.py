@@ -11,3 +11,13 @@ class CostStrategy(ABC):
     @abstractmethod
     def compute_costs(samples: list, model_name: str) -> Optional[dict]:
         pass
+
+    @staticmethod
+    @abstractmethod
+    def get_prices(model_name: str) -> Optional[dict]:
+        """
+        Returns the prices per million tokens of the model ("prompt", "completion", and
+        "cached_prompt" and "cache_write_prompt" for providers with prompt caching), or
+        None if the model is unknown.
+        """
+        pass
@@ -28,6 +28,11 @@ class GoogleCostStrategy(CostStrategy):
         },
     }
 
+    @staticmethod
+    def get_prices(model_name: str) -> Optional[dict]:
+        # Prices of prompts up to 128k tokens
+        return GoogleCostStrategy.__COST_PER_MILLION_TOKENS.get(model_name)
+
     @staticmethod
     def compute_costs(samples: list, model_name: str) -> Optional[dict]:
         if model_name not in GoogleCostStrategy.__COST_PER_MILLION_TOKENS:
@@ -17,6 +17,10 @@ class MistralCostStrategy(CostStrategy):
         },
     }
 
+    @staticmethod
+    def get_prices(model_name: str) -> Optional[dict]:
+        return MistralCostStrategy.__COST_PER_MILLION_TOKENS.get(model_name)
+
     @staticmethod
     def compute_costs(samples: list, model_name: str) -> Optional[dict]:
         if model_name not in MistralCostStrategy.__COST_PER_MILLION_TOKENS:
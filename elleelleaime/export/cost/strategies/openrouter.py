@@ -46,6 +46,10 @@ class OpenRouterCostStrategy(CostStrategy):
         },
     }
 
+    @staticmethod
+    def get_prices(model_name: str) -> Optional[dict]:
+        return OpenRouterCostStrategy.__COST_PER_MILLION_TOKENS.get(model_name)
+
     @staticmethod
     def compute_costs(samples: list, model_name: str) -> Optional[dict]:
         if model_name not in OpenRouterCostStrategy.__COST_PER_MILLION_TOKENS:
@@ -0,0 +1,112 @@
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.rate_limiter import get_rate_limiter
+
+from abc import abstractmethod
+from typing import Any, List, Optional
+
+import asyncio
+
+
+class AsyncPatchGenerationStrategy(PatchGenerationStrategy):
+    """
+    Generation strategy that sends requests concurrently from an event loop.
+
+    All the requests of a batch of prompts (one per sample for providers that only return
+    one sample per request) are in flight at the same time, up to `max_concurrency`.
+    Requests are also limited to `requests_per_minute` and `tokens_per_minute`, which are
+    shared by all instances for the same provider and model.
+    """
+
+    def __init__(self, provider: str, model_name: str, **kwargs) -> None:
+        self.model_name = model_name
+        self.max_concurrency = kwargs.get("max_concurrency", 16)
+        self.batch_size = kwargs.get("batch_size", 4 * self.max_concurrency)
+        self.rate_limiter = get_rate_limiter(
+            provider,
+            model_name,
+            requests_per_minute=kwargs.get("requests_per_minute", None),
+            tokens_per_minute=kwargs.get("tokens_per_minute", None),
+        )
+
+    def prompts_per_batch(self) -> int:
+        return self.batch_size
+
+    def _requests_per_prompt(self) -> int:
+        """
+        Number of requests needed to generate all the samples of a prompt.
+        """
+        return 1
+
+    def requests_per_prompt(self) -> int:
+        return self._requests_per_prompt()
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        """
+        Estimates the number of tokens of a request, before sending it.
+        """
+        # Roughly 4 characters per token
+        return len(prompt) // 4
+
+    def _count_tokens(self, response: Any) -> Optional[int]:
+        """
+        Returns the number of tokens used by a request, if the response reports it.
+        """
+        return None
+
+    async def _astart(self) -> None:
+        """
+        Called in the event loop before sending the requests of a batch, e.g. to open
+        clients (which are bound to the event loop they are used in).
+        """
+        pass
+
+    async def _astop(self) -> None:
+        """
+        Called in the event loop after the requests of a batch are done.
+        """
+        pass
+
+    @abstractmethod
+    async def _agenerate_request(self, prompt: str) -> Any:
+        """
+        Sends one request for the given prompt.
+        """
+        pass
+
+    def _merge_requests(self, responses: List[Any]) -> Any:
+        """
+        Merges the responses of the requests of a prompt into its generation.
+        """
+        return responses[0]
+
+    async def __agenerate_request(self, semaphore: asyncio.Semaphore, prompt: str):
+        async with semaphore:
+            estimated_tokens = self._estimate_tokens(prompt)
+            await self.rate_limiter.acquire(estimated_tokens)
+            response = await self._agenerate_request(prompt)
+            used_tokens = self._count_tokens(response)
+            if used_tokens is not None:
+                self.rate_limiter.adjust(used_tokens - estimated_tokens)
+            return response
+
+    async def _agenerate(self, chunk: List[str]) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        n_requests = self._requests_per_prompt()
+        await self._astart()
+        try:
+            responses = await asyncio.gather(
+                *[
+                    self.__agenerate_request(semaphore, prompt)
+                    for prompt in chunk
+                    for _ in range(n_requests)
+                ]
+            )
+        finally:
+            await self._astop()
+        return [
+            self._merge_requests(list(responses[i : i + n_requests]))
+            for i in range(0, len(responses), n_requests)
+        ]
+
+    def _generate_impl(self, chunk: List[str]) -> Any:
+        return asyncio.run(self._agenerate(chunk))
@@ -0,0 +1,25 @@
+from typing import Optional
+
+import os
+
+
+def read_batch_job(job_file: Optional[str]) -> Optional[str]:
+    """
+    Returns the identifier of the batch job submitted by a previous run, if any.
+    """
+    if job_file is None or not os.path.exists(job_file):
+        return None
+    with open(job_file) as f:
+        job_id = f.read().strip()
+    return job_id or None
+
+
+def write_batch_job(job_file: Optional[str], job_id: str) -> None:
+    """
+    Records the identifier of a submitted batch job, so that an interrupted run polls
+    the same job instead of submitting a new one.
+    """
+    if job_file is None:
+        return
+    with open(job_file, "w") as f:
+        f.write(job_id)
@@ -1,11 +1,45 @@
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.async_strategy import AsyncPatchGenerationStrategy
+from elleelleaime.generate.strategies.rate_limiter import get_rate_limit_controller
+from elleelleaime.generate.strategies.batch_job import read_batch_job, write_batch_job
 
 from dotenv import load_dotenv
-from typing import Any, List
+from typing import Any, List, Optional
 
 import os
+import functools
+import json
+import time
+import httpx
 import anthropic
 import backoff
+import logging
+
+# Message batches and prompt caching are in beta in the SDK version we depend on
+MESSAGE_BATCHES_BETA = "message-batches-2024-09-24"
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+# All Claude 3 models have a context window of 200k tokens
+CONTEXT_SIZE = 200000
+
+
+def _user_message(prompt: str, cache_prompt: bool) -> dict:
+    """
+    Returns the message of the prompt, marked for caching if requested so that the
+    requests generating the other samples of the prompt read it from the cache.
+    """
+    if not cache_prompt:
+        return {"role": "user", "content": prompt}
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}
+        ],
+    }
+
+
+def _is_rate_limited(error: anthropic.APIStatusError) -> bool:
+    # 529 is returned when the API is overloaded
+    return error.status_code in {429, 529}
 
 
 class AnthropicModels(PatchGenerationStrategy):
@@ -14,9 +48,27 @@ class AnthropicModels(PatchGenerationStrategy):
         self.max_tokens = max_tokens
         self.temperature = kwargs.get("temperature", 0.0)
         self.n_samples = kwargs.get("n_samples", 1)
+        # Caching only pays off when the prompt is sent more than once
+        self.cache_prompt = kwargs.get("cache_prompt", self.n_samples > 1)
+        self.poll_interval = kwargs.get("poll_interval", 60)
+        self.base_url = kwargs.get("base_url", None)
+
+        self.rate_limit_controller = get_rate_limit_controller("anthropic", model_name)
 
         load_dotenv()
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.api_key = os.getenv("ANTHROPIC_API_KEY")
+
+    @functools.cached_property
+    def client(self) -> anthropic.Anthropic:
+        # Created on first use, so that the strategy can be built without credentials
+        # (e.g. to estimate costs). Rate limited requests are retried here, paced by
+        # the shared controller
+        return anthropic.Anthropic(
+            api_key=self.api_key, base_url=self.base_url, max_retries=0
+        )
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return CONTEXT_SIZE - self.max_tokens
 
     @backoff.on_exception(
         backoff.expo,
@@ -25,7 +77,102 @@ class AnthropicModels(PatchGenerationStrategy):
         raise_on_giveup=False,
     )
     def _completions_with_backoff(self, **kwargs):
-        return self.client.messages.create(**kwargs)
+        self.rate_limit_controller.acquire()
+        try:
+            messages = (
+                self.client.beta.prompt_caching.messages
+                if self.cache_prompt
+                else self.client.messages
+            )
+            response = messages.with_raw_response.create(**kwargs)
+        except anthropic.APIStatusError as e:
+            if _is_rate_limited(e):
+                self.rate_limit_controller.throttle(e.response.headers)
+            else:
+                self.rate_limit_controller.update(e.response.headers)
+            raise
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
+        self.rate_limit_controller.update(response.headers)
+        return response.parse()
+
+    def __request(self, prompt: str) -> dict:
+        return {
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "messages": [_user_message(prompt, self.cache_prompt)],
+            "temperature": self.temperature,
+        }
+
+    # The API does not support generating many samples per request
+    def units_per_prompt(self) -> int:
+        return self.n_samples
+
+    def _generate_unit(self, prompt: str) -> Any:
+        completion = self._completions_with_backoff(**self.__request(prompt))
+        if completion:
+            return completion.to_dict()
+        else:
+            return completion
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        return units
+
+    def supports_batch_job(self) -> bool:
+        return True
+
+    def _generate_batch_job(self, chunk: List[str], job_file: Optional[str]) -> Any:
+        betas = [MESSAGE_BATCHES_BETA]
+        if self.cache_prompt:
+            betas.append(PROMPT_CACHING_BETA)
+        options: Any = {"headers": {"anthropic-beta": ",".join(betas)}}
+        batch_id = read_batch_job(job_file)
+        if batch_id is None:
+            batch = self.client.post(
+                "/v1/messages/batches",
+                body={
+                    "requests": [
+                        {"custom_id": f"{i}-{unit}", "params": self.__request(prompt)}
+                        for i, prompt in enumerate(chunk)
+                        for unit in range(self.n_samples)
+                    ]
+                },
+                cast_to=object,
+                options=options,
+            )
+            batch_id = batch["id"]
+            write_batch_job(job_file, batch_id)
+            logging.info(
+                f"Submitted batch {batch_id} with {len(chunk) * self.n_samples} requests"
+            )
+
+        while True:
+            batch = self.client.get(
+                f"/v1/messages/batches/{batch_id}", cast_to=object, options=options
+            )
+            if batch["processing_status"] == "ended":
+                break
+            logging.info(f"Batch {batch_id} is {batch['processing_status']}")
+            time.sleep(self.poll_interval)
+
+        # Requests that errored, were canceled or expired are None, as when the retries
+        # are exhausted
+        messages = {}
+        results = self.client.get(
+            batch["results_url"], cast_to=httpx.Response, options=options
+        )
+        for line in results.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result["result"]["type"] == "succeeded":
+                messages[result["custom_id"]] = result["result"]["message"]
+
+        return [
+            [messages.get(f"{i}-{unit}") for unit in range(self.n_samples)]
+            for i in range(len(chunk))
+        ]
 
     def _generate_impl(self, chunk: List[str]) -> Any:
         result = []
@@ -33,16 +180,91 @@ class AnthropicModels(PatchGenerationStrategy):
         for prompt in chunk:
             result_sample = []
             for _ in range(self.n_samples):
-                completion = self._completions_with_backoff(
-                    model=self.model_name,
-                    max_tokens=self.max_tokens,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=self.temperature,
-                )
-                if completion:
-                    result_sample.append(completion.to_dict())
-                else:
-                    result_sample.append(completion)
+                result_sample.append(self._generate_unit(prompt))
             result.append(result_sample)
 
         return result
+
+
+class AsyncAnthropicModels(AsyncPatchGenerationStrategy):
+    def __init__(self, model_name: str, max_tokens: int, **kwargs) -> None:
+        super().__init__("anthropic", model_name, **kwargs)
+        self.max_tokens = max_tokens
+        self.temperature = kwargs.get("temperature", 0.0)
+        self.n_samples = kwargs.get("n_samples", 1)
+        # Caching only pays off when the prompt is sent more than once
+        self.cache_prompt = kwargs.get("cache_prompt", self.n_samples > 1)
+        self.base_url = kwargs.get("base_url", None)
+
+        load_dotenv()
+        self.api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.client: Optional[anthropic.AsyncAnthropic] = None
+        self.rate_limit_controller = get_rate_limit_controller("anthropic", model_name)
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return CONTEXT_SIZE - self.max_tokens
+
+    async def _astart(self) -> None:
+        self.client = anthropic.AsyncAnthropic(
+            api_key=self.api_key, base_url=self.base_url, max_retries=0
+        )
+
+    async def _astop(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    @backoff.on_exception(
+        backoff.expo,
+        Exception,
+        max_tries=5,
+        raise_on_giveup=False,
+    )
+    async def _completions_with_backoff(self, **kwargs):
+        assert self.client is not None
+        await self.rate_limit_controller.aacquire()
+        try:
+            messages = (
+                self.client.beta.prompt_caching.messages
+                if self.cache_prompt
+                else self.client.messages
+            )
+            response = await messages.with_raw_response.create(**kwargs)
+        except anthropic.APIStatusError as e:
+            if _is_rate_limited(e):
+                self.rate_limit_controller.throttle(e.response.headers)
+            else:
+                self.rate_limit_controller.update(e.response.headers)
+            raise
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
+        self.rate_limit_controller.update(response.headers)
+        return response.parse()
+
+    def _requests_per_prompt(self) -> int:
+        return self.n_samples
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        return len(prompt) // 4 + self.max_tokens
+
+    async def _agenerate_request(self, prompt: str) -> Any:
+        completion = await self._completions_with_backoff(
+            model=self.model_name,
+            max_tokens=self.max_tokens,
+            messages=[_user_message(prompt, self.cache_prompt)],
+            temperature=self.temperature,
+        )
+        if completion:
+            return completion.to_dict()
+        else:
+            return completion
+
+    def _merge_requests(self, responses: List[Any]) -> Any:
+        return responses
+
+    def _count_tokens(self, response: Any) -> Optional[int]:
+        if not response:
+            return None
+        usage = response.get("usage") or {}
+        return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
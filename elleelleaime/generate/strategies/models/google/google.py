@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 from typing import Any, List
 
 import os
+import math
 import tqdm
 import google.generativeai as genai
 import google
@@ -20,6 +21,8 @@ class GoogleModels(PatchGenerationStrategy):
         self.model = genai.GenerativeModel(self.model_name)
         self.temperature = kwargs.get("temperature", 0.0)
         self.n_samples = kwargs.get("n_samples", 1)
+        # Gemini models return at most 8 candidates per request
+        self.max_candidate_count = kwargs.get("max_candidate_count", 8)
 
         load_dotenv()
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -27,6 +30,7 @@ class GoogleModels(PatchGenerationStrategy):
     def __get_config(self):
         return genai.types.GenerationConfig(
             temperature=self.temperature,
+            candidate_count=math.ceil(self.n_samples / self.units_per_prompt()),
         )
 
     @backoff.on_exception(backoff.expo, google.api_core.exceptions.ResourceExhausted)
@@ -36,13 +40,28 @@ class GoogleModels(PatchGenerationStrategy):
         )
         return completion.to_dict()
 
+    def units_per_prompt(self) -> int:
+        # Each request returns up to max_candidate_count candidates
+        return math.ceil(self.n_samples / self.max_candidate_count)
+
+    def _generate_unit(self, prompt: str) -> Any:
+        return self.__generate_with_backoff(prompt)
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        # Requests are split evenly, so the last candidates may be in excess
+        remaining = self.n_samples
+        for unit in units:
+            unit["candidates"] = unit.get("candidates", [])[: max(0, remaining)]
+            remaining -= len(unit["candidates"])
+        return units
+
     def _generate_impl(self, chunk: List[str]) -> Any:
         result = []
 
         for prompt in tqdm.tqdm(chunk, "Generating patches for prompt..."):
             p_results = []
-            for _ in range(self.n_samples):
-                p_results.append(self.__generate_with_backoff(prompt))
-            result.append(p_results)
+            for _ in range(self.units_per_prompt()):
+                p_results.append(self._generate_unit(prompt))
+            result.append(self._merge_units(p_results))
 
         return result
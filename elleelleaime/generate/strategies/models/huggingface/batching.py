@@ -0,0 +1,126 @@
+from typing import Any, Callable, Dict, List, Optional
+
+import tqdm
+import torch
+
+
+def make_batches(
+    lengths: List[int],
+    batch_size: int,
+    max_tokens_per_batch: Optional[int] = None,
+) -> List[List[int]]:
+    """
+    Groups prompts into batches of prompts of similar length.
+
+    Prompts are sorted by decreasing length (so that a batch that does not fit in memory
+    fails first), and each batch holds at most `batch_size` prompts and, once left-padded
+    to its longest prompt, at most `max_tokens_per_batch` tokens. A prompt longer than
+    `max_tokens_per_batch` is put in a batch of its own.
+
+    :param lengths: The length in tokens of each prompt.
+    :return: The batches, as lists of indices into `lengths`.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    for i in order:
+        if len(batches) > 0:
+            batch = batches[-1]
+            # The first prompt of a batch is its longest one
+            padded_tokens = (len(batch) + 1) * lengths[batch[0]]
+            if len(batch) < batch_size and (
+                max_tokens_per_batch is None or padded_tokens <= max_tokens_per_batch
+            ):
+                batch.append(i)
+                continue
+        batches.append([i])
+    return batches
+
+
+def tokenize(tokenizer: Any, prompts: List[str]) -> List[List[int]]:
+    """
+    Returns the ids of each prompt, tokenized on its own.
+
+    Prompts are not tokenized in one batched call, since some tokenizers only handle
+    their special markers when encoding a single text (e.g. the CodeLlama tokenizer only
+    splits `<FILL_ME>` into its prefix, suffix and middle tokens in `encode_plus`).
+    """
+    return [tokenizer.encode_plus(prompt)["input_ids"] for prompt in prompts]
+
+
+def generate_batched(
+    model: Any,
+    tokenizer: Any,
+    input_ids: List[List[int]],
+    batch_size: int,
+    max_tokens_per_batch: Optional[int],
+    num_return_sequences: int,
+    decode: Callable[[Any, Any], List[str]],
+    **generate_kwargs,
+) -> List[List[str]]:
+    """
+    Generates the given prompts in length-bucketed, left-padded batches.
+
+    :param input_ids: The ids of each prompt, as returned by `tokenize`.
+    :param decode: Decodes the generated ids of one batch, given the tokenized inputs, into
+        one string per returned sequence.
+    :return: The `num_return_sequences` generations of each prompt, in the order of the
+        prompts.
+    """
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    pad_token_id = tokenizer.pad_token_id
+
+    results: List[List[str]] = [[] for _ in input_ids]
+    lengths = [len(ids) for ids in input_ids]
+    batches = make_batches(lengths, batch_size, max_tokens_per_batch)
+    for batch in tqdm.tqdm(batches, "Generating patches..."):
+        # Padding on the left keeps the prompts of a batch aligned with their
+        # continuation (the first prompt of a batch is its longest one)
+        longest = lengths[batch[0]]
+        inputs = {
+            "input_ids": torch.tensor(
+                [[pad_token_id] * (longest - lengths[i]) + input_ids[i] for i in batch],
+                device=model.device,
+            ),
+            "attention_mask": torch.tensor(
+                [[0] * (longest - lengths[i]) + [1] * lengths[i] for i in batch],
+                device=model.device,
+            ),
+        }
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs,
+                num_return_sequences=num_return_sequences,
+                **generate_kwargs,
+            )
+        # The sequences returned for a prompt are consecutive
+        generations = decode(outputs, inputs)
+        for j, i in enumerate(batch):
+            results[i] = generations[
+                j * num_return_sequences : (j + 1) * num_return_sequences
+            ]
+    return results
+
+
+def assisted_generation_kwargs(
+    assistant_model: Any = None,
+    prompt_lookup_num_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Returns the `generate` kwargs enabling assisted generation, where a draft proposes
+    the next tokens and the model verifies them all in a single forward pass. The draft
+    is either a smaller model sharing the tokenizer of the model, or n-grams looked up
+    in the prompt (prompt lookup decoding).
+
+    Assisted generation only supports batches of one prompt and no beam search. With
+    greedy decoding, the generations are the same as without assistance.
+    """
+    if assistant_model is not None and prompt_lookup_num_tokens is not None:
+        raise ValueError(
+            "Only one of assistant_model and prompt_lookup_num_tokens can be set"
+        )
+    if assistant_model is not None:
+        return dict(assistant_model=assistant_model)
+    if prompt_lookup_num_tokens is not None:
+        return dict(prompt_lookup_num_tokens=prompt_lookup_num_tokens)
+    return dict()
@@ -1,12 +1,15 @@
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.models.huggingface.batching import (
+    tokenize,
+    generate_batched,
+    assisted_generation_kwargs,
+)
+from elleelleaime.generate.strategies.models.huggingface.model_registry import (
+    HuggingFaceModelRegistry,
+)
 from dataclasses import dataclass
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from transformers.tokenization_utils_base import PreTrainedTokenizerBase
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
-import tqdm
-import torch
-import threading
 import logging
 
 
@@ -44,16 +47,14 @@ class CodeLLaMAInfilling(PatchGenerationStrategy):
         ),
     }
 
-    __MODEL = None
-    __TOKENIZER = None
-    __MODELS_LOADED: bool = False
-    __MODELS_LOCK: threading.Lock = threading.Lock()
-
     def __init__(self, model_name: str, **kwargs) -> None:
         assert (
             model_name in self.__SUPPORTED_MODELS
         ), f"Model {model_name} not supported by {self.__class__.__name__}"
         self.model_name = model_name
+        self.dtype = kwargs.get("dtype", "bfloat16")
+        self.__model: Any = None
+        self.__tokenizer: Any = None
         # Generation settings
         assert (
             kwargs.get("generation_strategy", "beam_search")
@@ -71,71 +72,130 @@ class CodeLLaMAInfilling(PatchGenerationStrategy):
         self.generate_settings.temperature = kwargs.get(
             "temperature", GenerateSettings.temperature
         )
-        self.__load_model()
-
-    def __load_model(self):
-        # Setup environment
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.generate_settings.max_length = kwargs.get(
+            "max_length", GenerateSettings.max_length
+        )
+        self.batch_size = kwargs.get("batch_size", 1)
+        self.max_tokens_per_batch = kwargs.get("max_tokens_per_batch", None)
         self.context_size = self.generate_settings.max_length
 
-        # Setup kwargs
-        kwargs = dict(
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
+        # Assisted generation, drafting with a smaller model or with the prompt
+        self.assistant_model_name = kwargs.get("assistant_model_name", None)
+        self.prompt_lookup_num_tokens = kwargs.get("prompt_lookup_num_tokens", None)
+        self.__assistant_model: Any = None
+        if (
+            self.assistant_model_name is not None
+            or self.prompt_lookup_num_tokens is not None
+        ):
+            assert (
+                self.assistant_model_name is None
+                or self.prompt_lookup_num_tokens is None
+            ), "Only one of assistant_model_name and prompt_lookup_num_tokens can be set"
+            # Assisted generation also returns a single sequence per call, so the
+            # num_return_sequences sequences are generated by as many calls
+            assert (
+                self.batch_size == 1 and self.generate_settings.num_beams == 1
+            ), "Assisted generation requires batch_size=1 and num_beams=1"
+
+    def prompts_per_batch(self) -> int:
+        return self.batch_size
+
+    def tokenizer_name(self) -> str:
+        return self.model_name
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        tokenizer = HuggingFaceModelRegistry.get_tokenizer(self.model_name)
+        return [len(input_ids) for input_ids in tokenize(tokenizer, prompts)]
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return self.context_size - 1
+
+    def __load_model(self) -> None:
+        # The model is shared by all strategies using it in the process
+        if self.__model is not None:
+            return
+
+        self.__model, self.__tokenizer = HuggingFaceModelRegistry.acquire(
+            self.model_name, dtype=self.dtype
         )
-
-        # Load the model and tokenizer
-        with self.__MODELS_LOCK:
-            if self.__MODELS_LOADED:
-                return
-            self.__TOKENIZER: PreTrainedTokenizerBase = AutoTokenizer.from_pretrained(
-                self.model_name
+        if self.assistant_model_name is not None:
+            self.__assistant_model, _ = HuggingFaceModelRegistry.acquire(
+                self.assistant_model_name, dtype=self.dtype
             )
-            self.__MODEL = AutoModelForCausalLM.from_pretrained(
-                self.model_name, **kwargs
-            )
-            self.__MODEL.eval()
-            self.__MODELS_LOADED = True
-
-    def __generate_patch(self, prompt: str) -> Optional[List[str]]:
-        if prompt.count("<FILL_ME>") > 1:
-            logging.warning(
-                "Prompt should contain exactly at most one <FILL_ME> tag, but it contains %d. Skipping bug.",
-                prompt.count("<FILL_ME>"),
-            )
-            return None
 
-        inputs = self.__TOKENIZER(prompt, return_tensors="pt").to(self.device)
-
-        input_len = inputs["input_ids"].shape[1]
-        if input_len >= self.context_size:
-            logging.warning(
-                f"warning: input_len ({input_len}) is greater than the context window {self.context_size}"
+    def close(self) -> None:
+        if self.__model is None:
+            return
+        HuggingFaceModelRegistry.release(self.model_name, dtype=self.dtype)
+        if self.__assistant_model is not None:
+            HuggingFaceModelRegistry.release(
+                self.assistant_model_name, dtype=self.dtype
             )
-            return None
+        self.__model, self.__tokenizer, self.__assistant_model = None, None, None
+
+    def _generate_impl(self, prompts: List[str]) -> Any:
+        self.__load_model()
 
-        with torch.no_grad():
-            generated_ids = self.__MODEL.generate(
-                **inputs,
+        # Skip prompts that cannot be infilled or are too long
+        result: List[Optional[List[str]]] = [None] * len(prompts)
+        input_ids: Dict[int, List[int]] = {}
+        for i, prompt in enumerate(prompts):
+            if prompt.count("<FILL_ME>") > 1:
+                logging.warning(
+                    "Prompt should contain exactly at most one <FILL_ME> tag, but it contains %d. Skipping bug.",
+                    prompt.count("<FILL_ME>"),
+                )
+                continue
+            (prompt_ids,) = tokenize(self.__tokenizer, [prompt])
+            input_len = len(prompt_ids)
+            if input_len >= self.context_size:
+                logging.warning(
+                    f"warning: input_len ({input_len}) is greater than the context window {self.context_size}"
+                )
+                continue
+            input_ids[i] = prompt_ids
+        to_generate = list(input_ids)
+
+        def decode(outputs: Any, inputs: Any) -> List[str]:
+            fillings_ids = outputs[:, inputs["input_ids"].shape[1] :]
+            return self.__tokenizer.batch_decode(fillings_ids, skip_special_tokens=True)
+
+        # Assisted generation returns a single sequence per prompt, so each call then
+        # generates one of the sequences of every prompt
+        assisted_kwargs = assisted_generation_kwargs(
+            self.__assistant_model, self.prompt_lookup_num_tokens
+        )
+        n_calls, num_return_sequences = (
+            (self.generate_settings.num_return_sequences, 1)
+            if assisted_kwargs
+            else (1, self.generate_settings.num_return_sequences)
+        )
+        generations: List[List[str]] = [[] for _ in to_generate]
+        for _ in range(n_calls):
+            call_generations = generate_batched(
+                self.__model,
+                self.__tokenizer,
+                [input_ids[i] for i in to_generate],
+                batch_size=self.batch_size,
+                max_tokens_per_batch=self.max_tokens_per_batch,
+                num_return_sequences=num_return_sequences,
+                decode=decode,
                 max_length=self.generate_settings.max_length,
                 num_beams=self.generate_settings.num_beams,
-                num_return_sequences=self.generate_settings.num_return_sequences,
                 early_stopping=self.generate_settings.early_stopping,
                 do_sample=self.generate_settings.do_sample,
                 temperature=self.generate_settings.temperature,
                 use_cache=True,
+                **assisted_kwargs,
             )
-
-        fillings_ids = generated_ids[:, input_len:]
-        fillings = self.__TOKENIZER.batch_decode(fillings_ids, skip_special_tokens=True)
-
-        if "<FILL_ME>" in prompt:
-            return [prompt.replace("<FILL_ME>", filling) for filling in fillings]
-        else:
-            return list(fillings)
-
-    def _generate_impl(self, prompts: List[str]) -> Any:
-        return [
-            self.__generate_patch(p)
-            for p in tqdm.tqdm(prompts, "Generating patches...", total=len(prompts))
-        ]
+            for fillings, call_fillings in zip(generations, call_generations):
+                fillings.extend(call_fillings)
+        for i, fillings in zip(to_generate, generations):
+            if "<FILL_ME>" in prompts[i]:
+                result[i] = [
+                    prompts[i].replace("<FILL_ME>", filling) for filling in fillings
+                ]
+            else:
+                result[i] = list(fillings)
+
+        return result
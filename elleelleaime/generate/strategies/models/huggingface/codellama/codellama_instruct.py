@@ -1,11 +1,14 @@
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.models.huggingface.batching import (
+    tokenize,
+    generate_batched,
+)
+from elleelleaime.generate.strategies.models.huggingface.model_registry import (
+    HuggingFaceModelRegistry,
+)
 from dataclasses import dataclass
-from peft import PeftModel
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import Any, List
+from typing import Any, List, Optional
 
-import tqdm
-import torch
 import logging
 
 
@@ -45,6 +48,10 @@ class CodeLLaMAIntruct(PatchGenerationStrategy):
         ), f"Model {model_name} not supported by {self.__class__.__name__}"
         self.model_name = model_name
         self.adapter_name = kwargs.get("adapter_name", None)
+        self.dtype = kwargs.get("dtype", "bfloat16")
+        self.merged_cache_dir = kwargs.get("merged_cache_dir", None)
+        self.__model: Any = None
+        self.__tokenizer: Any = None
 
         # Setup generation settings
         assert (
@@ -56,6 +63,7 @@ class CodeLLaMAIntruct(PatchGenerationStrategy):
             kwargs.get("generation_strategy", "sampling")
         ]
         self.batch_size = kwargs.get("batch_size", 1)
+        self.max_tokens_per_batch = kwargs.get("max_tokens_per_batch", None)
         self.generate_settings.num_return_sequences = kwargs.get(
             "num_return_sequences", GenerateSettings.num_return_sequences
         )
@@ -68,62 +76,93 @@ class CodeLLaMAIntruct(PatchGenerationStrategy):
         self.generate_settings.max_length = kwargs.get(
             "max_length", GenerateSettings.max_length
         )
+        # max_length counts the prompt, so part of it is kept for the generation
+        self.output_reserve = kwargs.get("output_reserve", 1024)
+
+    def prompts_per_batch(self) -> int:
+        return self.batch_size
 
     def __format_prompt(self, prompt: str) -> str:
         return f"<s>[INST] {prompt} [\\INST]"
 
-    def _generate_impl(self, chunk: List[str]) -> Any:
-        # Load model and tokenizer
-        m = AutoModelForCausalLM.from_pretrained(
+    def tokenizer_name(self) -> str:
+        return self.model_name
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        tokenizer = HuggingFaceModelRegistry.get_tokenizer(self.model_name)
+        return [
+            len(input_ids)
+            for input_ids in tokenize(
+                tokenizer, [self.__format_prompt(prompt) for prompt in prompts]
+            )
+        ]
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return self.generate_settings.max_length - self.output_reserve
+
+    def __load_model(self) -> None:
+        # The model is shared by all strategies using it in the process
+        if self.__model is not None:
+            return
+
+        m, tok = HuggingFaceModelRegistry.acquire(
             self.model_name,
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
+            adapter_name=self.adapter_name,
+            dtype=self.dtype,
+            merged_cache_dir=self.merged_cache_dir,
         )
-        # Load LoRA adapter if specified
-        if self.adapter_name:
-            m = PeftModel.from_pretrained(m, self.adapter_name)
-            m = m.merge_and_unload()
-        m.eval()
-
-        tok = AutoTokenizer.from_pretrained(self.model_name)
         tok.pad_token = tok.eos_token
+        self.__model, self.__tokenizer = m, tok
 
-        logging.info(f"Model successfully loaded: {m}")
+    def close(self) -> None:
+        if self.__model is None:
+            return
+        HuggingFaceModelRegistry.release(
+            self.model_name, adapter_name=self.adapter_name, dtype=self.dtype
+        )
+        self.__model, self.__tokenizer = None, None
 
-        # Generate patches
-        logging.info(f"Starting generation: {self.generate_settings}")
-        result = []
-        for prompt in tqdm.tqdm(chunk, "Generating patches...", total=len(chunk)):
-            with torch.no_grad():
-                # Tokenize prompt
-                inputs = tok(self.__format_prompt(prompt), return_tensors="pt")
-
-                # Skip prompt if it is too long
-                input_length = inputs["input_ids"].shape[1]
-                if input_length > self.generate_settings.max_length:
-                    result.append(None)
-                    logging.warning(
-                        f"Skipping prompt due to length: {input_length} is larger than {self.generate_settings.max_length}"
-                    )
-                    continue
-
-                # Generate patch
-                inputs = inputs.to("cuda")
-                outputs = m.generate(
-                    **inputs,
-                    max_length=self.generate_settings.max_length,
-                    num_beams=self.generate_settings.num_beams,
-                    num_return_sequences=self.generate_settings.num_return_sequences,
-                    early_stopping=self.generate_settings.early_stopping,
-                    do_sample=self.generate_settings.do_sample,
-                    temperature=self.generate_settings.temperature,
-                    use_cache=True,
+    def _generate_impl(self, chunk: List[str]) -> Any:
+        self.__load_model()
+        m, tok = self.__model, self.__tokenizer
+
+        # Skip prompts that are too long
+        prompts = [self.__format_prompt(prompt) for prompt in chunk]
+        input_ids = tokenize(tok, prompts)
+        result: List[Optional[List[str]]] = [None] * len(chunk)
+        to_generate = []
+        max_prompt_tokens = self.max_prompt_tokens()
+        for i, input_length in enumerate(len(ids) for ids in input_ids):
+            if input_length > max_prompt_tokens:
+                logging.warning(
+                    f"Skipping prompt due to length: {input_length} is larger than {max_prompt_tokens}"
                 )
+                continue
+            to_generate.append(i)
 
-                # Decode outputs and save
-                responses = tok.batch_decode(outputs, skip_special_tokens=True)
-                responses = [r.split("[\\INST]")[1] for r in responses]
-                result.append(responses)
+        def decode(outputs: Any, inputs: Any) -> List[str]:
+            responses = tok.batch_decode(outputs, skip_special_tokens=True)
+            return [r.split("[\\INST]")[1] for r in responses]
+
+        # Generate patches
+        logging.info(f"Starting generation: {self.generate_settings}")
+        generations = generate_batched(
+            m,
+            tok,
+            [input_ids[i] for i in to_generate],
+            batch_size=self.batch_size,
+            max_tokens_per_batch=self.max_tokens_per_batch,
+            num_return_sequences=self.generate_settings.num_return_sequences,
+            decode=decode,
+            max_length=self.generate_settings.max_length,
+            num_beams=self.generate_settings.num_beams,
+            early_stopping=self.generate_settings.early_stopping,
+            do_sample=self.generate_settings.do_sample,
+            temperature=self.generate_settings.temperature,
+            use_cache=True,
+        )
+        for i, responses in zip(to_generate, generations):
+            result[i] = responses
 
         # Return results
         return result
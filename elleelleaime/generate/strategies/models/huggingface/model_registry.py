@@ -0,0 +1,201 @@
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from typing import Any, Dict, Optional, Tuple
+
+import gc
+import os
+import re
+import torch
+import shutil
+import logging
+import threading
+
+# Models are identified by (model name, adapter name, dtype)
+ModelKey = Tuple[str, Optional[str], str]
+
+
+class HuggingFaceModelRegistry:
+    """
+    Process-wide registry of loaded HuggingFace models and tokenizers.
+
+    Each model is loaded once per process and shared by all the strategies that use it,
+    while different models (or the same model with different adapters or dtypes) can
+    coexist. Strategies acquire the models they use and release them when they are done,
+    and a model is unloaded once it is released by all of them. Models with a LoRA
+    adapter are merged once, and the merged weights can be saved as safetensors in
+    `merged_cache_dir` so that later runs load them directly.
+    """
+
+    __MODELS: Dict[ModelKey, Tuple[Any, Any]] = {}
+    __REFERENCES: Dict[ModelKey, int] = {}
+    __TOKENIZERS: Dict[str, Any] = {}
+    __LOCKS: Dict[ModelKey, threading.Lock] = {}
+    __LOCK: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def __merged_path(merged_cache_dir: str, key: ModelKey) -> str:
+        name = "--".join(str(part) for part in key)
+        return os.path.join(merged_cache_dir, re.sub(r"[^\w.-]", "_", name))
+
+    @staticmethod
+    def __load(key: ModelKey, merged_cache_dir: Optional[str]) -> Tuple[Any, Any]:
+        model_name, adapter_name, dtype = key
+        kwargs = dict(torch_dtype=getattr(torch, dtype), device_map="auto")
+
+        merged_path = None
+        if adapter_name and merged_cache_dir:
+            merged_path = HuggingFaceModelRegistry.__merged_path(merged_cache_dir, key)
+
+        if merged_path is not None and os.path.exists(merged_path):
+            logging.info(f"Loading merged model from {merged_path}")
+            m = AutoModelForCausalLM.from_pretrained(merged_path, **kwargs)
+        else:
+            m = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
+            # Load LoRA adapter if specified
+            if adapter_name:
+                m = PeftModel.from_pretrained(m, adapter_name)
+                m = m.merge_and_unload()
+                if merged_path is not None:
+                    # Save to a temporary directory first, so that an interrupted save
+                    # is not mistaken for a merged model
+                    tmp_path = f"{merged_path}.tmp"
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    m.save_pretrained(tmp_path, safe_serialization=True)
+                    os.replace(tmp_path, merged_path)
+                    logging.info(f"Saved merged model to {merged_path}")
+        m.eval()
+
+        tok = AutoTokenizer.from_pretrained(model_name)
+        return m, tok
+
+    @classmethod
+    def acquire(
+        cls,
+        model_name: str,
+        adapter_name: Optional[str] = None,
+        dtype: str = "bfloat16",
+        merged_cache_dir: Optional[str] = None,
+    ) -> Tuple[Any, Any]:
+        """
+        Returns the model and tokenizer for the given model, adapter and dtype, loading
+        them if they are not loaded yet. Each call must be matched by a call to `release`.
+
+        :param dtype: The name of the torch dtype to load the weights in.
+        :param merged_cache_dir: The directory where merged LoRA weights are cached.
+        """
+        key = (model_name, adapter_name, dtype)
+        with cls.__LOCK:
+            if key in cls.__MODELS:
+                cls.__REFERENCES[key] += 1
+                return cls.__MODELS[key]
+            lock = cls.__LOCKS.setdefault(key, threading.Lock())
+
+        # Models are loaded outside of the registry lock, so that loading a model does
+        # not block the strategies using other models
+        with lock:
+            with cls.__LOCK:
+                if key in cls.__MODELS:
+                    cls.__REFERENCES[key] += 1
+                    return cls.__MODELS[key]
+            model = cls.__load(key, merged_cache_dir)
+            logging.info(f"Model successfully loaded: {model[0]}")
+            with cls.__LOCK:
+                cls.__MODELS[key] = model
+                cls.__REFERENCES[key] = 1
+            return model
+
+    @classmethod
+    def get_tokenizer(cls, model_name: str) -> Any:
+        """
+        Returns the tokenizer of the given model, without loading the model.
+        """
+        with cls.__LOCK:
+            if model_name not in cls.__TOKENIZERS:
+                cls.__TOKENIZERS[model_name] = AutoTokenizer.from_pretrained(model_name)
+            return cls.__TOKENIZERS[model_name]
+
+    @classmethod
+    def release(
+        cls,
+        model_name: str,
+        adapter_name: Optional[str] = None,
+        dtype: str = "bfloat16",
+    ) -> None:
+        """
+        Releases a model acquired with `acquire`, and unloads it if it is not used
+        anymore.
+        """
+        key = (model_name, adapter_name, dtype)
+        with cls.__LOCK:
+            if key not in cls.__MODELS:
+                return
+            cls.__REFERENCES[key] -= 1
+            if cls.__REFERENCES[key] > 0:
+                return
+            # Unloaded in the same critical section, so that a concurrent `acquire`
+            # either shares the model or loads it again
+            del cls.__MODELS[key]
+            del cls.__REFERENCES[key]
+        logging.info(f"Model unloaded: {key}")
+        cls.__free_memory()
+
+    @classmethod
+    def evict(
+        cls,
+        model_name: str,
+        adapter_name: Optional[str] = None,
+        dtype: str = "bfloat16",
+    ) -> None:
+        """
+        Unloads a model, even if it is still acquired, and frees its memory. Strategies
+        still holding it keep their reference, and a new `acquire` loads it again.
+        """
+        key = (model_name, adapter_name, dtype)
+        with cls.__LOCK:
+            if key not in cls.__MODELS:
+                return
+            del cls.__MODELS[key]
+            del cls.__REFERENCES[key]
+        logging.info(f"Model unloaded: {key}")
+        cls.__free_memory()
+
+    @staticmethod
+    def __free_memory() -> None:
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @classmethod
+    def is_loaded(
+        cls,
+        model_name: str,
+        adapter_name: Optional[str] = None,
+        dtype: str = "bfloat16",
+    ) -> bool:
+        with cls.__LOCK:
+            return (model_name, adapter_name, dtype) in cls.__MODELS
+
+    @classmethod
+    def references(
+        cls,
+        model_name: str,
+        adapter_name: Optional[str] = None,
+        dtype: str = "bfloat16",
+    ) -> int:
+        """
+        Returns the number of strategies holding the model.
+        """
+        with cls.__LOCK:
+            return cls.__REFERENCES.get((model_name, adapter_name, dtype), 0)
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Unloads all models.
+        """
+        with cls.__LOCK:
+            cls.__MODELS.clear()
+            cls.__REFERENCES.clear()
+            cls.__TOKENIZERS.clear()
+            cls.__LOCKS.clear()
+        cls.__free_memory()
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from typing import Any, List
 
 import os
+import functools
 import mistralai
 import backoff
 
@@ -15,7 +16,12 @@ class MistralModels(PatchGenerationStrategy):
         self.n_samples = kwargs.get("n_samples", 1)
 
         load_dotenv()
-        self.client = mistralai.Mistral(os.getenv("MISTRAL_API_KEY", None))
+        self.api_key = os.getenv("MISTRAL_API_KEY", None)
+
+    @functools.cached_property
+    def client(self) -> mistralai.Mistral:
+        # Created on first use, so that the strategy can be built without credentials
+        return mistralai.Mistral(self.api_key)
 
     @backoff.on_exception(
         backoff.expo,
@@ -1,11 +1,94 @@
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.async_strategy import AsyncPatchGenerationStrategy
+from elleelleaime.generate.strategies.rate_limiter import get_rate_limit_controller
+from elleelleaime.generate.strategies.batch_job import read_batch_job, write_batch_job
 
 from dotenv import load_dotenv
-from typing import Any, List
+from typing import Any, List, Optional
 
 import os
+import functools
+import json
+import time
 import openai
 import backoff
+import logging
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Transient API errors, retried with exponential backoff (the SDK retries are disabled)
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+MAX_TRIES = 5
+# Rate limited requests are retried right away, as the rate limit controller waits
+RATE_LIMITED_MAX_TRIES = 10
+
+# Context window of the models, by model name prefix (the first matching prefix applies)
+CONTEXT_SIZES = [
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4-1106-preview", 128000),
+    ("gpt-4-0125-preview", 128000),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo", 16385),
+    ("o1-preview", 128000),
+    ("o1-mini", 128000),
+    ("o1", 200000),
+]
+# Tokens of the context kept for the completion when max_tokens is not configured
+DEFAULT_COMPLETION_RESERVE = 1024
+
+
+def _supports_n(model_name: str) -> bool:
+    # The beta versions of o1 models do not support n
+    return not model_name.startswith(("o1-preview", "o1-mini"))
+
+
+def _context_size(model_name: str) -> Optional[int]:
+    for prefix, context_size in CONTEXT_SIZES:
+        if model_name.startswith(prefix):
+            return context_size
+    return None
+
+
+def _max_prompt_tokens(model_name: str, max_tokens: Optional[int]) -> Optional[int]:
+    context_size = _context_size(model_name)
+    if context_size is None:
+        return None
+    return context_size - (max_tokens or DEFAULT_COMPLETION_RESERVE)
+
+
+def _encoding(model_name: str) -> Optional[Any]:
+    """
+    Returns the tiktoken encoding of the model, if tiktoken is installed and knows it.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return None
+
+
+def _count_tokens(model_name: str, prompts: List[str]) -> Optional[List[int]]:
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return None
+    return [len(ids) for ids in encoding.encode_batch(prompts, disallowed_special=())]
+
+
+def _tokenizer_name(model_name: str) -> Optional[str]:
+    encoding = _encoding(model_name)
+    return f"tiktoken:{encoding.name}" if encoding is not None else None
 
 
 class OpenAIChatCompletionModels(PatchGenerationStrategy):
@@ -13,37 +96,226 @@ class OpenAIChatCompletionModels(PatchGenerationStrategy):
         self.model_name = model_name
         self.temperature = kwargs.get("temperature", 0.0)
         self.n_samples = kwargs.get("n_samples", 1)
+        self.max_tokens = kwargs.get("max_tokens", None)
+        self.poll_interval = kwargs.get("poll_interval", 60)
+        self.base_url = kwargs.get("base_url", None)
+
+        self.rate_limit_controller = get_rate_limit_controller("openai", model_name)
 
         load_dotenv()
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = openai.OpenAI(api_key=openai.api_key)
+        self.api_key = os.getenv("OPENAI_API_KEY")
+
+    @functools.cached_property
+    def client(self) -> openai.OpenAI:
+        # Created on first use, so that the strategy can be built without credentials
+        # (e.g. to estimate costs). Rate limited requests are retried here, paced by
+        # the shared controller
+        return openai.OpenAI(
+            api_key=self.api_key, base_url=self.base_url, max_retries=0
+        )
 
-    @backoff.on_exception(backoff.expo, openai.RateLimitError)
+    @backoff.on_exception(
+        backoff.constant,
+        openai.RateLimitError,
+        interval=0,
+        max_tries=RATE_LIMITED_MAX_TRIES,
+    )
+    @backoff.on_exception(backoff.expo, TRANSIENT_ERRORS, max_tries=MAX_TRIES)
     def _completions_with_backoff(self, **kwargs):
-        return self.client.chat.completions.create(**kwargs)
+        self.rate_limit_controller.acquire()
+        try:
+            response = self.client.chat.completions.with_raw_response.create(**kwargs)
+        except openai.RateLimitError as e:
+            self.rate_limit_controller.throttle(e.response.headers)
+            raise
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
+        self.rate_limit_controller.update(response.headers)
+        return response.parse()
+
+    def __request(self, prompt: str) -> dict:
+        request = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+        }
+        if _supports_n(self.model_name):
+            request["n"] = self.n_samples
+        if self.max_tokens is not None:
+            request["max_completion_tokens"] = self.max_tokens
+        return request
+
+    def tokenizer_name(self) -> str:
+        return _tokenizer_name(self.model_name) or super().tokenizer_name()
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        return _count_tokens(self.model_name, prompts) or super().count_tokens(prompts)
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return _max_prompt_tokens(self.model_name, self.max_tokens)
+
+    def units_per_prompt(self) -> int:
+        if _supports_n(self.model_name):
+            return 1
+        return self.n_samples
+
+    def _generate_unit(self, prompt: str) -> Any:
+        completion = self._completions_with_backoff(**self.__request(prompt))
+        return completion.to_dict()
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        if _supports_n(self.model_name):
+            return units[0]
+        return units
+
+    def supports_batch_job(self) -> bool:
+        return True
+
+    def _generate_batch_job(self, chunk: List[str], job_file: Optional[str]) -> Any:
+        n_units = self.units_per_prompt()
+        batch_id = read_batch_job(job_file)
+        if batch_id is None:
+            requests = [
+                json.dumps(
+                    {
+                        "custom_id": f"{i}-{unit}",
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": self.__request(prompt),
+                    }
+                )
+                for i, prompt in enumerate(chunk)
+                for unit in range(n_units)
+            ]
+            input_file = self.client.files.create(
+                file=("batch.jsonl", "\n".join(requests).encode()), purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            batch_id = batch.id
+            write_batch_job(job_file, batch_id)
+            logging.info(f"Submitted batch {batch_id} with {len(requests)} requests")
+
+        # Expired batches still return the requests completed before expiring
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in {"completed", "expired"}:
+                break
+            if batch.status in {"failed", "cancelled"}:
+                raise RuntimeError(f"Batch {batch_id} {batch.status}: {batch.errors}")
+            logging.info(f"Batch {batch_id} is {batch.status}")
+            time.sleep(self.poll_interval)
+
+        # Requests that failed are None, as when the retries are exhausted
+        responses = {}
+        if batch.output_file_id is not None:
+            output = self.client.files.content(batch.output_file_id).text
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response")
+                if response is not None and response["status_code"] == 200:
+                    responses[result["custom_id"]] = response["body"]
+
+        return [
+            self._merge_units([responses.get(f"{i}-{unit}") for unit in range(n_units)])
+            for i in range(len(chunk))
+        ]
 
     def _generate_impl(self, chunk: List[str]) -> Any:
         result = []
 
         for prompt in chunk:
-            # TODO: Temporary fix to handle beta version of o1 models
-            if self.model_name.startswith("o1"):
-                result_sample = []
-                for _ in range(self.n_samples):
-                    completion = self._completions_with_backoff(
-                        model=self.model_name,
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=self.temperature,
-                    )
-                    result_sample.append(completion.to_dict())
-                result.append(result_sample)
-            else:
-                completion = self._completions_with_backoff(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=self.temperature,
-                    n=self.n_samples,
-                )
-                result.append(completion.to_dict())
+            units = [
+                self._generate_unit(prompt) for _ in range(self.units_per_prompt())
+            ]
+            result.append(self._merge_units(units))
 
         return result
+
+
+class AsyncOpenAIChatCompletionModels(AsyncPatchGenerationStrategy):
+    def __init__(self, model_name: str, **kwargs) -> None:
+        super().__init__("openai", model_name, **kwargs)
+        self.temperature = kwargs.get("temperature", 0.0)
+        self.n_samples = kwargs.get("n_samples", 1)
+        self.max_tokens = kwargs.get("max_tokens", None)
+        self.base_url = kwargs.get("base_url", None)
+
+        load_dotenv()
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.client: Optional[openai.AsyncOpenAI] = None
+        self.rate_limit_controller = get_rate_limit_controller("openai", model_name)
+
+    async def _astart(self) -> None:
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key, base_url=self.base_url, max_retries=0
+        )
+
+    async def _astop(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    @backoff.on_exception(
+        backoff.constant,
+        openai.RateLimitError,
+        interval=0,
+        max_tries=RATE_LIMITED_MAX_TRIES,
+    )
+    @backoff.on_exception(backoff.expo, TRANSIENT_ERRORS, max_tries=MAX_TRIES)
+    async def _completions_with_backoff(self, **kwargs):
+        assert self.client is not None
+        await self.rate_limit_controller.aacquire()
+        try:
+            response = await self.client.chat.completions.with_raw_response.create(
+                **kwargs
+            )
+        except openai.RateLimitError as e:
+            self.rate_limit_controller.throttle(e.response.headers)
+            raise
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
+        self.rate_limit_controller.update(response.headers)
+        return response.parse()
+
+    def tokenizer_name(self) -> str:
+        return _tokenizer_name(self.model_name) or super().tokenizer_name()
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        return _count_tokens(self.model_name, prompts) or super().count_tokens(prompts)
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        return _max_prompt_tokens(self.model_name, self.max_tokens)
+
+    def _requests_per_prompt(self) -> int:
+        if _supports_n(self.model_name):
+            return 1
+        return self.n_samples
+
+    async def _agenerate_request(self, prompt: str) -> Any:
+        request = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+        }
+        if _supports_n(self.model_name):
+            request["n"] = self.n_samples
+        if self.max_tokens is not None:
+            request["max_completion_tokens"] = self.max_tokens
+        completion = await self._completions_with_backoff(**request)
+        return completion.to_dict()
+
+    def _merge_requests(self, responses: List[Any]) -> Any:
+        if _supports_n(self.model_name):
+            return responses[0]
+        return responses
+
+    def _count_tokens(self, response: Any) -> Optional[int]:
+        return (response.get("usage") or {}).get("total_tokens")
@@ -1,14 +1,52 @@
 import requests.exceptions
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.async_strategy import AsyncPatchGenerationStrategy
+from elleelleaime.generate.strategies.rate_limiter import get_rate_limit_controller
 
 from dotenv import load_dotenv
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 
 import os
+import gzip
+import httpx
 import requests
+import requests.adapters
 import json
 import backoff
 
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Errors returned when requests are rate limited or the upstream provider is overloaded
+RATE_LIMIT_ERROR_CODES = {408, 429, 502}
+
+
+def _request_headers(api_key: Optional[str]) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        # For including your app on openrouter.ai rankings.
+        "HTTP-Referer": f"https://repairbench.github.io/",
+        # Shows in rankings on openrouter.ai.
+        "X-Title": f"RepairBench",
+        "Content-Type": "application/json",
+        "Accept-Encoding": "gzip",
+    }
+
+
+def _encode_body(body: dict, compress: bool) -> Tuple[bytes, dict]:
+    """
+    Serializes a request body, gzip-compressed if requested, and returns it with the
+    headers that describe its encoding.
+    """
+    data = json.dumps(body).encode()
+    if compress:
+        return gzip.compress(data), {"Content-Encoding": "gzip"}
+    return data, {}
+
 
 class OpenRouterModels(PatchGenerationStrategy):
     def __init__(self, model_name: str, **kwargs) -> None:
@@ -23,9 +61,23 @@ class OpenRouterModels(PatchGenerationStrategy):
         if self.provider:
             self.provider_args["order"] = [self.provider]
 
+        self.base_url = kwargs.get("base_url", "https://openrouter.ai/api/v1")
+        self.pool_size = kwargs.get("pool_size", 4)
+        self.compress_requests = kwargs.get("compress_requests", False)
+        self.rate_limit_controller = get_rate_limit_controller("openrouter", model_name)
+
         load_dotenv()
         self.openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
 
+        # Each worker has its own strategy, and so its own pool of kept-alive connections
+        self.session = requests.Session()
+        self.session.headers.update(_request_headers(self.openrouter_api_key))
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
     @backoff.on_exception(
         backoff.expo,
         (requests.exceptions.RequestException, json.JSONDecodeError, Exception),
@@ -33,38 +85,134 @@ class OpenRouterModels(PatchGenerationStrategy):
         raise_on_giveup=False,
     )
     def _completions_with_backoff(self, **kwargs):
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {self.openrouter_api_key}",
-                # For including your app on openrouter.ai rankings.
-                "HTTP-Referer": f"https://repairbench.github.io/",
-                # Shows in rankings on openrouter.ai.
-                "X-Title": f"RepairBench",
-            },
-            data=json.dumps(kwargs),
-        )
-
-        response = response.json()
+        self.rate_limit_controller.acquire()
+        try:
+            data, encoding_headers = _encode_body(kwargs, self.compress_requests)
+            response = self.session.post(
+                url=f"{self.base_url}/chat/completions",
+                data=data,
+                headers=encoding_headers,
+            )
+            headers = response.headers
+            response = response.json()
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
 
-        if "error" in response and response["error"]["code"] in {408, 429, 502}:
+        if "error" in response and response["error"]["code"] in RATE_LIMIT_ERROR_CODES:
+            self.rate_limit_controller.throttle(headers)
             raise Exception(response["error"])
+        self.rate_limit_controller.update(headers)
 
         return response
 
+    def units_per_prompt(self) -> int:
+        return self.n_samples
+
+    def _generate_unit(self, prompt: str) -> Any:
+        return self._completions_with_backoff(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            provider=self.provider_args,
+        )
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        return units
+
     def _generate_impl(self, chunk: List[str]) -> Any:
         result = []
 
         for prompt in chunk:
             result_sample = []
             for _ in range(self.n_samples):
-                completion = self._completions_with_backoff(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=self.temperature,
-                    provider=self.provider_args,
-                )
-                result_sample.append(completion)
+                result_sample.append(self._generate_unit(prompt))
             result.append(result_sample)
 
         return result
+
+
+class AsyncOpenRouterModels(AsyncPatchGenerationStrategy):
+    def __init__(self, model_name: str, **kwargs) -> None:
+        super().__init__("openrouter", model_name, **kwargs)
+        self.temperature = kwargs.get("temperature", 0.0)
+        self.n_samples = kwargs.get("n_samples", 1)
+        self.provider = kwargs.get("provider", None)
+        self.provider_args = {
+            "require_parameters": True,
+            "allow_fallbacks": False,
+        }
+        if self.provider:
+            self.provider_args["order"] = [self.provider]
+        self.base_url = kwargs.get("base_url", "https://openrouter.ai/api/v1")
+        self.pool_size = kwargs.get("pool_size", self.max_concurrency)
+        self.compress_requests = kwargs.get("compress_requests", False)
+
+        load_dotenv()
+        self.openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+        self.client: Optional[httpx.AsyncClient] = None
+        self.rate_limit_controller = get_rate_limit_controller("openrouter", model_name)
+
+    async def _astart(self) -> None:
+        # Requests are multiplexed over a single connection with HTTP/2 if available
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=_request_headers(self.openrouter_api_key),
+            timeout=httpx.Timeout(600.0),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+            http2=HTTP2_AVAILABLE,
+        )
+
+    async def _astop(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @backoff.on_exception(
+        backoff.expo,
+        (httpx.HTTPError, json.JSONDecodeError, Exception),
+        max_tries=5,
+        raise_on_giveup=False,
+    )
+    async def _completions_with_backoff(self, **kwargs):
+        assert self.client is not None
+        await self.rate_limit_controller.aacquire()
+        try:
+            data, encoding_headers = _encode_body(kwargs, self.compress_requests)
+            response = await self.client.post(
+                "/chat/completions", content=data, headers=encoding_headers
+            )
+            headers = response.headers
+            response = response.json()
+        except Exception:
+            self.rate_limit_controller.release()
+            raise
+
+        if "error" in response and response["error"]["code"] in RATE_LIMIT_ERROR_CODES:
+            self.rate_limit_controller.throttle(headers)
+            raise Exception(response["error"])
+        self.rate_limit_controller.update(headers)
+
+        return response
+
+    def _requests_per_prompt(self) -> int:
+        return self.n_samples
+
+    async def _agenerate_request(self, prompt: str) -> Any:
+        return await self._completions_with_backoff(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            provider=self.provider_args,
+        )
+
+    def _merge_requests(self, responses: List[Any]) -> Any:
+        return responses
+
+    def _count_tokens(self, response: Any) -> Optional[int]:
+        if not response:
+            return None
+        return (response.get("usage") or {}).get("total_tokens")
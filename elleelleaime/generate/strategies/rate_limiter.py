@@ -0,0 +1,392 @@
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+import re
+import time
+import asyncio
+import logging
+import threading
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter of requests per minute and tokens per minute.
+
+    Each bucket holds at most one minute worth of budget and refills continuously.
+    The limiter is thread-safe and does not depend on an event loop, so that it can be
+    shared by strategies running in different threads (and event loops).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.__requests = requests_per_minute or 0.0
+        self.__tokens = tokens_per_minute or 0.0
+        self.__last_refill = clock()
+        self.__lock = threading.Lock()
+
+    def __refill(self) -> None:
+        now = self.clock()
+        elapsed = now - self.__last_refill
+        self.__last_refill = now
+        if self.requests_per_minute:
+            self.__requests = min(
+                self.requests_per_minute,
+                self.__requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self.__tokens = min(
+                self.tokens_per_minute,
+                self.__tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """
+        Takes one request and the given number of tokens from the buckets if available.
+        Returns 0 if they were taken, or else the number of seconds to wait before retrying.
+        """
+        with self.__lock:
+            self.__refill()
+            wait = 0.0
+            if self.requests_per_minute and self.__requests < 1:
+                wait = max(wait, (1 - self.__requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute:
+                # Requests larger than the bucket only wait for a full bucket
+                tokens = min(tokens, int(self.tokens_per_minute))
+                if self.__tokens < tokens:
+                    wait = max(
+                        wait, (tokens - self.__tokens) * 60 / self.tokens_per_minute
+                    )
+            if wait > 0:
+                return wait
+
+            if self.requests_per_minute:
+                self.__requests -= 1
+            if self.tokens_per_minute:
+                self.__tokens -= tokens
+            return 0.0
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """
+        Waits until one request and the given number of tokens are available, and takes them.
+        """
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def adjust(self, tokens: int) -> None:
+        """
+        Takes (or gives back, if negative) tokens from the bucket, e.g. to account for
+        the difference between the estimated and the actual usage of a request.
+        """
+        if not self.tokens_per_minute:
+            return
+        with self.__lock:
+            self.__refill()
+            self.__tokens = min(self.tokens_per_minute, self.__tokens - tokens)
+
+
+# Limiters are shared per (provider, model, limits) so that all workers respect the same
+# limits, and strategies configured with other limits get their own
+_RateLimiterKey = Tuple[str, str, Optional[float], Optional[float]]
+_RATE_LIMITERS: Dict[_RateLimiterKey, RateLimiter] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(
+    provider: str,
+    model_name: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+) -> RateLimiter:
+    """
+    Returns the rate limiter of the given provider, model and limits, creating it if
+    needed.
+    """
+    key = (provider, model_name, requests_per_minute, tokens_per_minute)
+    with _RATE_LIMITERS_LOCK:
+        if key not in _RATE_LIMITERS:
+            _RATE_LIMITERS[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _RATE_LIMITERS[key]
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """
+    Parses durations such as "20ms", "1s" or "6m0.5s" (OpenAI), and plain numbers of
+    seconds.
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def _parse_reset(value: str, now: float) -> Optional[float]:
+    """
+    Parses the time until a limit resets, in seconds from `now` (a wall-clock time).
+    Resets are given as durations (OpenAI), RFC 3339 timestamps (Anthropic) or epoch
+    timestamps in milliseconds (OpenRouter).
+    """
+    seconds = _parse_duration(value)
+    if seconds is not None:
+        if seconds > 1e12:
+            return seconds / 1000 - now
+        if seconds > 1e9:
+            return seconds - now
+        return seconds
+    try:
+        return (
+            datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+            - now
+        )
+    except ValueError:
+        return None
+
+
+def _parse_retry_after(headers: Mapping[str, str], now: float) -> Optional[float]:
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            try:
+                return parsedate_to_datetime(headers["retry-after"]).timestamp() - now
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+# Header names of the limit, remaining budget and reset of each limit, per provider
+_LIMIT_HEADERS = {
+    "requests": [
+        # OpenAI
+        (
+            "x-ratelimit-limit-requests",
+            "x-ratelimit-remaining-requests",
+            "x-ratelimit-reset-requests",
+        ),
+        # Anthropic
+        (
+            "anthropic-ratelimit-requests-limit",
+            "anthropic-ratelimit-requests-remaining",
+            "anthropic-ratelimit-requests-reset",
+        ),
+        # OpenRouter
+        ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset"),
+    ],
+    "tokens": [
+        (
+            "x-ratelimit-limit-tokens",
+            "x-ratelimit-remaining-tokens",
+            "x-ratelimit-reset-tokens",
+        ),
+        (
+            "anthropic-ratelimit-tokens-limit",
+            "anthropic-ratelimit-tokens-remaining",
+            "anthropic-ratelimit-tokens-reset",
+        ),
+    ],
+}
+
+
+class AdaptiveRateLimitController:
+    """
+    Paces the requests to a provider from the rate limits it reports.
+
+    Every response updates the remaining budget of the request and token limits from its
+    headers. Providers replenish budgets steadily until they are full at the reset time
+    (token buckets), so the budget is estimated between responses from the replenish
+    rate. Requests take their cost from the estimated budget when they are scheduled,
+    and once it falls below a small margin, requests are scheduled at the rate the
+    budget is replenished. When a request is rate limited anyway, all the requests
+    sharing the controller are paused, for the time requested by the provider or else
+    for an exponentially growing time.
+
+    Controllers are shared per (provider, model), so that all workers are paced together.
+    """
+
+    def __init__(
+        self,
+        margin: float = 0.05,
+        max_pause: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        # Fraction of each limit that is kept unused, for the requests in flight
+        self.margin = margin
+        self.max_pause = max_pause
+        self.clock = clock
+        self.wall_clock = wall_clock
+        # Limit, remaining budget, replenish rate, time of the update and reset time
+        # (on `clock`) of each limit
+        self.__limits: Dict[str, Tuple[float, float, float, float, float]] = {}
+        # Cost of the requests scheduled and not answered yet, which responses do not
+        # account for
+        self.__in_flight = {"requests": 0.0, "tokens": 0.0}
+        self.__paused_until = 0.0
+        self.__consecutive_throttles = 0
+        self.__statistics = {"requests": 0, "throttled": 0, "waited": 0.0}
+        self.__lock = threading.Lock()
+
+    def __schedule(self, now: float, tokens: int) -> float:
+        """
+        Takes the cost of a request from the budgets, and returns the earliest time it
+        can be sent.
+        """
+        ready = now
+        for name, (limit, remaining, rate, updated, reset) in list(
+            self.__limits.items()
+        ):
+            cost = 1 if name == "requests" else tokens
+            if rate > 0:
+                remaining = min(limit, remaining + rate * (now - updated))
+            elif reset <= now:
+                remaining = limit
+            available = remaining - limit * self.margin
+            if available < cost or (cost == 0 and available <= 0):
+                # Wait until the missing budget is replenished
+                if rate > 0:
+                    ready = max(ready, now + (max(cost, 1) - available) / rate)
+                else:
+                    ready = max(ready, reset)
+            self.__limits[name] = (limit, remaining - cost, rate, now, reset)
+        return ready
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves the next slot to send a request estimated to use the given number of
+        tokens, and returns the number of seconds to wait until it.
+        """
+        with self.__lock:
+            now = self.clock()
+            start = max(self.__schedule(now, tokens), self.__paused_until)
+            self.__in_flight["requests"] += 1
+            self.__in_flight["tokens"] += tokens
+            self.__statistics["requests"] += 1
+            self.__statistics["waited"] += start - now
+            return start - now
+
+    def acquire(self, tokens: int = 0) -> None:
+        """
+        Waits until a request can be sent.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """
+        Waits until a request can be sent, without blocking the event loop.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def __complete(self) -> None:
+        # Requests are answered in any order, so each takes an average share of the cost
+        if self.__in_flight["requests"] >= 1:
+            self.__in_flight["tokens"] -= (
+                self.__in_flight["tokens"] / self.__in_flight["requests"]
+            )
+            self.__in_flight["requests"] -= 1
+
+    def release(self) -> None:
+        """
+        Marks a request as answered, when it failed without a response to update from.
+        """
+        with self.__lock:
+            self.__complete()
+
+    def update(self, headers: Optional[Mapping[str, str]]) -> None:
+        """
+        Marks a request as answered, and updates the limits from the headers of its
+        response.
+        """
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        with self.__lock:
+            self.__complete()
+            now = self.clock()
+            wall_now = self.wall_clock()
+            self.__consecutive_throttles = 0
+            for name, candidates in _LIMIT_HEADERS.items():
+                for limit_header, remaining_header, reset_header in candidates:
+                    if remaining_header not in headers:
+                        continue
+                    try:
+                        remaining = float(headers[remaining_header])
+                        limit = float(headers.get(limit_header, remaining))
+                    except ValueError:
+                        continue
+                    reset = _parse_reset(headers.get(reset_header, ""), wall_now)
+                    if reset is None:
+                        continue
+                    reset = max(0.0, reset)
+                    rate = (limit - remaining) / reset if reset > 0 else 0.0
+                    # Requests still in flight will take their cost from the budget
+                    remaining -= self.__in_flight[name]
+                    self.__limits[name] = (limit, remaining, rate, now, now + reset)
+                    break
+
+    def throttle(self, headers: Optional[Mapping[str, str]] = None) -> None:
+        """
+        Marks a request as answered after it was rate limited, and pauses all requests
+        for the time given by the `retry-after` header if any, or else for an
+        exponentially growing time.
+        """
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        with self.__lock:
+            self.__complete()
+            now = self.clock()
+            self.__consecutive_throttles += 1
+            self.__statistics["throttled"] += 1
+            pause = _parse_retry_after(headers, self.wall_clock())
+            if pause is None:
+                pause = 2 ** (self.__consecutive_throttles - 1)
+            pause = min(self.max_pause, max(0.0, pause))
+            self.__paused_until = max(self.__paused_until, now + pause)
+        logging.warning(f"Rate limited, pausing requests for {pause:.1f}s")
+
+    def get_statistics(self) -> Dict[str, float]:
+        """
+        Returns the number of requests, the number of requests that were rate limited,
+        and the total time requests waited for.
+        """
+        with self.__lock:
+            return dict(self.__statistics)
+
+
+_CONTROLLERS: Dict[Tuple[str, str], AdaptiveRateLimitController] = {}
+_CONTROLLERS_LOCK = threading.Lock()
+
+
+def get_rate_limit_controller(
+    provider: str, model_name: str
+) -> AdaptiveRateLimitController:
+    """
+    Returns the rate limit controller of the given provider and model, creating it if
+    needed.
+    """
+    key = (provider, model_name)
+    with _CONTROLLERS_LOCK:
+        if key not in _CONTROLLERS:
+            _CONTROLLERS[key] = AdaptiveRateLimitController()
+        return _CONTROLLERS[key]
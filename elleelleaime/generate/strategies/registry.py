@@ -1,6 +1,7 @@
 from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
 from elleelleaime.generate.strategies.models.openai.openai import (
     OpenAIChatCompletionModels,
+    AsyncOpenAIChatCompletionModels,
 )
 from elleelleaime.generate.strategies.models.google.google import (
     GoogleModels,
@@ -13,9 +14,11 @@ from elleelleaime.generate.strategies.models.huggingface.codellama.codellama_ins
 )
 from elleelleaime.generate.strategies.models.openrouter.openrouter import (
     OpenRouterModels,
+    AsyncOpenRouterModels,
 )
 from elleelleaime.generate.strategies.models.anthropic.anthropic import (
     AnthropicModels,
+    AsyncAnthropicModels,
 )
 from elleelleaime.generate.strategies.models.mistral.mistral import (
     MistralModels,
@@ -39,6 +42,12 @@ class PatchGenerationStrategyRegistry:
         "codellama-instruct": (CodeLLaMAIntruct, ("model_name",)),
         "anthropic": (AnthropicModels, ("model_name", "max_tokens")),
         "mistral": (MistralModels, ("model_name",)),
+        "openai-chatcompletion-async": (
+            AsyncOpenAIChatCompletionModels,
+            ("model_name",),
+        ),
+        "openrouter-async": (AsyncOpenRouterModels, ("model_name",)),
+        "anthropic-async": (AsyncAnthropicModels, ("model_name", "max_tokens")),
     }
 
     @classmethod
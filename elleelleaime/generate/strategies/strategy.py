@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from typing import List, Any, final
+from typing import List, Any, Optional, final
 
 
 class PatchGenerationStrategy(ABC):
@@ -19,6 +19,97 @@ class PatchGenerationStrategy(ABC):
         """
         return None
 
+    def prompts_per_batch(self) -> int:
+        """
+        Number of prompts that are best generated together in one call to `generate`.
+        """
+        return 1
+
+    def units_per_prompt(self) -> int:
+        """
+        Number of independent requests the generation for one prompt is made of
+        (e.g. one per sample for providers that do not support returning many samples).
+        Units can be generated concurrently and are merged with `_merge_units`.
+        """
+        return 1
+
+    def requests_per_prompt(self) -> int:
+        """
+        Number of requests sent to the model to generate one prompt.
+        """
+        return self.units_per_prompt()
+
+    def _generate_unit(self, prompt: str) -> Any:
+        """
+        Generates one unit of the generation for the given prompt.
+        """
+        return self._generate_impl([prompt])[0]
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        """
+        Merges the units generated for a prompt into its generation.
+        """
+        return units[0]
+
+    def tokenizer_name(self) -> str:
+        """
+        Name of the tokenizer used by `count_tokens`, under which the counts are recorded
+        in the samples.
+        """
+        return "estimate"
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        """
+        Counts the tokens of the given prompts with the tokenizer of the model. By default,
+        the counts are estimated at 4 characters per token, which undercounts code.
+        """
+        return [len(prompt) // 4 for prompt in prompts]
+
+    def max_prompt_tokens(self) -> Optional[int]:
+        """
+        Maximum number of tokens of a prompt that leaves room for the generation in the
+        context of the model, or None if unknown.
+        """
+        return None
+
+    def close(self) -> None:
+        """
+        Releases the resources held by the strategy (e.g. loaded models). The strategy
+        must not be used after it is closed.
+        """
+        pass
+
+    def supports_batch_job(self) -> bool:
+        """
+        Whether the strategy can generate all prompts at once in an offline batch job.
+        """
+        return False
+
+    def _generate_batch_job(self, chunk: List[str], job_file: Optional[str]) -> Any:
+        """
+        Submits a batch job generating all the given prompts, waits for it to finish and
+        returns the generations in the same shape as `generate`. The job identifier is
+        recorded in `job_file`, and a job already recorded there is polled instead of
+        submitting a new one.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support batch jobs"
+        )
+
+    @final
+    def generate_batch_job(
+        self, chunk: List[str], job_file: Optional[str] = None
+    ) -> Any:
+        return self._generate_batch_job(chunk, job_file)
+
+    @final
+    def generate_unit(self, prompt: str) -> Any:
+        return self._generate_unit(prompt)
+
+    @final
+    def merge_units(self, units: List[Any]) -> Any:
+        return self._merge_units(units)
+
     @final
     def generate(self, chunk: List[str]) -> Any:
         """
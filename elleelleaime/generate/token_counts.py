@@ -0,0 +1,70 @@
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+
+from typing import List, Optional
+
+import tqdm
+import logging
+
+# Reason recorded in the samples that are not generated because their prompt is too long
+PROMPT_TOO_LONG = "prompt_too_long"
+
+
+def get_prompt_tokens(sample: dict, tokenizer_name: str) -> Optional[int]:
+    """
+    Returns the number of tokens of the prompt of the sample counted with the given
+    tokenizer, if it was counted.
+    """
+    return sample.get("prompt_tokens", {}).get(tokenizer_name)
+
+
+def count_prompt_tokens(
+    samples: List[dict],
+    strategy: PatchGenerationStrategy,
+    batch_size: int = 1000,
+) -> None:
+    """
+    Counts the tokens of the prompts of the samples with the tokenizer of the strategy,
+    in batches of `batch_size` prompts, and records them in
+    sample["prompt_tokens"][tokenizer name]. Samples already counted with the same
+    tokenizer are not counted again.
+    """
+    tokenizer_name = strategy.tokenizer_name()
+    to_count = [
+        sample
+        for sample in samples
+        if sample["prompt"] and get_prompt_tokens(sample, tokenizer_name) is None
+    ]
+    for i in tqdm.tqdm(
+        range(0, len(to_count), batch_size), f"Counting tokens ({tokenizer_name})..."
+    ):
+        batch = to_count[i : i + batch_size]
+        counts = strategy.count_tokens([sample["prompt"] for sample in batch])
+        for sample, count in zip(batch, counts):
+            sample.setdefault("prompt_tokens", {})[tokenizer_name] = count
+
+
+def skip_oversized_prompts(
+    samples: List[dict], strategy: PatchGenerationStrategy
+) -> int:
+    """
+    Marks the samples whose prompt does not fit in the context of the model of the
+    strategy, so that they are not generated, and returns their number. The prompts must
+    have been counted with `count_prompt_tokens`.
+    """
+    max_prompt_tokens = strategy.max_prompt_tokens()
+    if max_prompt_tokens is None:
+        return 0
+
+    tokenizer_name = strategy.tokenizer_name()
+    n_skipped = 0
+    for sample in samples:
+        n_tokens = get_prompt_tokens(sample, tokenizer_name)
+        if n_tokens is not None and n_tokens > max_prompt_tokens:
+            sample["generation"] = None
+            sample["skip_reason"] = PROMPT_TOO_LONG
+            n_skipped += 1
+    if n_skipped > 0:
+        logging.warning(
+            f"Skipping {n_skipped} samples with prompts longer than {max_prompt_tokens} tokens"
+        )
+    return n_skipped
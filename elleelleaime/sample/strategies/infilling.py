@@ -3,6 +3,7 @@ from unidiff import PatchSet
 import re
 
 from elleelleaime.sample.strategy import PromptingStrategy
+from elleelleaime.core.caching.checkout_store import get_checkout_store
 from elleelleaime.core.benchmarks.bug import Bug
 from elleelleaime.core.utils.java.java import (
     extract_single_function,
@@ -36,6 +37,11 @@ class InfillingPrompting(PromptingStrategy):
         self.extra_mask_token: bool = model_kwargs.get("extra_mask_token", False)
         self.keep_buggy_code: bool = kwargs.get("keep_buggy_code", False)
         self.keep_comments: bool = kwargs.get("keep_comments", True)
+        self.checkout_store = (
+            get_checkout_store(kwargs.get("checkout_store_path", None))
+            if kwargs.get("use_checkout_store", True)
+            else None
+        )
 
     def generate_masking_prompt(self, line_to_replace: str, mask_id: int) -> str:
         """Generate the mask token to be inserted, according to the mask idx."""
@@ -151,7 +157,7 @@ class InfillingPrompting(PromptingStrategy):
         Returns:
             Tuple: A tuple of the form (buggy_code, fixed_code, prompt).
         """
-        result = extract_single_function(bug)
+        result = extract_single_function(bug, store=self.checkout_store)
 
         if result is None:
             return None, None, None
@@ -2,11 +2,9 @@ from typing import Optional, Tuple
 from unidiff import PatchSet
 
 from elleelleaime.sample.strategy import PromptingStrategy
+from elleelleaime.core.caching.checkout_store import get_checkout_store
 from elleelleaime.core.benchmarks.bug import RichBug
-from elleelleaime.core.utils.java.java import (
-    extract_single_function,
-    extract_failing_test_cases,
-)
+from elleelleaime.core.utils.java.java import ExtractionSession
 
 
 class InstructPrompting(PromptingStrategy):
@@ -16,6 +14,11 @@ class InstructPrompting(PromptingStrategy):
 
     def __init__(self, **kwargs):
         super().__init__("instruct")
+        self.checkout_store = (
+            get_checkout_store(kwargs.get("checkout_store_path", None))
+            if kwargs.get("use_checkout_store", True)
+            else None
+        )
 
     def instruct(
         self, bug: RichBug
@@ -28,13 +31,16 @@ class InstructPrompting(PromptingStrategy):
         Returns:
             Tuple: A tuple of the form (buggy_code, fixed_code, prompt).
         """
-        result = extract_single_function(bug)
-        if result is None:
-            return None, None, None
+        # Extract the function and the failing tests from the same checkouts
+        with ExtractionSession(bug, store=self.checkout_store) as session:
+            result = session.extract_single_function()
+            if result is None:
+                return None, None, None
+
+            buggy_code, fixed_code = result
 
-        buggy_code, fixed_code = result
+            failing_test_cases = session.extract_failing_test_cases()
 
-        failing_test_cases = extract_failing_test_cases(bug)
         failing_test_causes = bug.get_failing_tests()
         if len(failing_test_causes) == 0 or len(failing_test_cases) == 0:
             return None, None, None
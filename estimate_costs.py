@@ -0,0 +1,171 @@
+from elleelleaime.core.utils.jsonl import stream_jsonl
+from elleelleaime.export.cost.cost_calculator import CostCalculator
+from elleelleaime.generate.strategies.registry import PatchGenerationStrategyRegistry
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.token_counts import (
+    count_prompt_tokens,
+    get_prompt_tokens,
+    skip_oversized_prompts,
+)
+
+from typing import List, Optional
+
+import fire
+import sys
+import json
+import logging
+
+
+def get_prices(strategy_name: str, model_name: str) -> Optional[dict]:
+    """
+    Returns the prices of the model, looked up in the cost tables of the provider of the
+    strategy (OpenRouter models are also looked up without their organization).
+    """
+    provider = strategy_name.removesuffix("-async")
+    return CostCalculator.get_prices(provider, model_name) or CostCalculator.get_prices(
+        provider, model_name.split("/")[-1]
+    )
+
+
+def estimate_run(
+    samples: List[dict],
+    strategy: PatchGenerationStrategy,
+    prices: Optional[dict],
+    n_samples: int = 1,
+    completion_tokens: int = 500,
+    n_workers: int = 1,
+    concurrency: int = 1,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    latency: float = 2.0,
+    output_tokens_per_second: float = 50.0,
+) -> dict:
+    """
+    Projects the tokens, cost and duration of generating the samples, whose prompts must
+    have been counted with `count_prompt_tokens`.
+
+    Each generated sample is assumed to have `completion_tokens` tokens, and each request
+    to take `latency` seconds plus the time to generate its samples at
+    `output_tokens_per_second`. Requests are sent by `n_workers` workers, `concurrency`
+    at a time each, and the duration is bounded by the rate limits.
+    """
+    tokenizer_name = strategy.tokenizer_name()
+    requests_per_prompt = strategy.requests_per_prompt()
+    cache_prompt = getattr(strategy, "cache_prompt", False) and requests_per_prompt > 1
+
+    n_prompts = 0
+    n_requests = 0
+    # Input tokens billed at the regular price, written to and read from the cache
+    input_tokens = cache_write_tokens = cached_tokens = 0
+    for sample in samples:
+        n_tokens = get_prompt_tokens(sample, tokenizer_name)
+        if n_tokens is None or "skip_reason" in sample:
+            continue
+        n_prompts += 1
+        n_requests += requests_per_prompt
+        if cache_prompt:
+            # The first request writes the prompt to the cache, the others read it
+            cache_write_tokens += n_tokens
+            cached_tokens += n_tokens * (requests_per_prompt - 1)
+        else:
+            input_tokens += n_tokens * requests_per_prompt
+    output_tokens = n_prompts * n_samples * completion_tokens
+
+    estimate = {
+        "prompts": n_prompts,
+        "requests": n_requests,
+        "input_tokens": input_tokens + cache_write_tokens + cached_tokens,
+        "cached_input_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+    }
+
+    if prices is not None:
+        estimate["prompt_cost"] = (
+            prices["prompt"] * input_tokens
+            + prices.get("cache_write_prompt", prices["prompt"]) * cache_write_tokens
+            + prices.get("cached_prompt", prices["prompt"]) * cached_tokens
+        ) / 1000000
+        estimate["completion_cost"] = prices["completion"] * output_tokens / 1000000
+        estimate["total_cost"] = estimate["prompt_cost"] + estimate["completion_cost"]
+
+    # The duration is bounded by the requests in flight and by each rate limit
+    samples_per_request = n_samples / requests_per_prompt
+    request_seconds = (
+        latency + samples_per_request * completion_tokens / output_tokens_per_second
+    )
+    durations = {
+        "latency": n_requests * request_seconds / (n_workers * concurrency),
+    }
+    if requests_per_minute:
+        durations["requests_per_minute"] = n_requests * 60 / requests_per_minute
+    if tokens_per_minute:
+        durations["tokens_per_minute"] = (
+            (estimate["input_tokens"] + output_tokens) * 60 / tokens_per_minute
+        )
+    bound = max(durations, key=lambda name: durations[name])
+    estimate["duration_seconds"] = durations[bound]
+    estimate["duration_bound"] = bound
+
+    return estimate
+
+
+def entry_point(
+    samples_path: str,
+    strategy_name: str,
+    n_samples: int = 1,
+    n_workers: int = 1,
+    completion_tokens: int = 500,
+    latency: float = 2.0,
+    output_tokens_per_second: float = 50.0,
+    **kwargs,
+):
+    """
+    Estimates, without sending any request, the tokens, cost and duration of generating
+    the patches for the samples in samples_path with the given strategy and arguments
+    (the same as for generate_patches.py).
+
+    Prompts are tokenized locally (see `PatchGenerationStrategy.count_tokens`) and
+    prompts that do not fit in the context of the model are left out. No API client is
+    created, so no credentials are needed. The output length,
+    request latency and generation speed are assumptions, to be adjusted to the model.
+    The rate limits and concurrency are read from `requests_per_minute`,
+    `tokens_per_minute` and `max_concurrency`, as configured for the strategy.
+    """
+    samples = list(stream_jsonl(samples_path))
+    strategy = PatchGenerationStrategyRegistry.get_generation(
+        strategy_name, n_samples=n_samples, **kwargs
+    )
+    model_name = kwargs.get("model_name", "")
+    prices = get_prices(strategy_name, model_name)
+    if prices is None:
+        logging.warning(f"No prices found for {model_name}, costs are not estimated")
+
+    try:
+        count_prompt_tokens(samples, strategy)
+        skip_oversized_prompts(samples, strategy)
+        estimate = estimate_run(
+            samples,
+            strategy,
+            prices,
+            n_samples=n_samples,
+            completion_tokens=completion_tokens,
+            n_workers=n_workers,
+            concurrency=getattr(strategy, "max_concurrency", 1),
+            requests_per_minute=kwargs.get("requests_per_minute", None),
+            tokens_per_minute=kwargs.get("tokens_per_minute", None),
+            latency=latency,
+            output_tokens_per_second=output_tokens_per_second,
+        )
+        estimate["tokenizer"] = strategy.tokenizer_name()
+    finally:
+        strategy.close()
+    print(json.dumps(estimate, indent=4))
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    fire.Fire(entry_point)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from elleelleaime.core.utils.benchmarks import get_benchmark
 from elleelleaime.core.benchmarks.bug import Bug
-from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl
+from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl, recover_jsonl
 from elleelleaime.evaluate.strategies.registry import PatchEvaluationStrategyRegistry
+from elleelleaime.evaluate.scheduler import EvaluationScheduler
 
 from pathlib import Path
+from typing import Iterator
 
 import numpy as np
 import fire
@@ -34,11 +35,19 @@ def entry_point(
     samples_path: str,
     strategy: str,
     n_workers: int = 4,
+    candidates_per_task: int = 0,
+    max_in_flight: int = 64,
+    resume: bool = True,
     **kwargs,
 ):
     """
     Evaluates the candidate patches given the samples,
     and writes the results to f"evaluation_{benchmark}_{prompt_strategy}_{model_name}.jsonl"
+
+    Candidates are evaluated in `n_workers` processes, one sample per task, or in tasks
+    of at most `candidates_per_task` generations of a sample if set. Samples are read lazily, at most `max_in_flight` at a time,
+    and appended to the output in input order as soon as they are evaluated.
+    If `resume` is set, the samples already in the output are not evaluated again.
     """
     # Get the benchmark, check if it exists, and initialize it
     samples_file_name = os.path.basename(samples_path)
@@ -46,38 +55,49 @@ def entry_point(
     prompt_strategy = samples_file_name.split("_")[2].split(".")[0]
     model_name = samples_file_name.split("_")[3].split(".")[0]
 
-    # Read the samples
-    logging.info("Reading samples...")
-    samples = list(stream_jsonl(samples_path))
+    output_path = os.path.join(
+        dir_path, f"evaluation_{benchmark}_{prompt_strategy}_{model_name}.jsonl"
+    )
 
     benchmark_obj = get_benchmark(benchmark)
     if benchmark_obj is None:
         raise ValueError(f"Unknown benchmark {benchmark}")
     benchmark_obj.initialize()
 
-    with ThreadPoolExecutor(max_workers=n_workers) as executor:
-        futures = []
-        for sample in tqdm.tqdm(samples, "Lauching candidate evaluation..."):
-            bug = benchmark_obj.get_bug(sample["identifier"])
-            if bug is None:
+    # Skip the samples evaluated by a previous run, or start from scratch
+    evaluated = (
+        {sample["identifier"] for sample in recover_jsonl(output_path)}
+        if resume
+        else set()
+    )
+    if len(evaluated) > 0:
+        logging.info(f"Resuming, {len(evaluated)} samples already evaluated")
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+
+    def read_samples() -> Iterator[dict]:
+        for sample in stream_jsonl(samples_path):
+            if sample["identifier"] in evaluated:
+                continue
+            if benchmark_obj.get_bug(sample["identifier"]) is None:
                 raise ValueError(f"Unknown bug {sample['identifier']}")
-            futures.append(
-                executor.submit(evaluate_candidate, bug, sample, strategy, **kwargs)
-            )
-
-        logging.info("Evaluating candidates...")
-        results = []
-        for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
-            results.append(future.result())
-        samples = results
-
-    # Write results to jsonl file
-    write_jsonl(
-        os.path.join(
-            dir_path, f"evaluation_{benchmark}_{prompt_strategy}_{model_name}.jsonl"
-        ),
-        samples,
+            yield sample
+
+    # Evaluate the candidates in worker processes, with bug affinity, and append
+    # each sample to the output file as soon as it (and all samples before it) is evaluated
+    logging.info("Evaluating candidates...")
+    scheduler = EvaluationScheduler(
+        benchmark_obj,
+        strategy,
+        n_workers=n_workers,
+        candidates_per_task=candidates_per_task,
+        max_in_flight=max_in_flight,
+        **kwargs,
     )
+    for sample, evaluation in tqdm.tqdm(scheduler.run(read_samples())):
+        sample["evaluation"] = evaluation
+        write_jsonl(output_path, [sample], append=True)
+    scheduler.log_statistics()
 
 
 def main():
@@ -190,9 +190,12 @@ def compute_statistics(samples: list) -> dict:
 
 def compute_costs(samples: list, provider: str, model_name: str) -> Optional[dict]:
     """
-    Computes the costs of the evaluation.
+    Computes the costs of the evaluation (async strategies are billed as their
+    provider).
     """
-    return CostCalculator.compute_costs(samples, provider, model_name)
+    return CostCalculator.compute_costs(
+        samples, provider.removesuffix("-async"), model_name
+    )
 
 
 def export_patches(samples: list, dir_path: str) -> None:
@@ -295,22 +298,27 @@ def export_bugs(samples, dir_path):
         f.write("\n".join(bugs_with_candidates))
 
 
-def export_cache(samples: list, cache_path: str, benchmark: str):
+def export_cache(
+    samples: list, cache_path: str, benchmark: str, backend: Optional[str] = None
+):
     """
     Exports the results of an evaluation file to the cache directory.
     """
-    cache = Cache(cache_path)
+    cache = Cache(cache_path, backend)
 
     for sample in samples:
         if "generation" in sample and sample["generation"] is not None:
-            for evaluation in sample["evaluation"]:
-                if evaluation is not None and evaluation["generation"] is not None:
-                    cache.save_to_cache(
-                        benchmark,
-                        sample["identifier"],
-                        evaluation["generation"],
-                        evaluation,
-                    )
+            evaluations = [
+                evaluation
+                for evaluation in sample["evaluation"]
+                if evaluation is not None and evaluation["generation"] is not None
+            ]
+            cache.save_many_to_cache(
+                benchmark,
+                sample["identifier"],
+                [evaluation["generation"] for evaluation in evaluations],
+                evaluations,
+            )
 
 
 def entry_point(
@@ -362,7 +370,7 @@ def entry_point(
 
     # Export results to cache (and check for inconsistencies)
     cache_path = kwargs.get("cache_path", Path("cache"))
-    export_cache(samples, cache_path, benchmark)
+    export_cache(samples, cache_path, benchmark, kwargs.get("cache_backend", None))
 
 
 def main():
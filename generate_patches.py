@@ -1,42 +1,144 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl
+from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl, recover_jsonl
 from elleelleaime.generate.strategies.registry import PatchGenerationStrategyRegistry
-
-from typing import List, Optional
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.token_counts import (
+    count_prompt_tokens,
+    skip_oversized_prompts,
+)
+
+from queue import Queue, Empty
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 import fire
+import threading
 import sys
 import os
 import tqdm
 import logging
 
 
-def generate_candidate(chunk: List[dict], strategy_name: str, **kwargs) -> List[dict]:
+def _samples_to_generate(samples: List[dict]) -> List[int]:
     """
-    Generates the candidate patch for the given sample and model.
+    Returns the indices of the samples without generation, and sets the generation of
+    the samples without prompt to None. Samples marked as skipped are not generated.
     """
-
-    generation_strategy = PatchGenerationStrategyRegistry.get_generation(
-        strategy_name, **kwargs
-    )
-
-    chunk_to_generate = [
-        sample
-        for sample in chunk
+    for sample in samples:
+        if not sample["prompt"]:
+            sample["generation"] = None
+    return [
+        i
+        for i, sample in enumerate(samples)
         if sample["prompt"]
+        and "skip_reason" not in sample
         and not ("generation" in sample and sample["generation"] is not None)
     ]
-    non_empty_prompt_chunk = [sample["prompt"] for sample in chunk_to_generate]
-    generations = generation_strategy.generate(non_empty_prompt_chunk)
 
-    for generation, sample in zip(generations, chunk_to_generate):
-        sample["generation"] = generation
 
-    for sample in chunk:
-        if not sample["prompt"]:
-            sample["generation"] = None
+def generate_candidates(
+    samples: List[dict],
+    strategies: List[PatchGenerationStrategy],
+    batch_size: int = 1,
+    checkpoint: Optional[Callable[[List[dict]], None]] = None,
+) -> List[dict]:
+    """
+    Generates the candidate patches for the samples without generation.
 
-    return chunk
+    The work is split into units (see `PatchGenerationStrategy.units_per_prompt`), or into
+    batches of `batch_size` prompts for strategies with a single unit per prompt, which
+    are put in a queue that all workers (one per strategy) pull from. Samples are passed to
+    `checkpoint` as soon as all their units are generated.
+    """
+    to_generate = _samples_to_generate(samples)
+
+    # Each work item is a list of (sample index, unit index)
+    units_per_prompt = strategies[0].units_per_prompt()
+    work: Queue[List[Tuple[int, int]]] = Queue()
+    if units_per_prompt > 1:
+        # The first unit of a sample is queued a few samples ahead of its other units,
+        # so that the prompt is processed (and cached by the provider) once before the
+        # other units reuse it, while samples still finish in order
+        lag = len(strategies)
+        for i in to_generate[:lag]:
+            work.put([(i, 0)])
+        for j, i in enumerate(to_generate):
+            for unit in range(1, units_per_prompt):
+                work.put([(i, unit)])
+            if j + lag < len(to_generate):
+                work.put([(to_generate[j + lag], 0)])
+    else:
+        batch_size = max(1, batch_size)
+        for j in range(0, len(to_generate), batch_size):
+            work.put([(i, 0) for i in to_generate[j : j + batch_size]])
+
+    generated_units: Dict[int, Dict[int, Any]] = {}
+    lock = threading.Lock()
+    failed = threading.Event()
+    progress = tqdm.tqdm(total=work.qsize(), desc="Generating candidates")
+
+    def worker(strategy: PatchGenerationStrategy) -> None:
+        while not failed.is_set():
+            try:
+                item = work.get_nowait()
+            except Empty:
+                return
+
+            try:
+                if units_per_prompt > 1:
+                    results = [strategy.generate_unit(samples[item[0][0]]["prompt"])]
+                else:
+                    results = strategy.generate([samples[i]["prompt"] for i, _ in item])
+            except Exception:
+                # Stop the other workers, already generated samples are checkpointed
+                failed.set()
+                raise
+
+            with lock:
+                finished = []
+                for (i, unit), result in zip(item, results):
+                    generated_units.setdefault(i, {})[unit] = result
+                    if len(generated_units[i]) == units_per_prompt:
+                        units = generated_units.pop(i)
+                        samples[i]["generation"] = strategy.merge_units(
+                            [units[unit] for unit in range(units_per_prompt)]
+                        )
+                        finished.append(samples[i])
+                if checkpoint is not None and len(finished) > 0:
+                    checkpoint(finished)
+                progress.update(1)
+
+    with ThreadPoolExecutor(max_workers=len(strategies)) as executor:
+        futures = [executor.submit(worker, strategy) for strategy in strategies]
+        for future in as_completed(futures):
+            future.result()
+    progress.close()
+
+    return samples
+
+
+def generate_candidates_batch_job(
+    samples: List[dict],
+    strategy: PatchGenerationStrategy,
+    job_file: Optional[str] = None,
+    checkpoint: Optional[Callable[[List[dict]], None]] = None,
+) -> List[dict]:
+    """
+    Generates the candidate patches for the samples without generation in a single
+    offline batch job of the provider (see `PatchGenerationStrategy.generate_batch_job`).
+    """
+    to_generate = _samples_to_generate(samples)
+    if len(to_generate) == 0:
+        return samples
+
+    generations = strategy.generate_batch_job(
+        [samples[i]["prompt"] for i in to_generate], job_file
+    )
+    for i, generation in zip(to_generate, generations):
+        samples[i]["generation"] = generation
+    if checkpoint is not None:
+        checkpoint([samples[i] for i in to_generate])
+
+    return samples
 
 
 def entry_point(
@@ -44,53 +146,104 @@ def entry_point(
     strategy_name: str,
     n_workers: int = 1,
     output_dir: Optional[str] = None,
+    batch_job: bool = False,
+    prefilter: bool = True,
     **kwargs,
 ):
     """
     Generates the candidate patches given the samples and the model,
     and writes the results to f"candidates_{benchmark}_{prompt_strategy}_{model_name}.jsonl"
-    """
-    results = []
-
-    with ThreadPoolExecutor(max_workers=n_workers) as executor:
-        futures = []
 
-        samples = list(stream_jsonl(samples_path))
-        chunks = [samples[i::n_workers] for i in range(n_workers)]
+    Generated samples are checkpointed to f"{output}.partial" as soon as they are generated.
+    If the generation is interrupted, running the same command again only generates the
+    samples missing from the checkpoint.
 
-        for chunk in tqdm.tqdm(chunks, desc="Launching workers", total=len(chunks)):
-            futures.append(
-                executor.submit(generate_candidate, chunk, strategy_name, **kwargs)
-            )
+    With `batch_job`, all samples are generated in one offline batch job of the provider,
+    which is cheaper but may take hours. The job identifier is recorded in
+    f"{output}.batch", so that running the same command again waits for the same job.
 
-        logging.info("Generating candidates...")
-        for future in tqdm.tqdm(
-            as_completed(futures),
-            desc="Waiting for chunks to be processed",
-            total=len(futures),
-        ):
-            results.extend(future.result())
-
-    # Write results to jsonl file
+    With `prefilter`, the tokens of the prompts are counted before generating (and
+    recorded in sample["prompt_tokens"]), and the samples whose prompt does not fit in
+    the context of the model are not generated.
+    """
     samples_file_name = os.path.basename(samples_path)
     dir_path = output_dir or os.path.dirname(samples_path)
     benchmark = samples_file_name.split("_")[1]
     prompt_strategy = samples_file_name.split("_")[2].split(".")[0]
 
     # FIXME: This is a hack to shorten the kwargs string
-    for key in kwargs:
-        if Path(str(kwargs[key])).exists():
-            kwargs[key] = Path(kwargs[key]).name
+    kwargs_names = dict(kwargs)
+    for key in kwargs_names:
+        if Path(str(kwargs_names[key])).exists():
+            kwargs_names[key] = Path(kwargs_names[key]).name
 
-    kwargs_str = "_".join([f"{k}={v}" for k, v in kwargs.items()])
+    kwargs_str = "_".join([f"{k}={v}" for k, v in kwargs_names.items()])
     kwargs_str = kwargs_str.replace("/", "-")
-    write_jsonl(
-        os.path.join(
-            dir_path,
-            f"candidates_{benchmark}_{prompt_strategy}_{strategy_name}_{kwargs_str}.jsonl",
-        ),
-        results,
+    output_path = os.path.join(
+        dir_path,
+        f"candidates_{benchmark}_{prompt_strategy}_{strategy_name}_{kwargs_str}.jsonl",
     )
+    checkpoint_path = f"{output_path}.partial"
+
+    # Reload the samples generated by a previous run
+    samples = list(stream_jsonl(samples_path))
+    generated = {
+        sample["identifier"]: sample["generation"]
+        for sample in recover_jsonl(checkpoint_path)
+    }
+    if len(generated) > 0:
+        logging.info(f"Resuming, {len(generated)} samples already generated")
+    for sample in samples:
+        if sample["identifier"] in generated:
+            sample["generation"] = generated[sample["identifier"]]
+
+    checkpoint_lock = threading.Lock()
+
+    def checkpoint(batch: List[dict]) -> None:
+        with checkpoint_lock:
+            write_jsonl(checkpoint_path, batch, append=True)
+
+    job_file = f"{output_path}.batch"
+    # Each worker has its own strategy, and all workers pull from a shared queue
+    strategies = [
+        PatchGenerationStrategyRegistry.get_generation(strategy_name, **kwargs)
+        for _ in range(1 if batch_job else max(1, n_workers))
+    ]
+    try:
+        if prefilter:
+            # Samples generated by a previous run are kept, even if they are oversized
+            pending = [
+                sample for sample in samples if sample["identifier"] not in generated
+            ]
+            count_prompt_tokens(pending, strategies[0])
+            skip_oversized_prompts(pending, strategies[0])
+
+        if batch_job:
+            if not strategies[0].supports_batch_job():
+                raise ValueError(
+                    f"Strategy {strategy_name} does not support batch jobs"
+                )
+            logging.info("Generating candidates in a batch job...")
+            generate_candidates_batch_job(
+                samples, strategies[0], job_file=job_file, checkpoint=checkpoint
+            )
+        else:
+            logging.info("Generating candidates...")
+            generate_candidates(
+                samples,
+                strategies,
+                strategies[0].prompts_per_batch(),
+                checkpoint=checkpoint,
+            )
+    finally:
+        for strategy in strategies:
+            strategy.close()
+
+    # Write results to jsonl file, in the order of the samples
+    write_jsonl(output_path, samples)
+    for path in [checkpoint_path, job_file]:
+        if os.path.exists(path):
+            os.remove(path)
 
 
 def main():
@@ -0,0 +1,50 @@
+from elleelleaime.core.caching.cache_backend import get_cache_backend
+
+from pathlib import Path
+
+import fire
+import sys
+import tqdm
+import logging
+
+
+def entry_point(
+    cache_path: str = str(Path("cache")),
+    source: str = "directory",
+    target: str = "sqlite",
+    batch_size: int = 1000,
+):
+    """
+    Copies all the cached evaluations from one cache backend to another,
+    e.g. from the one-file-per-evaluation directory layout to the SQLite database.
+    Evaluations already present in the target are overwritten.
+    """
+    if source == target:
+        raise ValueError("The source and target backends must be different")
+
+    source_backend = get_cache_backend(cache_path, source)
+    target_backend = get_cache_backend(cache_path, target)
+
+    logging.info(f"Migrating the {source} cache at {cache_path} to {target}...")
+    batch = []
+    n_migrated = 0
+    for key, evaluation in tqdm.tqdm(source_backend.items()):
+        batch.append((key, evaluation))
+        if len(batch) >= batch_size:
+            target_backend.put_many(batch)
+            n_migrated += len(batch)
+            batch = []
+    if len(batch) > 0:
+        target_backend.put_many(batch)
+        n_migrated += len(batch)
+
+    logging.info(f"Migrated {n_migrated} evaluations")
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    fire.Fire(entry_point)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
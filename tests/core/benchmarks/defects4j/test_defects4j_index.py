@@ -0,0 +1,77 @@
+from elleelleaime.core.benchmarks.defects4j.defects4j import Defects4J
+
+from pathlib import Path
+import subprocess
+import tempfile
+
+# Answers the commands used to initialize Defects4J for two projects, and logs them
+FAKE_DEFECTS4J = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls.log"
+case "$1" in
+  pids) printf "Chart\\nLang\\n" ;;
+  bids) if [ "$3" = Chart ]; then printf "1\\n2\\n"; else printf "7\\n"; fi ;;
+  query)
+    if [ "$3" = Chart ]; then
+      printf '1,org.A::t1,org.A::t1 --> junit.AssertionFailedError\\n'
+      printf '2,org.B::t2,org.B::t2 --> java.lang.NullPointerException\\n'
+    else
+      printf '7,org.C::t3,org.C::t3 --> java.lang.Error: boom\\n'
+    fi ;;
+esac
+"""
+
+
+class TestDefects4JIndex:
+    def git(self, path: Path, *args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test", *args],
+            cwd=path,
+            check=True,
+            capture_output=True,
+        )
+
+    def make_benchmark(self, path: Path) -> None:
+        bin_path = Path(path, "framework/bin/defects4j")
+        bin_path.parent.mkdir(parents=True)
+        bin_path.write_text(FAKE_DEFECTS4J)
+        bin_path.chmod(0o755)
+        for pid, bid in [("Chart", 1), ("Chart", 2), ("Lang", 7)]:
+            patch_path = Path(path, "framework/projects", pid, "patches")
+            patch_path.mkdir(parents=True, exist_ok=True)
+            Path(patch_path, f"{bid}.src.patch").write_text(f"diff of {pid}-{bid}")
+        self.git(path, "init", "-q")
+        self.git(path, "add", ".")
+        self.git(path, "commit", "-q", "-m", "Initial commit")
+
+    def test_initialize_from_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "defects4j")
+            calls_path = Path(path, "framework/bin/calls.log")
+            path.mkdir()
+            self.make_benchmark(path)
+
+            defects4j = Defects4J(path)
+            defects4j.initialize()
+            bugs = {bug.get_identifier(): bug for bug in defects4j.get_bugs()}
+            assert set(bugs) == {"Chart-1", "Chart-2", "Lang-7"}
+            assert bugs["Chart-2"].get_ground_truth() == "diff of Chart-2"
+            assert bugs["Lang-7"].get_failing_tests() == {
+                "org.C::t3": "java.lang.Error: boom"
+            }
+            # The index is stored next to the benchmark
+            assert Path(tmp_dir, ".index", "defects4j.json").exists()
+
+            # The same version is loaded from the index, without running Defects4J
+            calls_path.unlink()
+            indexed = Defects4J(path)
+            indexed.initialize()
+            assert not calls_path.exists()
+            for bug in indexed.get_bugs():
+                expected = bugs[bug.get_identifier()]
+                assert bug.get_ground_truth() == expected.get_ground_truth()
+                assert bug.get_failing_tests() == expected.get_failing_tests()
+
+            # Another version of the benchmark is indexed again
+            self.git(path, "commit", "-q", "--allow-empty", "-m", "Update")
+            Defects4J(path).initialize()
+            assert calls_path.exists()
@@ -0,0 +1,81 @@
+from elleelleaime.core.benchmarks.gitbugjava.gitbugjava import GitBugJava
+
+from pathlib import Path
+from typing import List
+import subprocess
+import threading
+import tempfile
+import time
+
+INFO = """### Bug Patch
+```diff
+diff of {bid}
+```
+### Failing Tests
+- org.A#test{bid}()
+  - AssertionError
+  - expected {bid}
+"""
+
+
+class FakeGitBugJava(GitBugJava):
+    """
+    Answers the bids and info commands for 8 bugs, tracking the info commands in flight.
+    """
+
+    def __init__(self, path: Path, n_workers: int) -> None:
+        super().__init__(path, n_workers=n_workers)
+        self.commands: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def run_command(self, command, check=True, timeout=None):
+        self.commands.append(command)
+        if command == "bids":
+            stdout = "\n".join(f"bug-{i}" for i in range(8))
+        else:
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight -= 1
+            stdout = INFO.format(bid=command.split()[1])
+        return subprocess.CompletedProcess(command, 0, stdout.encode(), b"")
+
+
+class TestGitBugJavaIndex:
+    def git(self, path: Path, *args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test", *args],
+            cwd=path,
+            check=True,
+            capture_output=True,
+        )
+
+    def test_initialize_from_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "gitbug-java")
+            path.mkdir()
+            self.git(path, "init", "-q")
+            self.git(path, "commit", "-q", "--allow-empty", "-m", "Initial commit")
+
+            # The info commands run concurrently, up to the number of workers
+            gitbugjava = FakeGitBugJava(path, n_workers=4)
+            gitbugjava.initialize()
+            assert len(gitbugjava.commands) == 9
+            assert 1 < gitbugjava.max_in_flight <= 4
+            bug = gitbugjava.get_bug("bug-3")
+            assert bug is not None
+            assert bug.get_ground_truth().strip() == "diff of bug-3"
+            assert bug.get_failing_tests() == {"org.A::testbug-3": "expected bug-3"}
+
+            # The same revision is loaded from the index, without running GitBug-Java
+            indexed = FakeGitBugJava(path, n_workers=4)
+            indexed.initialize()
+            assert indexed.commands == []
+            assert len(indexed.get_bugs()) == 8
+            assert indexed.get_bug("bug-3").get_failing_tests() == {
+                "org.A::testbug-3": "expected bug-3"
+            }
@@ -0,0 +1,169 @@
+from migrate_cache import entry_point as migrate_cache
+from elleelleaime.core.caching.cache import Cache
+from elleelleaime.core.caching.cache_backend import (
+    DirectoryCacheBackend,
+    LRUCacheBackend,
+    SQLiteCacheBackend,
+    SQLITE_CACHE_FILE,
+)
+
+from pathlib import Path
+
+import os
+import tempfile
+import threading
+
+
+class TestCache:
+    def test_directory_backend(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = Cache(cache_path, "directory")
+            assert isinstance(cache.backend.backend, DirectoryCacheBackend)
+            assert cache.load_from_cache("dummy", "Dummy-1", "a") is None
+
+            cache.save_to_cache("dummy", "Dummy-1", "a", {"generation": "a"})
+            assert cache.load_from_cache("dummy", "Dummy-1", "a") == {"generation": "a"}
+            # One file per evaluation
+            assert len(os.listdir(Path(cache_path, "dummy", "Dummy-1"))) == 1
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = Cache(cache_path, "sqlite")
+            assert isinstance(cache.backend.backend, SQLiteCacheBackend)
+
+            generations = [f"generation {i}" for i in range(1000)]
+            cache.save_many_to_cache(
+                "dummy",
+                "Dummy-1",
+                generations,
+                [{"generation": g} for g in generations],
+            )
+            evaluations = cache.load_many_from_cache(
+                "dummy", "Dummy-1", generations + ["missing"]
+            )
+            assert evaluations[:-1] == [{"generation": g} for g in generations]
+            assert evaluations[-1] is None
+
+            # Existing evaluations are not overwritten
+            cache.save_to_cache("dummy", "Dummy-1", "generation 0", {"other": True})
+            assert cache.load_from_cache("dummy", "Dummy-1", "generation 0") == {
+                "generation": "generation 0"
+            }
+
+            # The database is shared across threads
+            results = []
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(
+                        Cache(cache_path, "sqlite").load_from_cache(
+                            "dummy", "Dummy-1", "generation 1"
+                        )
+                    )
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == [{"generation": "generation 1"}] * 4
+
+    def test_migrate(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            directory_cache = Cache(cache_path, "directory")
+            for i in range(10):
+                directory_cache.save_to_cache(
+                    "dummy", f"Dummy-{i % 3}", f"generation {i}", {"i": i}
+                )
+            # Non-evaluation files are ignored
+            Path(cache_path, "README.md").write_text("cache")
+            Path(cache_path, "checkouts", "dummy", "Dummy-1", "buggy").mkdir(
+                parents=True
+            )
+
+            # The directory backend is used until the database exists
+            assert isinstance(Cache(cache_path).backend.backend, DirectoryCacheBackend)
+            migrate_cache(cache_path, batch_size=3)
+            assert Path(cache_path, SQLITE_CACHE_FILE).exists()
+
+            sqlite_cache = Cache(cache_path)
+            assert isinstance(sqlite_cache.backend.backend, SQLiteCacheBackend)
+            assert len(list(sqlite_cache.backend.items())) == 10
+            for i in range(10):
+                assert sqlite_cache.load_from_cache(
+                    "dummy", f"Dummy-{i % 3}", f"generation {i}"
+                ) == {"i": i}
+
+    def test_lru_prefetch(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            backend = DirectoryCacheBackend(cache_path)
+            for i in range(10):
+                backend.put(("dummy", f"Dummy-{i % 2}", f"{i}"), {"i": i})
+
+            n_reads = []
+            get_all = backend.get_all
+            backend.get_all = lambda *args: n_reads.append(args) or get_all(*args)  # type: ignore
+            lru = LRUCacheBackend(backend, max_entries=6)
+
+            # All the evaluations of the bug are read at once
+            assert lru.get(("dummy", "Dummy-0", "0")) == {"i": 0}
+            assert lru.get_many(
+                [("dummy", "Dummy-0", "2"), ("dummy", "Dummy-0", "missing")]
+            ) == [{"i": 2}, None]
+            assert len(n_reads) == 1
+            assert lru.get_statistics() == {"hits": 2, "misses": 1, "entries": 5}
+
+            # Reading the other bug evicts some evaluations of the first one
+            assert lru.get(("dummy", "Dummy-1", "1")) == {"i": 1}
+            assert len(n_reads) == 2
+            assert lru.get_statistics()["entries"] == 6
+            assert lru.get(("dummy", "Dummy-0", "0")) == {"i": 0}
+            assert len(n_reads) == 3
+
+            # Writes go through to the backend
+            lru.put(("dummy", "Dummy-2", "a"), {"a": True})
+            assert backend.get(("dummy", "Dummy-2", "a")) == {"a": True}
+
+    def test_lru_shared_backend(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            backend = SQLiteCacheBackend(os.path.join(cache_path, SQLITE_CACHE_FILE))
+            lookups = []
+            get_many = backend.get_many
+            backend.get_many = lambda keys: lookups.append(keys) or get_many(keys)  # type: ignore
+            lru = LRUCacheBackend(backend)
+            other = LRUCacheBackend(backend)
+            key = ("dummy", "Dummy-0", "0")
+
+            # Misses of a bug that was read are not looked up in the backend
+            assert lru.get(key) is None
+            other.put(key, {"i": 0})
+            assert lru.get(key) is None
+            assert lookups == []
+
+            # Until the bug is written, which reads it again on the next lookup
+            lru.put(("dummy", "Dummy-0", "1"), {"i": 1})
+            assert lru.get(key) == {"i": 0}
+            assert lru.get_statistics()["hits"] == 1
+            assert lookups == []
+
+    def test_save_existing(self):
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache = Cache(cache_path, "sqlite")
+            lookups = []
+            backend = cache.backend.backend
+            get_many = backend.get_many
+            backend.get_many = lambda keys: lookups.append(keys) or get_many(keys)  # type: ignore
+
+            # Saving evaluations of a bug that was loaded does not query the backend
+            generations = ["a", "b"]
+            assert cache.load_many_from_cache("dummy", "Dummy-3", generations) == [
+                None,
+                None,
+            ]
+            cache.save_many_to_cache(
+                "dummy", "Dummy-3", generations, [{"g": g} for g in generations]
+            )
+            assert lookups == []
+            assert cache.load_many_from_cache("dummy", "Dummy-3", generations) == [
+                {"g": g} for g in generations
+            ]
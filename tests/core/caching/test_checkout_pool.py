@@ -0,0 +1,70 @@
+from tests.dummy_benchmark import DummyBenchmark, DummyBug, BUGGY_FILE, FIXED_FILE
+from elleelleaime.core.caching.checkout_pool import CheckoutPool
+
+import os
+
+
+class TestCheckoutPool:
+    def test_reuse_working_copy(self):
+        pool = CheckoutPool()
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+
+        with pool.checkout(bug) as working_copy:
+            first_path = working_copy.get_path()
+            working_copy.write_file("Main.java", "candidate")
+            assert working_copy.read_file("Main.java") == "candidate"
+
+        with pool.checkout(bug) as working_copy:
+            # The working copy is reused and the modified file is restored
+            assert working_copy.get_path() == first_path
+            assert working_copy.read_file("Main.java") == BUGGY_FILE
+
+        assert bug.n_checkouts == 1
+        pool.clear()
+        assert not os.path.exists(first_path)
+
+    def test_concurrent_working_copies(self):
+        pool = CheckoutPool()
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+
+        with pool.checkout(bug) as first, pool.checkout(bug) as second:
+            assert first.get_path() != second.get_path()
+        with pool.checkout(bug, fixed=True) as fixed:
+            assert fixed.read_file("Main.java") == FIXED_FILE
+
+        assert bug.n_checkouts == 3
+        pool.clear()
+
+    def test_eviction(self):
+        pool = CheckoutPool(max_idle=1)
+        benchmark = DummyBenchmark()
+        bug_1 = DummyBug(benchmark, "Dummy-1")
+        bug_2 = DummyBug(benchmark, "Dummy-2")
+
+        with pool.checkout(bug_1) as working_copy:
+            evicted_path = working_copy.get_path()
+        with pool.checkout(bug_2):
+            pass
+
+        # The least recently used working copy is removed
+        assert not os.path.exists(evicted_path)
+        with pool.checkout(bug_1):
+            pass
+        assert bug_1.n_checkouts == 2
+        pool.clear()
+
+    def test_removed_working_copy(self):
+        pool = CheckoutPool()
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+
+        with pool.checkout(bug) as working_copy:
+            removed_path = working_copy.get_path()
+        # The idle working copy is removed behind the pool's back
+        working_copy.remove()
+
+        with pool.checkout(bug) as working_copy:
+            assert working_copy.get_path() != removed_path
+            assert working_copy.read_file("Main.java") == BUGGY_FILE
+
+        assert bug.n_checkouts == 2
+        pool.clear()
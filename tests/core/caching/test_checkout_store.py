@@ -0,0 +1,44 @@
+from tests.dummy_benchmark import DummyBenchmark, DummyBug, BUGGY_FILE, FIXED_FILE
+from elleelleaime.core.caching.checkout_store import CheckoutStore
+from elleelleaime.core.caching.checkout_pool import CheckoutPool
+
+import os
+
+
+class TestCheckoutStore:
+    def test_clone_pristine_tree(self, tmp_path):
+        store = CheckoutStore(str(tmp_path / "store"))
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+
+        for i in range(3):
+            path = tmp_path / f"buggy-{i}"
+            assert store.checkout(bug, str(path), fixed=False)
+            with open(path / "Main.java") as f:
+                assert f.read() == BUGGY_FILE
+            # Modifying a clone does not modify the pristine tree
+            with open(path / "Main.java", "w") as f:
+                f.write("candidate")
+
+        store.checkout(bug, str(tmp_path / "fixed"), fixed=True)
+        with open(tmp_path / "fixed" / "Main.java") as f:
+            assert f.read() == FIXED_FILE
+
+        # The bug is only checked out once per version
+        assert bug.n_checkouts == 2
+        assert os.path.exists(tmp_path / "store" / ".gitignore")
+
+        store.clear(bug)
+        store.checkout(bug, str(tmp_path / "buggy-0"), fixed=False)
+        assert bug.n_checkouts == 3
+
+    def test_pool_with_store(self, tmp_path):
+        store = CheckoutStore(str(tmp_path / "store"))
+        pool = CheckoutPool(max_idle=0, store=store)
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+
+        for _ in range(3):
+            with pool.checkout(bug) as working_copy:
+                assert working_copy.read_file("Main.java") == BUGGY_FILE
+                working_copy.write_file("Main.java", "candidate")
+
+        assert bug.n_checkouts == 1
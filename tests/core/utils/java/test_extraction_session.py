@@ -0,0 +1,73 @@
+import time
+import logging
+
+from elleelleaime.core.utils.java.java import (
+    ExtractionSession,
+    extract_single_function,
+    run_extractor,
+)
+from elleelleaime.core.utils.benchmarks import get_benchmark
+from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.core.benchmarks.bug import RichBug
+
+
+class TestExtractionSession:
+    DEFECTS4J: Benchmark
+
+    @classmethod
+    def setup_class(cls):
+        TestExtractionSession.DEFECTS4J = get_benchmark("defects4j")
+        assert TestExtractionSession.DEFECTS4J is not None
+        TestExtractionSession.DEFECTS4J.initialize()
+
+    def count_checkouts(self, bug: RichBug, monkeypatch) -> list:
+        checkouts = []
+        checkout = bug.checkout
+
+        def counting_checkout(path: str, fixed: bool = False) -> bool:
+            checkouts.append((path, fixed))
+            return checkout(path, fixed=fixed)
+
+        monkeypatch.setattr(bug, "checkout", counting_checkout)
+        return checkouts
+
+    def test_closure_70(self, monkeypatch):
+        # Bug with 5 failing test cases
+        bug = TestExtractionSession.DEFECTS4J.get_bug("Closure-70")
+        assert bug is not None
+        checkouts = self.count_checkouts(bug, monkeypatch)
+
+        # Extract the function and each failing test case from its own checkout (previous behaviour)
+        start = time.time()
+        expected_function = extract_single_function(bug)
+        expected_test_cases = {}
+        for failing_test in bug.get_failing_tests():
+            class_name, method_name = failing_test.split("::")
+            with ExtractionSession(bug) as session:
+                test_class_path = session.find_test_class(class_name)
+                assert test_class_path is not None
+                run = run_extractor(test_class_path, ["--method", method_name])
+                expected_test_cases[failing_test] = run.stdout.decode("utf-8")
+        separate_time = time.time() - start
+        separate_checkouts = len(checkouts)
+        checkouts.clear()
+
+        # Extract the function and the failing test cases in a session
+        start = time.time()
+        with ExtractionSession(bug) as session:
+            function = session.extract_single_function()
+            test_cases = session.extract_failing_test_cases()
+        session_time = time.time() - start
+        session_checkouts = len(checkouts)
+
+        logging.info(
+            f"Closure-70: {separate_checkouts} checkouts in {separate_time:.1f}s with one checkout per extraction, "
+            + f"{session_checkouts} checkouts in {session_time:.1f}s in a session"
+        )
+
+        # The results are the same, but each version is only checked out once
+        assert function == expected_function
+        assert test_cases == expected_test_cases
+        assert len(test_cases) == len(bug.get_failing_tests())
+        assert session_checkouts == 2
+        assert separate_checkouts == 2 + len(bug.get_failing_tests())
@@ -0,0 +1,81 @@
+from elleelleaime.core.utils.java import jar_server
+from elleelleaime.core.utils.java.jar_server import JarServer, run_jar_many
+
+from pathlib import Path
+
+import subprocess
+import tempfile
+import sys
+
+# Mimics JarServer.java: echoes the arguments, and writes noise outside the protocol
+FAKE_SERVER = """
+import json, sys
+for line in sys.stdin:
+    args = json.loads(line)
+    print("log line written by the jar", flush=True)
+    returncode = 1 if "--fail" in args else 0
+    print(json.dumps({"returncode": returncode, "stdout": " ".join(args) + "\\n"}), flush=True)
+"""
+
+
+class FakeJarServer(JarServer):
+    def start(self) -> None:
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", FAKE_SERVER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+
+
+class TestJarServer:
+    def test_protocol(self):
+        server = FakeJarServer("extractor.jar")
+        server.start()
+        try:
+            assert server.run(["-i", "Foo.java", "--lines", "3"]) == (
+                0,
+                "-i Foo.java --lines 3\n",
+            )
+            assert server.run(['"quoted"\n', "--fail"]) == (
+                1,
+                '"quoted"\n --fail\n',
+            )
+        finally:
+            server.stop()
+
+        # Stopped servers do not serve requests
+        assert not server.is_alive()
+        assert server.run(["-i", "Foo.java"]) is None
+
+    def test_batch_in_one_jvm(self, monkeypatch):
+        servers = []
+        runs = []
+
+        class RecordingJarServer(FakeJarServer):
+            def start(self) -> None:
+                servers.append(self)
+                super().start()
+
+        monkeypatch.setattr(jar_server, "JAR_SERVERS", 0)
+        monkeypatch.setattr(jar_server, "JarServer", RecordingJarServer)
+        monkeypatch.setattr(
+            subprocess,
+            "run",
+            lambda command, **kwargs: runs.append(command)
+            or subprocess.CompletedProcess(command, 0, b"", b""),
+        )
+        path = Path(tempfile.gettempdir(), "Foo.java")
+
+        # A batch of calls is served by one short-lived server, stopped afterwards
+        results = run_jar_many("extractor.jar", [["-i", "a"], ["-i", "b"]], [path])
+        assert [result.stdout for result in results] == [b"-i a\n", b"-i b\n"]
+        assert len(servers) == 1
+        assert not servers[0].is_alive()
+        assert runs == []
+
+        # A single call runs a one-shot container
+        run_jar_many("extractor.jar", [["-i", "a"]], [path])
+        assert len(servers) == 1
+        assert len(runs) == 1
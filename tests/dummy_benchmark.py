@@ -0,0 +1,63 @@
+from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.core.benchmarks.bug import Bug
+from elleelleaime.core.benchmarks.test_result import TestResult
+from elleelleaime.core.benchmarks.compile_result import CompileResult
+
+from pathlib import Path
+from typing import List
+
+import os
+
+BUGGY_CODE = "    int f() {\n        return 0;\n    }\n"
+FIXED_CODE = "    int f() {\n        return 1;\n    }\n"
+
+# Contents of Main.java in the buggy and fixed checkouts
+BUGGY_FILE = "class Main {\n" + BUGGY_CODE + "}\n"
+FIXED_FILE = "class Main {\n" + FIXED_CODE + "}\n"
+
+GROUND_TRUTH = """--- a/Main.java
++++ b/Main.java
+@@ -1,5 +1,5 @@
+ class Main {
+     int f() {
+-        return 0;
++        return 1;
+     }
+ }
+"""
+
+
+class DummyBenchmark(Benchmark):
+    def __init__(self) -> None:
+        super().__init__("dummy", Path("."))
+
+    def initialize(self) -> None:
+        pass
+
+
+class DummyBug(Bug):
+    """
+    Bug of a single Main.java file, which always compiles and passes the tests if it
+    returns 2. Checkouts and compiled files are recorded.
+    """
+
+    def __init__(self, benchmark: Benchmark, identifier: str) -> None:
+        super().__init__(benchmark, identifier, GROUND_TRUTH)
+        self.n_checkouts = 0
+        self.compiled: List[str] = []
+
+    def checkout(self, path: str, fixed: bool = False) -> bool:
+        self.n_checkouts += 1
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "Main.java"), "w") as f:
+            f.write(FIXED_FILE if fixed else BUGGY_FILE)
+        return True
+
+    def compile(self, path: str) -> CompileResult:
+        with open(os.path.join(path, "Main.java")) as f:
+            self.compiled.append(f.read())
+        return CompileResult(True)
+
+    def test(self, path: str) -> TestResult:
+        with open(os.path.join(path, "Main.java")) as f:
+            return TestResult("return 2;" in f.read())
@@ -0,0 +1,52 @@
+from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.evaluate.strategies.text.replace import ReplaceEvaluationStrategy
+import elleelleaime.evaluate.strategies.strategy as strategy_module
+
+from typing import List
+from pathlib import Path
+
+import subprocess
+
+
+class TestAstMatchMany:
+    FIXED_CODE = "class A {\n    int f() {\n        return 1;\n    }\n}\n"
+
+    def test_deduplicates_candidates(self, monkeypatch):
+        calls = []
+
+        def fake_run_jar_many(
+            jar: str, args_list: List[List[str]], paths: List[Path]
+        ) -> List[subprocess.CompletedProcess]:
+            calls.append(args_list)
+            runs = []
+            for fixed_path, candidate_path in args_list:
+                with open(fixed_path) as f:
+                    fixed = f.read()
+                with open(candidate_path) as f:
+                    candidate = f.read()
+                stdout = b"no AST change" if fixed == candidate else b"Update"
+                runs.append(subprocess.CompletedProcess([], 0, stdout, b""))
+            return runs
+
+        monkeypatch.setattr(strategy_module, "run_jar_many", fake_run_jar_many)
+
+        strategy = ReplaceEvaluationStrategy(use_cache=False)
+        candidates = [
+            self.FIXED_CODE,
+            "class A {\n    int f() {\n        return 2;\n    }\n}\n",
+            "// comment\n" + self.FIXED_CODE,
+            "class A {\n  int f() {\n\n    return 2; // two\n  }\n}\n",
+        ]
+        assert strategy.ast_match_many(self.FIXED_CODE, candidates) == [
+            True,
+            False,
+            True,
+            False,
+        ]
+
+        # All the matches are done in a single call, once per unique candidate
+        assert len(calls) == 1
+        assert len(calls[0]) == 2
+
+        assert strategy.ast_match_many(self.FIXED_CODE, []) == []
+        assert strategy.ast_match(self.FIXED_CODE, self.FIXED_CODE)
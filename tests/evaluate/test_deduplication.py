@@ -0,0 +1,56 @@
+from tests.dummy_benchmark import DummyBenchmark, DummyBug, BUGGY_CODE, FIXED_CODE
+from elleelleaime.evaluate.strategies.text.replace import ReplaceEvaluationStrategy
+import elleelleaime.evaluate.strategies.strategy as strategy_module
+
+
+class TestEvaluationDeduplication:
+    def test_equivalent_candidates_are_evaluated_once(self, monkeypatch):
+        ast_matches = []
+
+        def fake_ast_match_many(self, fixed_code, candidates):
+            ast_matches.append(candidates)
+            return [False] * len(candidates)
+
+        monkeypatch.setattr(
+            strategy_module.PatchEvaluationStrategy,
+            "ast_match_many",
+            fake_ast_match_many,
+        )
+
+        bug = DummyBug(DummyBenchmark(), "Dummy-1")
+        strategy = ReplaceEvaluationStrategy(use_cache=False, use_checkout_store=False)
+        generations = [
+            "    int f() {\n        return 2;\n    }\n",
+            "    int f() {\n        return 3;\n    }\n",
+            "  int f() {\n    // two\n    return 2;\n\n  }\n",
+            None,
+            FIXED_CODE,
+            "    int f() {\n        return 3; /* three */\n    }\n",
+        ]
+        sample = {
+            "identifier": "Dummy-1",
+            "buggy_code": BUGGY_CODE,
+            "fixed_code": FIXED_CODE,
+            "generation": generations,
+        }
+
+        evaluation = strategy.evaluate(bug, sample)
+
+        # Each equivalence class is compiled once, exact matches are never compiled
+        assert len(bug.compiled) == 2
+        # The plausible candidates are AST matched in a single call
+        assert len(ast_matches) == 1 and len(ast_matches[0]) == 1
+
+        assert evaluation is not None and len(evaluation) == len(generations)
+        for generation, result in zip(generations, evaluation):
+            assert result["generation"] == generation
+        assert [result["test"] for result in evaluation] == [
+            True,
+            False,
+            True,
+            False,
+            True,
+            False,
+        ]
+        assert evaluation[4]["exact_match"] and evaluation[4]["ast_match"]
+        assert all(result["compile"] for result in evaluation if result["generation"])
@@ -0,0 +1,136 @@
+from tests.dummy_benchmark import (
+    DummyBenchmark,
+    DummyBug,
+    BUGGY_CODE,
+    FIXED_CODE,
+)
+from elleelleaime.evaluate.scheduler import EvaluationScheduler, split_sample
+from elleelleaime.evaluate.strategies.text.replace import ReplaceEvaluationStrategy
+from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl
+import evaluate_patches
+
+from pathlib import Path
+
+import tempfile
+
+
+class TestEvaluationScheduler:
+    @classmethod
+    def setup_class(cls):
+        cls.benchmark = DummyBenchmark()
+        for i in range(3):
+            cls.benchmark.add_bug(DummyBug(cls.benchmark, f"Dummy-{i}"))
+
+    def get_sample(self, identifier: str, n: int) -> dict:
+        return {
+            "identifier": identifier,
+            "buggy_code": BUGGY_CODE,
+            "fixed_code": FIXED_CODE,
+            "generation": [
+                f"    int f() {{\n        return {3 + i % 2};\n    }}\n"
+                for i in range(n)
+            ]
+            + [FIXED_CODE, None],
+        }
+
+    def test_split_sample(self):
+        sample = self.get_sample("Dummy-0", 5)
+        sub_samples = split_sample(sample, 3)
+        assert [len(s["generation"]) for s in sub_samples] == [3, 3, 1]
+        assert sum([s["generation"] for s in sub_samples], []) == sample["generation"]
+        assert split_sample(sample, 0) == [sample]
+        assert split_sample({**sample, "generation": {"choices": []}}, 1) == [
+            {**sample, "generation": {"choices": []}}
+        ]
+
+    def test_run(self):
+        samples = [
+            self.get_sample("Dummy-0", 6),
+            {"identifier": "Dummy-1", "generation": None},
+            self.get_sample("Dummy-2", 4),
+            self.get_sample("Dummy-1", 3),
+        ]
+        scheduler = EvaluationScheduler(
+            self.benchmark,
+            "replace",
+            n_workers=2,
+            candidates_per_task=2,
+            use_cache=False,
+            use_checkout_store=False,
+        )
+        results = list(scheduler.run(iter(samples)))
+
+        # Samples are yielded in input order
+        assert [sample for sample, _ in results] == samples
+        evaluations = [evaluation for _, evaluation in results]
+        assert evaluations[1] is None
+        for i in [0, 2, 3]:
+            evaluation = evaluations[i]
+            assert [e["generation"] for e in evaluation] == samples[i]["generation"]
+            assert [e["exact_match"] for e in evaluation[-2:]] == [True, False]
+            assert all(e["compile"] and not e["test"] for e in evaluation[:-2])
+
+        # Each worker compiles each equivalence class of a bug at most once
+        count, _ = scheduler.timings["compile"]
+        assert 6 <= count <= 12
+
+    def test_whole_samples(self, monkeypatch):
+        evaluate_generations = ReplaceEvaluationStrategy.evaluate_generations
+
+        # Record the number of generations evaluated together (workers are forked)
+        def record_batch(self, bug, sample, generations):
+            evaluations = evaluate_generations(self, bug, sample, generations)
+            return [
+                {**evaluation, "batch": len(generations)} for evaluation in evaluations
+            ]
+
+        monkeypatch.setattr(
+            ReplaceEvaluationStrategy, "evaluate_generations", record_batch
+        )
+        sample = self.get_sample("Dummy-0", 6)
+        scheduler = EvaluationScheduler(
+            self.benchmark,
+            "replace",
+            n_workers=2,
+            use_cache=False,
+            use_checkout_store=False,
+        )
+        ((_, evaluation),) = list(scheduler.run(iter([sample])))
+
+        # All the candidates of the sample are evaluated in one batch
+        assert [e["batch"] for e in evaluation] == [8] * 8
+
+    def test_streaming_resume(self, monkeypatch):
+        monkeypatch.setattr(evaluate_patches, "get_benchmark", lambda _: self.benchmark)
+        samples = [self.get_sample(f"Dummy-{i}", 2) for i in range(3)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            samples_path = Path(tmp_dir, "candidates_dummy_instruct_model.jsonl")
+            output_path = Path(tmp_dir, "evaluation_dummy_instruct_model.jsonl")
+            write_jsonl(str(samples_path), samples)
+
+            # A previous run evaluated the first sample and was interrupted while writing
+            write_jsonl(
+                str(output_path), [{**samples[0], "evaluation": "previous run"}]
+            )
+            with open(output_path, "a") as f:
+                f.write('{"identifier": "Dummy-1", "gen')
+
+            evaluate_patches.entry_point(
+                "dummy",
+                str(samples_path),
+                "replace",
+                n_workers=2,
+                max_in_flight=1,
+                use_cache=False,
+                use_checkout_store=False,
+            )
+
+            output = list(stream_jsonl(str(output_path)))
+            assert [sample["identifier"] for sample in output] == [
+                "Dummy-0",
+                "Dummy-1",
+                "Dummy-2",
+            ]
+            assert output[0]["evaluation"] == "previous run"
+            assert all(len(sample["evaluation"]) == 4 for sample in output[1:])
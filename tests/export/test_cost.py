@@ -0,0 +1,171 @@
+from elleelleaime.export.cost.cost_calculator import CostCalculator
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.token_counts import count_prompt_tokens
+from elleelleaime.core.utils.jsonl import write_jsonl
+import estimate_costs
+import export_results
+
+from typing import Any, List
+
+import json
+import openai
+import pytest
+import anthropic
+
+
+class CachingStrategy(PatchGenerationStrategy):
+    """
+    Sends one request per sample, with the prompt cached, and counts one token per word.
+    """
+
+    cache_prompt = True
+
+    def __init__(self, n_samples: int) -> None:
+        self.n_samples = n_samples
+
+    def units_per_prompt(self) -> int:
+        return self.n_samples
+
+    def tokenizer_name(self) -> str:
+        return "words"
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        return [len(prompt.split()) for prompt in prompts]
+
+    def _generate_impl(self, chunk: List[str]) -> Any:
+        raise AssertionError("Estimating must not generate")
+
+
+class TestCost:
+    def test_openai_cached_tokens(self):
+        samples = [
+            {
+                "identifier": "Dummy-0",
+                "generation": {
+                    "usage": {
+                        "prompt_tokens": 2000000,
+                        "completion_tokens": 100000,
+                        "prompt_tokens_details": {"cached_tokens": 1000000},
+                    }
+                },
+            },
+            {
+                # Responses from before prompt caching have no details
+                "identifier": "Dummy-1",
+                "generation": {
+                    "usage": {"prompt_tokens": 1000000, "completion_tokens": 0}
+                },
+            },
+        ]
+
+        costs = CostCalculator.compute_costs(
+            samples, "openai-chatcompletion", "gpt-4o-2024-08-06"
+        )
+
+        assert costs is not None
+        assert costs["prompt_cost"] == pytest.approx(2.5 + 1.25 + 2.5)
+        assert costs["completion_cost"] == pytest.approx(1.0)
+        assert costs["total_cost"] == pytest.approx(7.25)
+
+    def test_async_provider(self):
+        samples = [
+            {
+                "identifier": "Dummy-0",
+                "generation": {
+                    "usage": {"prompt_tokens": 1000000, "completion_tokens": 1000000}
+                },
+            }
+        ]
+
+        # Samples generated with the async strategy are billed as the provider
+        costs = export_results.compute_costs(
+            samples, "openai-chatcompletion-async", "gpt-4o-2024-08-06"
+        )
+        assert costs is not None
+        assert costs["total_cost"] == pytest.approx(2.5 + 10)
+
+    def test_anthropic_cached_tokens(self):
+        samples = [
+            {
+                "identifier": "Dummy-0",
+                "generation": [
+                    {
+                        "usage": {
+                            "input_tokens": 10,
+                            "output_tokens": 1000000,
+                            "cache_creation_input_tokens": 1000000,
+                            "cache_read_input_tokens": 0,
+                        }
+                    },
+                    {
+                        "usage": {
+                            "input_tokens": 10,
+                            "output_tokens": 0,
+                            "cache_creation_input_tokens": 0,
+                            "cache_read_input_tokens": 1000000,
+                        }
+                    },
+                ],
+            }
+        ]
+
+        costs = CostCalculator.compute_costs(
+            samples, "anthropic", "claude-3-5-sonnet-20241022"
+        )
+
+        # The prompt is written to the cache once, and read by the other sample
+        assert costs is not None
+        assert costs["prompt_cost"] == pytest.approx(3 * (20e-6 + 1.25 + 0.1))
+        assert costs["completion_cost"] == pytest.approx(15)
+
+    def test_estimate_run(self):
+        samples = [
+            {"identifier": "Dummy-0", "prompt": " ".join(["word"] * 1000000)},
+            {"identifier": "Dummy-1", "prompt": None},
+        ]
+        strategy = CachingStrategy(n_samples=3)
+        count_prompt_tokens(samples, strategy)
+        prices = estimate_costs.get_prices(
+            "anthropic-async", "claude-3-5-sonnet-20241022"
+        )
+
+        estimate = estimate_costs.estimate_run(
+            samples,
+            strategy,
+            prices,
+            n_samples=3,
+            completion_tokens=1000,
+            requests_per_minute=1,
+        )
+
+        # The prompt is written to the cache once and read by the two other requests
+        assert estimate["requests"] == 3
+        assert estimate["input_tokens"] == 3000000
+        assert estimate["cached_input_tokens"] == 2000000
+        assert estimate["output_tokens"] == 3000
+        assert estimate["prompt_cost"] == pytest.approx(3 * (1.25 + 2 * 0.1))
+        assert estimate["completion_cost"] == pytest.approx(15 * 3000 / 1000000)
+        # Three requests at one request per minute
+        assert estimate["duration_seconds"] == pytest.approx(180)
+        assert estimate["duration_bound"] == "requests_per_minute"
+
+    def test_estimate_without_credentials(self, monkeypatch, tmp_path, capsys):
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+        monkeypatch.setattr(openai, "OpenAI", None)
+        monkeypatch.setattr(anthropic, "Anthropic", None)
+        samples_path = str(tmp_path / "samples.jsonl")
+        write_jsonl(samples_path, [{"identifier": "Dummy-0", "prompt": "prompt"}])
+
+        # No API client is created to estimate
+        for strategy_name, kwargs in [
+            ("openai-chatcompletion", {"model_name": "gpt-4o-2024-08-06"}),
+            (
+                "anthropic",
+                {"model_name": "claude-3-5-sonnet-20241022", "max_tokens": 1024},
+            ),
+        ]:
+            estimate_costs.entry_point(samples_path, strategy_name, **kwargs)
+            estimate = json.loads(capsys.readouterr().out)
+            assert estimate["prompts"] == 1
+            assert estimate["total_cost"] > 0
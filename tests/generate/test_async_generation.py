@@ -0,0 +1,293 @@
+from elleelleaime.generate.strategies.rate_limiter import (
+    RateLimiter,
+    get_rate_limiter,
+)
+from elleelleaime.generate.strategies.models.openai.openai import (
+    OpenAIChatCompletionModels,
+    AsyncOpenAIChatCompletionModels,
+    MAX_TRIES,
+    DEFAULT_COMPLETION_RESERVE,
+)
+from elleelleaime.generate.strategies.models.openrouter.openrouter import (
+    OpenRouterModels,
+    AsyncOpenRouterModels,
+)
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gzip
+import json
+import time
+import logging
+import openai
+import pytest
+import threading
+
+
+class MockCompletionsServer(ThreadingHTTPServer):
+    """
+    Local chat completions endpoint that answers after `latency` seconds and records
+    the bodies and number of requests, the connections, and the maximum number of
+    concurrent requests. The first `failures` requests fail with a server error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), MockCompletionsHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bodies: list = []
+        self.connections: set = set()
+        self.compressed_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = 0
+
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    server: MockCompletionsServer
+    # Keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        compressed = self.headers.get("Content-Encoding") == "gzip"
+        if compressed:
+            data = gzip.decompress(data)
+        body = json.loads(data)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bodies.append(body)
+            self.server.connections.add(self.client_address)
+            self.server.compressed_requests += compressed
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(
+                self.server.max_in_flight, self.server.in_flight
+            )
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.in_flight -= 1
+            failed = self.server.failures > 0
+            self.server.failures -= failed
+        if failed:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        n = body.get("n", 1)
+        response = json.dumps(
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": i,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": f"patch for {body['messages'][0]['content']}",
+                        },
+                    }
+                    for i in range(n)
+                ],
+                "usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 10,
+                    "total_tokens": 20,
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class TestAsyncGeneration:
+    server: MockCompletionsServer
+    base_url: str
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = MockCompletionsServer(latency=0.1)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setup_method(self):
+        self.server.requests = 0
+        self.server.bodies = []
+        self.server.connections = set()
+        self.server.compressed_requests = 0
+        self.server.max_in_flight = 0
+        self.server.failures = 0
+
+    def test_rate_limiter(self):
+        now = [0.0]
+        limiter = RateLimiter(
+            requests_per_minute=2, tokens_per_minute=60, clock=lambda: now[0]
+        )
+
+        assert limiter.try_acquire(10) == 0
+        assert limiter.try_acquire(10) == 0
+        # The request bucket is empty, and refills one request every 30 seconds
+        assert limiter.try_acquire(10) == 30
+
+        now[0] += 30
+        assert limiter.try_acquire(50) == 0
+        now[0] += 30
+        # The token bucket holds 40 tokens, and refills one token per second
+        assert limiter.try_acquire(50) == 10
+
+        # Tokens estimated in excess are given back after the request
+        limiter.adjust(-20)
+        assert limiter.try_acquire(50) == 0
+
+        # Limiters are shared by strategies with the same limits only
+        limiter = get_rate_limiter("mock", "mock-shared", requests_per_minute=10)
+        assert (
+            get_rate_limiter("mock", "mock-shared", requests_per_minute=10) is limiter
+        )
+        other = get_rate_limiter("mock", "mock-shared", requests_per_minute=20)
+        assert other is not limiter
+        assert other.requests_per_minute == 20
+
+    def test_openrouter_concurrency(self):
+        strategy = AsyncOpenRouterModels(
+            "mock-openrouter-concurrency",
+            n_samples=2,
+            max_concurrency=4,
+            base_url=self.base_url,
+        )
+        prompts = [f"prompt {i}" for i in range(8)]
+
+        start = time.monotonic()
+        generations = strategy.generate(prompts)
+        elapsed = time.monotonic() - start
+
+        # One request per sample, merged per prompt
+        assert self.server.requests == 16
+        assert len(generations) == 8
+        for prompt, generation in zip(prompts, generations):
+            assert len(generation) == 2
+            assert all(
+                response["choices"][0]["message"]["content"] == f"patch for {prompt}"
+                for response in generation
+            )
+
+        # Requests are sent concurrently, but never more than max_concurrency
+        assert 1 < self.server.max_in_flight <= 4
+        assert elapsed < 16 * self.server.latency
+        logging.info(f"{self.server.requests / elapsed:.1f} requests/s")
+
+    def test_openai_native_n(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        strategy = AsyncOpenAIChatCompletionModels(
+            "mock-gpt", n_samples=3, max_concurrency=8, base_url=self.base_url
+        )
+        prompts = [f"prompt {i}" for i in range(8)]
+
+        generations = strategy.generate(prompts)
+
+        # One request per prompt, with n choices
+        assert self.server.requests == 8
+        assert [len(generation["choices"]) for generation in generations] == [3] * 8
+        assert 1 < self.server.max_in_flight <= 8
+
+    def test_rate_limited_requests(self):
+        strategy = AsyncOpenRouterModels(
+            "mock-openrouter-rate-limited",
+            max_concurrency=8,
+            requests_per_minute=120,
+            base_url=self.base_url,
+        )
+        # Empty the bucket, which starts full
+        while strategy.rate_limiter.try_acquire() == 0:
+            pass
+
+        start = time.monotonic()
+        strategy.generate(["prompt 0", "prompt 1"])
+        elapsed = time.monotonic() - start
+
+        # The bucket refills one request every 0.5 seconds
+        assert self.server.requests == 2
+        assert elapsed >= 0.8
+
+    def test_openrouter_keep_alive(self):
+        strategy = OpenRouterModels(
+            "mock-openrouter-keep-alive",
+            n_samples=4,
+            compress_requests=True,
+            base_url=self.base_url,
+        )
+
+        generations = strategy.generate(["prompt 0", "prompt 1"])
+
+        # All requests of the worker reuse one connection
+        assert [len(generation) for generation in generations] == [4, 4]
+        assert self.server.requests == 8
+        assert len(self.server.connections) == 1
+        assert self.server.compressed_requests == 8
+
+    def test_openai_max_prompt_tokens(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+
+        # The preview models of gpt-4 have a larger context than gpt-4
+        for model_name, context_size in [
+            ("gpt-4-0613", 8192),
+            ("gpt-4-1106-preview", 128000),
+            ("gpt-4-0125-preview", 128000),
+        ]:
+            strategy = OpenAIChatCompletionModels(model_name)
+            assert (
+                strategy.max_prompt_tokens()
+                == context_size - DEFAULT_COMPLETION_RESERVE
+            )
+
+        # The completion budget is kept out of the prompt, and sent with the request
+        strategy = AsyncOpenAIChatCompletionModels(
+            "gpt-4-0613", max_tokens=2000, base_url=self.base_url
+        )
+        assert strategy.max_prompt_tokens() == 8192 - 2000
+        strategy.generate(["prompt"])
+        assert self.server.bodies[-1]["max_completion_tokens"] == 2000
+
+    def test_openai_transient_errors(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        strategy = OpenAIChatCompletionModels("mock-gpt", base_url=self.base_url)
+        monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+        # Server errors are retried
+        self.server.failures = 2
+        generation = strategy.generate_unit("prompt")
+        assert generation["choices"][0]["message"]["content"] == "patch for prompt"
+        assert self.server.requests == 3
+
+        # Up to MAX_TRIES times
+        self.server.requests = 0
+        self.server.failures = MAX_TRIES
+        with pytest.raises(openai.InternalServerError):
+            strategy.generate_unit("prompt")
+        assert self.server.requests == MAX_TRIES
+
+    def test_async_openai_transient_errors(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        strategy = AsyncOpenAIChatCompletionModels("mock-gpt", base_url=self.base_url)
+
+        self.server.failures = 1
+        generations = strategy.generate(["prompt"])
+        assert generations[0]["choices"][0]["message"]["content"] == "patch for prompt"
+        assert self.server.requests == 2
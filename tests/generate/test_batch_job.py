@@ -0,0 +1,293 @@
+# Benchmark and Bug import each other, and only resolve when Benchmark is imported first
+from elleelleaime.core.benchmarks.benchmark import Benchmark
+from elleelleaime.generate.strategies.registry import PatchGenerationStrategyRegistry
+from elleelleaime.generate.strategies.models.openai.openai import (
+    OpenAIChatCompletionModels,
+)
+from elleelleaime.generate.strategies.models.anthropic.anthropic import (
+    AnthropicModels,
+)
+from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl
+from elleelleaime.export.cost.cost_calculator import CostCalculator
+from elleelleaime.evaluate.strategies.openai.openai import OpenAIEvaluationStrategy
+from elleelleaime.evaluate.strategies.anthropic.anthropic import (
+    AnthropicEvaluationStrategy,
+)
+import generate_patches
+
+from types import SimpleNamespace
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+import os
+import json
+import httpx
+import pytest
+import tempfile
+
+
+class StubOpenAIBatches:
+    """
+    Stub of the files and batches endpoints of the OpenAI client. Batches are in progress
+    the first time they are retrieved, and completed afterwards. Requests whose prompt
+    contains "fail", or whose custom id is in `failing`, fail.
+    """
+
+    def __init__(self, failing: Set[str] = set()) -> None:
+        self.failing = failing
+        self.files: Dict[str, str] = {}
+        self.batches: Dict[str, dict] = {}
+        self.retrievals = 0
+        self.files_api = SimpleNamespace(create=self.create_file, content=self.content)
+        self.batches_api = SimpleNamespace(
+            create=self.create_batch, retrieve=self.retrieve_batch
+        )
+
+    def create_file(self, file: Any, purpose: str) -> Any:
+        assert purpose == "batch"
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = file[1].decode()
+        return SimpleNamespace(id=file_id)
+
+    def content(self, file_id: str) -> Any:
+        return SimpleNamespace(text=self.files[file_id])
+
+    def create_batch(
+        self, input_file_id: str, endpoint: str, completion_window: str
+    ) -> Any:
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {"input_file_id": input_file_id}
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve_batch(self, batch_id: str) -> Any:
+        self.retrievals += 1
+        if self.retrievals == 1:
+            return SimpleNamespace(status="in_progress", errors=None)
+
+        output = []
+        for line in self.files[self.batches[batch_id]["input_file_id"]].splitlines():
+            request = json.loads(line)
+            prompt = request["body"]["messages"][0]["content"]
+            body = {
+                "choices": [
+                    {"message": {"role": "assistant", "content": f"patch for {prompt}"}}
+                    for _ in range(request["body"].get("n", 1))
+                ],
+                "usage": {"prompt_tokens": 1000000, "completion_tokens": 0},
+            }
+            failed = "fail" in prompt or request["custom_id"] in self.failing
+            status_code = 500 if failed else 200
+            output.append(
+                json.dumps(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": status_code, "body": body},
+                    }
+                )
+            )
+        output_file_id = f"file-{len(self.files)}"
+        self.files[output_file_id] = "\n".join(output)
+        return SimpleNamespace(
+            status="completed", output_file_id=output_file_id, errors=None
+        )
+
+
+class StubAnthropicClient:
+    """
+    Stub of the message batches endpoints of the Anthropic API. Requests whose custom id
+    is in `failing` error.
+    """
+
+    def __init__(self, failing: Set[str] = set()) -> None:
+        self.failing = failing
+        self.requests: List[dict] = []
+        self.polls = 0
+
+    def post(self, path: str, body: dict, cast_to: Any, options: dict) -> Any:
+        assert path == "/v1/messages/batches"
+        assert "anthropic-beta" in options["headers"]
+        self.requests = body["requests"]
+        return {"id": "msgbatch-0", "processing_status": "in_progress"}
+
+    def get(self, path: str, cast_to: Any, options: dict) -> Any:
+        if cast_to is httpx.Response:
+            results = [
+                {
+                    "custom_id": request["custom_id"],
+                    "result": (
+                        {"type": "errored", "error": {"type": "api_error"}}
+                        if request["custom_id"] in self.failing
+                        else {
+                            "type": "succeeded",
+                            "message": {
+                                "content": [
+                                    {
+                                        "type": "text",
+                                        "text": f"patch for {request['params']['messages'][0]['content'][0]['text']}",
+                                    }
+                                ],
+                                "usage": {"input_tokens": 1000000, "output_tokens": 0},
+                            },
+                        }
+                    ),
+                }
+                for request in self.requests
+            ]
+            return httpx.Response(
+                200, text="\n".join(json.dumps(result) for result in results)
+            )
+
+        assert path == "/v1/messages/batches/msgbatch-0"
+        self.polls += 1
+        return {
+            "id": "msgbatch-0",
+            "processing_status": "ended" if self.polls > 1 else "in_progress",
+            "results_url": "https://example.com/results",
+        }
+
+
+class TestBatchJob:
+    def test_openai_batch_job(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "stub")
+        stub = StubOpenAIBatches()
+        strategy = OpenAIChatCompletionModels(
+            "gpt-4o-mini", n_samples=3, poll_interval=0
+        )
+        strategy.client = SimpleNamespace(
+            files=stub.files_api, batches=stub.batches_api
+        )
+        monkeypatch.setattr(
+            PatchGenerationStrategyRegistry,
+            "get_generation",
+            lambda *args, **kwargs: strategy,
+        )
+        samples = [
+            {"identifier": "Dummy-0", "prompt": "prompt 0"},
+            {"identifier": "Dummy-1", "prompt": None},
+            {"identifier": "Dummy-2", "prompt": "prompt fail"},
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            samples_path = os.path.join(tmp_dir, "samples_dummy_instruct_.jsonl")
+            write_jsonl(samples_path, samples)
+
+            generate_patches.entry_point(
+                samples_path,
+                "openai-chatcompletion",
+                batch_job=True,
+                model_name="gpt-4o-mini",
+            )
+
+            output_path = Path(
+                tmp_dir,
+                "candidates_dummy_instruct_openai-chatcompletion_model_name=gpt-4o-mini.jsonl",
+            )
+            output = list(stream_jsonl(str(output_path)))
+            assert not os.path.exists(f"{output_path}.batch")
+
+        # One request per prompt, with n samples
+        assert len(stub.batches) == 1
+        assert [sample["identifier"] for sample in output] == [
+            "Dummy-0",
+            "Dummy-1",
+            "Dummy-2",
+        ]
+        assert [
+            choice["message"]["content"]
+            for choice in output[0]["generation"]["choices"]
+        ] == ["patch for prompt 0"] * 3
+        assert output[1]["generation"] is None
+        assert output[2]["generation"] is None
+
+    def test_openai_resume_batch_job(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "stub")
+        stub = StubOpenAIBatches()
+        strategy = OpenAIChatCompletionModels("o1-mini", n_samples=2, poll_interval=0)
+        strategy.client = SimpleNamespace(
+            files=stub.files_api, batches=stub.batches_api
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            job_file = os.path.join(tmp_dir, "candidates.jsonl.batch")
+
+            # The first run is interrupted while polling
+            def interrupt(batch_id: str) -> Any:
+                raise KeyboardInterrupt()
+
+            stub.batches_api.retrieve = interrupt
+            with pytest.raises(KeyboardInterrupt):
+                strategy.generate_batch_job(["prompt 0"], job_file)
+            assert Path(job_file).read_text() == "batch-0"
+
+            # The second run polls the same batch
+            stub.batches_api.retrieve = stub.retrieve_batch
+            generations = strategy.generate_batch_job(["prompt 0"], job_file)
+
+        # o1-mini does not support n, so there is one request per sample
+        assert len(stub.batches) == 1
+        assert [
+            generation["choices"][0]["message"]["content"]
+            for generation in generations[0]
+        ] == ["patch for prompt 0"] * 2
+
+    def test_anthropic_batch_job(self, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "stub")
+        strategy = AnthropicModels(
+            "claude-3-5-sonnet-20241022", max_tokens=128, n_samples=2, poll_interval=0
+        )
+        strategy.client = StubAnthropicClient()  # type: ignore
+
+        generations = strategy.generate_batch_job(["prompt 0", "prompt 1"])
+
+        # The prompt is marked for caching, as it is sent once per sample
+        assert len(strategy.client.requests) == 4
+        assert all(
+            request["params"]["messages"][0]["content"][0]["cache_control"]
+            == {"type": "ephemeral"}
+            for request in strategy.client.requests
+        )
+        assert [
+            [message["content"][0]["text"] for message in generation]
+            for generation in generations
+        ] == [["patch for prompt 0"] * 2, ["patch for prompt 1"] * 2]
+
+    def test_partially_failed_batch_job(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "stub")
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "stub")
+        openai_stub = StubOpenAIBatches(failing={"0-1"})
+        openai_strategy = OpenAIChatCompletionModels(
+            "o1-preview-2024-09-12", n_samples=2, poll_interval=0
+        )
+        openai_strategy.client = SimpleNamespace(
+            files=openai_stub.files_api, batches=openai_stub.batches_api
+        )
+        anthropic_strategy = AnthropicModels(
+            "claude-3-5-sonnet-20241022", max_tokens=128, n_samples=2, poll_interval=0
+        )
+        anthropic_strategy.client = StubAnthropicClient(failing={"0-0"})  # type: ignore
+
+        # The failed request of each sample is None
+        openai_sample = {
+            "identifier": "Dummy-0",
+            "generation": openai_strategy.generate_batch_job(["prompt 0"])[0],
+        }
+        anthropic_sample = {
+            "identifier": "Dummy-0",
+            "generation": anthropic_strategy.generate_batch_job(["prompt 0"])[0],
+        }
+        assert openai_sample["generation"][1] is None
+        assert anthropic_sample["generation"][0] is None
+
+        # Only the successful requests are billed and evaluated
+        costs = CostCalculator.compute_costs(
+            [openai_sample], "openai-chatcompletion", "o1-preview-2024-09-12"
+        )
+        assert costs is not None and costs["prompt_cost"] == 15
+        costs = CostCalculator.compute_costs(
+            [anthropic_sample], "anthropic", "claude-3-5-sonnet-20241022"
+        )
+        assert costs is not None and costs["prompt_cost"] == 3
+        openai_evaluation = OpenAIEvaluationStrategy(use_cache=False)
+        assert len(openai_evaluation.extract_candidates(openai_sample)) == 1
+        anthropic_evaluation = AnthropicEvaluationStrategy(use_cache=False)
+        assert len(anthropic_evaluation.extract_candidates(anthropic_sample)) == 1
@@ -0,0 +1,203 @@
+from elleelleaime.generate.strategies.strategy import PatchGenerationStrategy
+from elleelleaime.generate.strategies.registry import PatchGenerationStrategyRegistry
+from elleelleaime.core.utils.jsonl import stream_jsonl, write_jsonl
+import generate_patches
+
+from pathlib import Path
+from typing import Any, List
+
+import os
+import time
+import pytest
+import tempfile
+
+
+class FlakyStrategy(PatchGenerationStrategy):
+    """
+    Generates one patch per prompt, and fails after `max_calls` generations.
+    """
+
+    def __init__(self, max_calls: int) -> None:
+        self.max_calls = max_calls
+        self.prompts: List[str] = []
+
+    def _generate_impl(self, chunk: List[str]) -> Any:
+        if len(self.prompts) >= self.max_calls:
+            raise RuntimeError("API outage")
+        self.prompts.extend(chunk)
+        return [[f"patch for {prompt}"] for prompt in chunk]
+
+
+class UnitStrategy(PatchGenerationStrategy):
+    """
+    Generates each sample of a prompt with a separate request.
+    """
+
+    def __init__(self, n_samples: int) -> None:
+        self.n_samples = n_samples
+        self.units: List[str] = []
+
+    def units_per_prompt(self) -> int:
+        return self.n_samples
+
+    def _generate_unit(self, prompt: str) -> Any:
+        time.sleep(0.05)
+        self.units.append(prompt)
+        return f"sample for {prompt}"
+
+    def _merge_units(self, units: List[Any]) -> Any:
+        return units
+
+    def _generate_impl(self, chunk: List[str]) -> Any:
+        return [
+            [self._generate_unit(prompt) for _ in range(self.n_samples)]
+            for prompt in chunk
+        ]
+
+
+class WordStrategy(FlakyStrategy):
+    """
+    Counts one token per word, and fits prompts of at most 3 words.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(max_calls=10)
+        self.counted: List[str] = []
+
+    def tokenizer_name(self) -> str:
+        return "words"
+
+    def count_tokens(self, prompts: List[str]) -> List[int]:
+        self.counted.extend(prompts)
+        return [len(prompt.split()) for prompt in prompts]
+
+    def max_prompt_tokens(self) -> int:
+        return 3
+
+
+class TestGeneratePatches:
+    def test_units_spread_across_workers(self):
+        samples = [
+            {"identifier": "Dummy-0", "prompt": "long prompt"},
+            {"identifier": "Dummy-1", "prompt": None},
+        ]
+        strategies = [UnitStrategy(n_samples=3) for _ in range(3)]
+        checkpointed = []
+
+        generate_patches.generate_candidates(
+            samples, strategies, checkpoint=checkpointed.extend
+        )
+
+        # Each worker generated one of the samples of the long prompt
+        assert [len(strategy.units) for strategy in strategies] == [1, 1, 1]
+        assert samples[0]["generation"] == ["sample for long prompt"] * 3
+        assert samples[1]["generation"] is None
+        assert checkpointed == [samples[0]]
+
+    def test_resume_from_checkpoint(self, monkeypatch):
+        samples = [
+            {"identifier": f"Dummy-{i}", "prompt": f"prompt {i}" if i != 3 else None}
+            for i in range(6)
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            samples_path = os.path.join(tmp_dir, "samples_dummy_instruct_.jsonl")
+            write_jsonl(samples_path, samples)
+            output_path = Path(
+                tmp_dir,
+                "candidates_dummy_instruct_flaky_model_name=flaky.jsonl",
+            )
+
+            # The first run fails after generating two samples
+            strategy = FlakyStrategy(max_calls=2)
+            monkeypatch.setattr(
+                PatchGenerationStrategyRegistry,
+                "get_generation",
+                lambda *args, **kwargs: strategy,
+            )
+            with pytest.raises(RuntimeError):
+                generate_patches.entry_point(samples_path, "flaky", model_name="flaky")
+            assert not output_path.exists()
+            checkpoint = list(stream_jsonl(f"{output_path}.partial"))
+            assert [sample["identifier"] for sample in checkpoint] == [
+                "Dummy-0",
+                "Dummy-1",
+            ]
+
+            # The second run only generates the missing samples
+            strategy = FlakyStrategy(max_calls=10)
+            generate_patches.entry_point(samples_path, "flaky", model_name="flaky")
+            assert strategy.prompts == ["prompt 2", "prompt 4", "prompt 5"]
+
+            output = list(stream_jsonl(str(output_path)))
+            assert [sample["identifier"] for sample in output] == [
+                f"Dummy-{i}" for i in range(6)
+            ]
+            for sample in output:
+                if sample["prompt"] is None:
+                    assert sample["generation"] is None
+                else:
+                    assert sample["generation"] == [f"patch for {sample['prompt']}"]
+            assert not os.path.exists(f"{output_path}.partial")
+
+    def test_prefilter_oversized_prompts(self, monkeypatch):
+        samples = [
+            {"identifier": "Dummy-0", "prompt": "short prompt"},
+            {"identifier": "Dummy-1", "prompt": "a prompt that is too long"},
+            # Counted when the samples were annotated with the same tokenizer
+            {
+                "identifier": "Dummy-2",
+                "prompt": "counted prompt",
+                "prompt_tokens": {"words": 2},
+            },
+        ]
+        strategy = WordStrategy()
+        monkeypatch.setattr(
+            PatchGenerationStrategyRegistry,
+            "get_generation",
+            lambda *args, **kwargs: strategy,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            samples_path = os.path.join(tmp_dir, "samples_dummy_instruct_.jsonl")
+            write_jsonl(samples_path, samples)
+            generate_patches.entry_point(samples_path, "words", model_name="words")
+            output = list(
+                stream_jsonl(
+                    os.path.join(
+                        tmp_dir,
+                        "candidates_dummy_instruct_words_model_name=words.jsonl",
+                    )
+                )
+            )
+
+        # Prompts are counted once, and the oversized prompt is never generated
+        assert strategy.counted == ["short prompt", "a prompt that is too long"]
+        assert strategy.prompts == ["short prompt", "counted prompt"]
+        assert [sample["prompt_tokens"] for sample in output] == [
+            {"words": 2},
+            {"words": 6},
+            {"words": 2},
+        ]
+        assert output[1]["generation"] is None
+        assert output[1]["skip_reason"] == "prompt_too_long"
+
+        # A resumed run keeps the samples already generated, even if they are oversized
+        strategy = WordStrategy()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            samples_path = os.path.join(tmp_dir, "samples_dummy_instruct_.jsonl")
+            write_jsonl(samples_path, samples)
+            output_path = os.path.join(
+                tmp_dir, "candidates_dummy_instruct_words_model_name=words.jsonl"
+            )
+            write_jsonl(
+                f"{output_path}.partial",
+                [{"identifier": "Dummy-1", "generation": ["paid for"]}],
+            )
+            generate_patches.entry_point(samples_path, "words", model_name="words")
+            output = list(stream_jsonl(output_path))
+
+        assert strategy.counted == ["short prompt"]
+        assert strategy.prompts == ["short prompt", "counted prompt"]
+        assert output[1]["generation"] == ["paid for"]
+        assert "skip_reason" not in output[1]
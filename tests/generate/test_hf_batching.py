@@ -0,0 +1,308 @@
+from elleelleaime.generate.strategies.models.huggingface import batching
+from elleelleaime.generate.strategies.models.huggingface.batching import (
+    make_batches,
+    generate_batched,
+)
+from elleelleaime.generate.strategies.models.huggingface.model_registry import (
+    HuggingFaceModelRegistry,
+)
+from elleelleaime.generate.strategies.models.huggingface.codellama import (
+    codellama_infilling,
+    codellama_instruct,
+)
+from elleelleaime.generate.strategies.models.huggingface.codellama.codellama_infilling import (
+    CodeLLaMAInfilling,
+)
+from elleelleaime.generate.strategies.models.huggingface.codellama.codellama_instruct import (
+    CodeLLaMAIntruct,
+)
+
+from typing import Any, List
+
+import contextlib
+import pytest
+
+
+class FakeTokenizer:
+    """
+    Tokenizes prompts into one token per word.
+    """
+
+    pad_token = None
+    eos_token = "<pad>"
+    pad_token_id = 0
+
+    def encode_plus(self, prompt: str) -> dict:
+        return {"input_ids": prompt.split()}
+
+
+class FakeTorch:
+    no_grad = contextlib.nullcontext
+
+    @staticmethod
+    def tensor(data: List[List[Any]], device: str) -> List[List[Any]]:
+        return data
+
+
+class FakeModel:
+    """
+    Generates, for each returned sequence, the last token of the prompt followed by the
+    index of the sequence.
+    """
+
+    device = "cpu"
+
+    def __init__(self) -> None:
+        self.batches: List[List[List[Any]]] = []
+        self.masks: List[List[List[int]]] = []
+
+    def generate(
+        self,
+        input_ids: List[List[Any]],
+        attention_mask: List[List[int]],
+        num_return_sequences: int,
+        **kwargs,
+    ):
+        self.batches.append(input_ids)
+        self.masks.append(attention_mask)
+        return [
+            row + [f"{row[-1]}-{k}"]
+            for row in input_ids
+            for k in range(num_return_sequences)
+        ]
+
+
+def real_transformers() -> Any:
+    """
+    Returns the torch and transformers modules, skipping the test if they are not
+    installed.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    if not isinstance(getattr(torch, "__version__", None), str) or not isinstance(
+        getattr(transformers, "__version__", None), str
+    ):
+        pytest.skip("torch and transformers are not installed")
+    return torch, transformers
+
+
+class TestHFBatching:
+    def test_make_batches(self):
+        lengths = [5, 100, 7, 98, 6, 50]
+
+        # Prompts of similar length are batched together, longest first
+        assert make_batches(lengths, batch_size=2) == [[1, 3], [5, 2], [4, 0]]
+        # The padded batch must fit in the token budget
+        assert make_batches(lengths, batch_size=4, max_tokens_per_batch=200) == [
+            [1, 3],
+            [5, 2, 4, 0],
+        ]
+        # Prompts over the budget are batched alone
+        assert make_batches(lengths, batch_size=4, max_tokens_per_batch=50) == [
+            [1],
+            [3],
+            [5],
+            [2, 4, 0],
+        ]
+
+    def test_generate_batched(self, monkeypatch):
+        monkeypatch.setattr(batching, "torch", FakeTorch)
+        input_ids = [["a"], ["b"] * 4, ["c"] * 2, ["d"] * 5, ["e"]]
+        model = FakeModel()
+
+        generations = generate_batched(
+            model,
+            FakeTokenizer(),
+            input_ids,
+            batch_size=2,
+            max_tokens_per_batch=None,
+            num_return_sequences=2,
+            decode=lambda outputs, inputs: [
+                row[len(inputs["input_ids"][0]) :][0] for row in outputs
+            ],
+        )
+
+        # Generations are in the order of the prompts
+        assert generations == [
+            [f"{ids[-1]}-{k}" for k in range(2)] for ids in input_ids
+        ]
+        # Batches are left-padded to their longest prompt, and the padding is masked
+        assert model.batches[0] == [["d"] * 5, [0] + ["b"] * 4]
+        assert model.masks[0] == [[1] * 5, [0] + [1] * 4]
+        assert len(model.batches) == 3
+
+    def test_codellama_infilling_layout(self, monkeypatch):
+        torch, transformers = real_transformers()
+        try:
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
+                "codellama/CodeLlama-7b-hf"
+            )
+        except OSError:
+            pytest.skip("The CodeLlama tokenizer is not available")
+
+        class EchoModel:
+            """
+            Generates the middle token after each prompt, recording the inputs.
+            """
+
+            device = "cpu"
+
+            def __init__(self) -> None:
+                self.inputs: List[Any] = []
+
+            def generate(self, input_ids, attention_mask, num_return_sequences, **kw):
+                self.inputs.append((input_ids, attention_mask))
+                middle = torch.full((input_ids.shape[0], 1), tokenizer.middle_id)
+                outputs = torch.cat([input_ids, middle], dim=1)
+                return outputs.repeat_interleave(num_return_sequences, dim=0)
+
+        model = EchoModel()
+        monkeypatch.setattr(
+            HuggingFaceModelRegistry,
+            "acquire",
+            lambda model_name, dtype: (model, tokenizer),
+        )
+        monkeypatch.setattr(
+            HuggingFaceModelRegistry, "get_tokenizer", lambda model_name: tokenizer
+        )
+        prompts = [
+            "def add(a, b):\n    <FILL_ME>\n    return c",
+            "x = <FILL_ME>",
+        ]
+        strategy = CodeLLaMAInfilling(
+            "codellama/CodeLlama-7b-hf", batch_size=2, num_return_sequences=1
+        )
+        strategy.generate(prompts)
+
+        # Both prompts are generated in one left-padded batch, each in the
+        # <PRE> prefix <SUF> suffix <MID> layout
+        ((input_ids, attention_mask),) = model.inputs
+        rows = [
+            row[mask.bool()].tolist() for row, mask in zip(input_ids, attention_mask)
+        ]
+        for row in rows:
+            prefix = row.index(tokenizer.prefix_id)
+            suffix = row.index(tokenizer.suffix_id)
+            assert prefix < suffix < len(row) - 1
+            assert row[-1] == tokenizer.middle_id
+        assert "FILL_ME" not in tokenizer.decode(input_ids.flatten())
+        # The prompts are counted as they are generated
+        assert sorted(strategy.count_tokens(prompts), reverse=True) == [
+            len(row) for row in rows
+        ]
+
+    def test_instruct_output_reserve(self, monkeypatch):
+        monkeypatch.setattr(
+            HuggingFaceModelRegistry,
+            "acquire",
+            lambda model_name, **kwargs: (FakeModel(), FakeTokenizer()),
+        )
+        calls = []
+        monkeypatch.setattr(
+            codellama_instruct,
+            "generate_batched",
+            lambda model, tokenizer, input_ids, **kwargs: calls.append(input_ids)
+            or [["x"] for _ in input_ids],
+        )
+        strategy = CodeLLaMAIntruct(
+            "meta-llama/CodeLlama-7b-Instruct-hf", max_length=10, output_reserve=4
+        )
+        assert strategy.max_prompt_tokens() == 6
+
+        # The formatted prompts count two more words, and only the first fits
+        assert strategy.generate(["w w w w", "w w w w w"]) == [["x"], None]
+        assert [len(ids) for ids in calls[0]] == [6]
+
+    def test_assisted_generation(self, monkeypatch):
+        target, draft = "codellama/CodeLlama-34b-hf", "codellama/CodeLlama-7b-hf"
+        models = {target: FakeModel(), draft: FakeModel()}
+        monkeypatch.setattr(
+            HuggingFaceModelRegistry,
+            "acquire",
+            lambda model_name, dtype: (models[model_name], FakeTokenizer()),
+        )
+        calls = []
+        monkeypatch.setattr(
+            codellama_infilling,
+            "generate_batched",
+            lambda model, tokenizer, input_ids, **kwargs: calls.append(kwargs)
+            or [["x"] for _ in input_ids],
+        )
+
+        # The draft model is passed to generate
+        strategy = CodeLLaMAInfilling(target, assistant_model_name=draft)
+        strategy.generate(["a <FILL_ME> b"])
+        assert calls[-1]["assistant_model"] is models[draft]
+
+        strategy = CodeLLaMAInfilling(target, prompt_lookup_num_tokens=10)
+        strategy.generate(["a <FILL_ME> b"])
+        assert calls[-1]["prompt_lookup_num_tokens"] == 10
+        assert "assistant_model" not in calls[-1]
+
+        # The sequences are generated one per call
+        calls.clear()
+        strategy = CodeLLaMAInfilling(
+            target, prompt_lookup_num_tokens=10, num_return_sequences=3
+        )
+        assert strategy.generate(["a <FILL_ME> b"]) == [["a x b"] * 3]
+        assert [call["num_return_sequences"] for call in calls] == [1, 1, 1]
+
+        # Assisted generation does not support batches of prompts
+        with pytest.raises(AssertionError):
+            CodeLLaMAInfilling(target, prompt_lookup_num_tokens=10, batch_size=4)
+        with pytest.raises(AssertionError):
+            CodeLLaMAInfilling(
+                target, assistant_model_name=draft, prompt_lookup_num_tokens=10
+            )
+
+    def test_assisted_generate(self, monkeypatch):
+        torch, transformers = real_transformers()
+        tokenizers = pytest.importorskip("tokenizers")
+
+        # A tiny random Llama model, with one token per word
+        words = ["<pad>", "</s>", "<unk>", "<FILL_ME>"] + [f"w{i}" for i in range(28)]
+        tokenizer = transformers.PreTrainedTokenizerFast(
+            tokenizer_object=tokenizers.Tokenizer(
+                tokenizers.models.WordLevel(
+                    {word: i for i, word in enumerate(words)}, unk_token="<unk>"
+                )
+            ),
+            pad_token="<pad>",
+            eos_token="</s>",
+            unk_token="<unk>",
+            model_input_names=["input_ids", "attention_mask"],
+        )
+        tokenizer.backend_tokenizer.pre_tokenizer = (
+            tokenizers.pre_tokenizers.Whitespace()
+        )
+        torch.manual_seed(0)
+        model = transformers.LlamaForCausalLM(
+            transformers.LlamaConfig(
+                vocab_size=len(words),
+                hidden_size=16,
+                intermediate_size=32,
+                num_hidden_layers=1,
+                num_attention_heads=2,
+                num_key_value_heads=2,
+                pad_token_id=0,
+                eos_token_id=1,
+            )
+        ).eval()
+        monkeypatch.setattr(
+            HuggingFaceModelRegistry,
+            "acquire",
+            lambda model_name, dtype: (model, tokenizer),
+        )
+        prompts = ["w1 w2 w3 w1 w2 <FILL_ME> w4", "w5 w6 w5 w6 <FILL_ME>"]
+
+        # Greedy prompt lookup decoding generates the same fillings as greedy decoding
+        expected = CodeLLaMAInfilling(
+            "codellama/CodeLlama-7b-hf", num_return_sequences=1, max_length=24
+        ).generate(prompts)
+        generations = CodeLLaMAInfilling(
+            "codellama/CodeLlama-7b-hf",
+            prompt_lookup_num_tokens=3,
+            num_return_sequences=2,
+            max_length=24,
+        ).generate(prompts)
+        assert generations == [fillings * 2 for fillings in expected]
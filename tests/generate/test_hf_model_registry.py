@@ -0,0 +1,155 @@
+from elleelleaime.generate.strategies.models.huggingface import model_registry
+from elleelleaime.generate.strategies.models.huggingface.model_registry import (
+    HuggingFaceModelRegistry,
+)
+from elleelleaime.generate.strategies.models.huggingface.codellama.codellama_infilling import (
+    CodeLLaMAInfilling,
+)
+
+from typing import List
+
+import os
+import tempfile
+
+
+class FakeModel:
+    def __init__(self, name: str, loads: List[str]) -> None:
+        self.name = name
+        loads.append(name)
+
+    def eval(self) -> None:
+        pass
+
+    def merge_and_unload(self) -> "FakeModel":
+        return FakeModel(f"{self.name}+merged", [])
+
+    def save_pretrained(self, path: str, safe_serialization: bool) -> None:
+        assert safe_serialization
+        os.makedirs(path)
+        with open(os.path.join(path, "model.safetensors"), "w") as f:
+            f.write(self.name)
+
+
+class TestHuggingFaceModelRegistry:
+    loads: List[str]
+
+    def setup_method(self):
+        HuggingFaceModelRegistry.clear()
+        self.loads = []
+
+    def teardown_method(self):
+        HuggingFaceModelRegistry.clear()
+
+    def patch_loaders(self, monkeypatch):
+        loads = self.loads
+
+        class FakeAutoModel:
+            @staticmethod
+            def from_pretrained(name: str, **kwargs) -> FakeModel:
+                return FakeModel(name, loads)
+
+        class FakePeftModel:
+            @staticmethod
+            def from_pretrained(model: FakeModel, adapter_name: str) -> FakeModel:
+                return FakeModel(f"{model.name}+{adapter_name}", loads)
+
+        class FakeAutoTokenizer:
+            @staticmethod
+            def from_pretrained(name: str) -> str:
+                return f"tokenizer of {name}"
+
+        monkeypatch.setattr(model_registry, "AutoModelForCausalLM", FakeAutoModel)
+        monkeypatch.setattr(model_registry, "PeftModel", FakePeftModel)
+        monkeypatch.setattr(model_registry, "AutoTokenizer", FakeAutoTokenizer)
+
+    def test_models_loaded_once(self, monkeypatch):
+        self.patch_loaders(monkeypatch)
+
+        first = HuggingFaceModelRegistry.acquire("model-a")
+        second = HuggingFaceModelRegistry.acquire("model-a")
+        other = HuggingFaceModelRegistry.acquire("model-a", adapter_name="adapter")
+
+        # The same model is shared, and other adapters are loaded alongside
+        assert first is second
+        assert other[0].name == "model-a+adapter+merged"
+        assert self.loads == ["model-a", "model-a", "model-a+adapter"]
+        assert HuggingFaceModelRegistry.is_loaded("model-a")
+        assert not HuggingFaceModelRegistry.is_loaded("model-a", dtype="float32")
+
+    def test_merged_weights_cached(self, monkeypatch):
+        self.patch_loaders(monkeypatch)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            HuggingFaceModelRegistry.acquire(
+                "org/model-a", adapter_name="org/adapter", merged_cache_dir=cache_dir
+            )
+            (merged_dir,) = os.listdir(cache_dir)
+            assert os.path.exists(
+                os.path.join(cache_dir, merged_dir, "model.safetensors")
+            )
+
+            # A new process loads the merged weights without merging again
+            HuggingFaceModelRegistry.clear()
+            self.loads.clear()
+            HuggingFaceModelRegistry.acquire(
+                "org/model-a", adapter_name="org/adapter", merged_cache_dir=cache_dir
+            )
+            assert self.loads == [os.path.join(cache_dir, merged_dir)]
+
+    def test_models_released(self, monkeypatch):
+        self.patch_loaders(monkeypatch)
+
+        HuggingFaceModelRegistry.acquire("model-a")
+        HuggingFaceModelRegistry.acquire("model-a")
+        HuggingFaceModelRegistry.acquire("model-b")
+        assert HuggingFaceModelRegistry.references("model-a") == 2
+
+        # A model stays loaded until it is released by all its users
+        HuggingFaceModelRegistry.release("model-a")
+        assert HuggingFaceModelRegistry.is_loaded("model-a")
+        HuggingFaceModelRegistry.release("model-a")
+        assert not HuggingFaceModelRegistry.is_loaded("model-a")
+        assert HuggingFaceModelRegistry.is_loaded("model-b")
+
+        # Models can be evicted while in use, and are loaded again when acquired
+        HuggingFaceModelRegistry.evict("model-b")
+        assert not HuggingFaceModelRegistry.is_loaded("model-b")
+        HuggingFaceModelRegistry.acquire("model-b")
+        assert self.loads == ["model-a", "model-b", "model-b"]
+
+    def test_acquire_while_released(self, monkeypatch):
+        self.patch_loaders(monkeypatch)
+        evict = HuggingFaceModelRegistry.evict
+        acquired = []
+
+        # Another strategy acquires the model while its last user releases it
+        def acquire_then_evict(*args, **kwargs):
+            acquired.append(HuggingFaceModelRegistry.acquire("model-a"))
+            evict(*args, **kwargs)
+
+        HuggingFaceModelRegistry.acquire("model-a")
+        monkeypatch.setattr(HuggingFaceModelRegistry, "evict", acquire_then_evict)
+        HuggingFaceModelRegistry.release("model-a")
+
+        # A model that is acquired is never unloaded
+        assert HuggingFaceModelRegistry.references("model-a") == len(acquired)
+        assert HuggingFaceModelRegistry.is_loaded("model-a") == bool(acquired)
+
+    def test_infilling_shares_models(self, monkeypatch):
+        self.patch_loaders(monkeypatch)
+        model_7b, model_13b = "codellama/CodeLlama-7b-hf", "codellama/CodeLlama-13b-hf"
+
+        # Instances of the same model (e.g. one per worker) share one loaded copy,
+        # while another model is loaded separately
+        strategies = [CodeLLaMAInfilling(model_7b) for _ in range(3)]
+        strategies.append(CodeLLaMAInfilling(model_13b))
+        for strategy in strategies:
+            strategy._CodeLLaMAInfilling__load_model()
+        assert self.loads == [model_7b, model_13b]
+        assert HuggingFaceModelRegistry.references(model_7b) == 3
+
+        # The model is unloaded once all instances are closed
+        for strategy in strategies[:3]:
+            strategy.close()
+        assert not HuggingFaceModelRegistry.is_loaded(model_7b)
+        assert HuggingFaceModelRegistry.is_loaded(model_13b)
@@ -0,0 +1,175 @@
+from elleelleaime.generate.strategies.rate_limiter import AdaptiveRateLimitController
+
+from typing import Dict, List, Optional, Tuple
+
+import time
+import logging
+import threading
+
+
+class SimulatedProvider:
+    """
+    Provider that enforces a request limit with a token bucket, as OpenAI and Anthropic do,
+    and reports it in OpenAI-style headers.
+
+    The limit follows a recorded schedule of (seconds since start, requests per second)
+    entries. The bucket holds one second worth of requests.
+    """
+
+    def __init__(self, schedule: List[Tuple[float, float]], latency: float = 0.02):
+        self.schedule = schedule
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.bucket = schedule[0][1]
+        self.last_refill = self.start
+        self.accepted = 0
+        self.rejected = 0
+
+    def __limit(self, now: float) -> float:
+        limit = self.schedule[0][1]
+        for offset, rate in self.schedule:
+            if now - self.start >= offset:
+                limit = rate
+        return limit
+
+    def request(self) -> Tuple[int, Dict[str, str]]:
+        time.sleep(self.latency)
+        with self.lock:
+            now = time.monotonic()
+            limit = self.__limit(now)
+            self.bucket = min(limit, self.bucket + (now - self.last_refill) * limit)
+            self.last_refill = now
+            if self.bucket < 1:
+                self.rejected += 1
+                return 429, {
+                    "x-ratelimit-limit-requests": str(int(limit)),
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{int(1000 * (limit - self.bucket) / limit)}ms",
+                    "retry-after-ms": str(int(1000 * (1 - self.bucket) / limit)),
+                }
+            self.bucket -= 1
+            self.accepted += 1
+            return 200, {
+                "x-ratelimit-limit-requests": str(int(limit)),
+                "x-ratelimit-remaining-requests": str(int(self.bucket)),
+                "x-ratelimit-reset-requests": f"{int(1000 * (limit - self.bucket) / limit)}ms",
+            }
+
+
+def replay(
+    provider: SimulatedProvider,
+    controller: Optional[AdaptiveRateLimitController],
+    n_workers: int,
+    duration: float,
+) -> None:
+    """
+    Sends requests from `n_workers` threads for `duration` seconds. Without a controller,
+    workers retry rate limited requests right away, as independent backoffs end up doing
+    when many workers share a limit.
+    """
+
+    def worker():
+        while time.monotonic() - provider.start < duration:
+            if controller is not None:
+                controller.acquire()
+            status, headers = provider.request()
+            if controller is not None:
+                if status == 429:
+                    controller.throttle(headers)
+                else:
+                    controller.update(headers)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestAdaptiveRateLimitController:
+    def test_openai_headers(self):
+        now = [0.0]
+        controller = AdaptiveRateLimitController(margin=0, clock=lambda: now[0])
+        controller.update(
+            {
+                "x-ratelimit-limit-requests": "60",
+                "x-ratelimit-remaining-requests": "1",
+                "x-ratelimit-reset-requests": "59s",
+            }
+        )
+
+        # One request is left, and then one request is replenished every second
+        assert controller.reserve() == 0
+        assert controller.reserve() == 1
+        assert controller.reserve() == 2
+        now[0] += 10
+        assert controller.reserve() == 0
+
+    def test_anthropic_headers(self):
+        now = [0.0]
+        controller = AdaptiveRateLimitController(
+            margin=0, clock=lambda: now[0], wall_clock=lambda: 1700000000.0
+        )
+        controller.update(
+            {
+                "anthropic-ratelimit-tokens-limit": "1000",
+                "anthropic-ratelimit-tokens-remaining": "100",
+                # 90 seconds after the wall clock
+                "anthropic-ratelimit-tokens-reset": "2023-11-14T22:14:50Z",
+            }
+        )
+
+        # 10 tokens are replenished per second
+        assert controller.reserve(100) == 0
+        assert controller.reserve(50) == 5
+
+    def test_openrouter_headers(self):
+        now = [0.0]
+        controller = AdaptiveRateLimitController(
+            margin=0, clock=lambda: now[0], wall_clock=lambda: 1700000000.0
+        )
+        controller.update(
+            {
+                "X-RateLimit-Limit": "20",
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": "1700000010000",
+            }
+        )
+
+        assert controller.reserve() == 0.5
+
+    def test_throttle(self):
+        now = [0.0]
+        controller = AdaptiveRateLimitController(clock=lambda: now[0])
+
+        controller.throttle({"Retry-After": "3"})
+        assert controller.reserve() == 3
+        # Without retry-after, pauses grow exponentially
+        controller.throttle()
+        controller.throttle()
+        assert controller.reserve() == 4
+        assert controller.get_statistics()["throttled"] == 3
+
+    def test_simulated_provider(self):
+        # The limit drops by half after one second, as recorded when another job
+        # started sharing the organization limit
+        schedule = [(0.0, 40.0), (1.0, 20.0)]
+        duration = 2.0
+
+        uncontrolled = SimulatedProvider(schedule)
+        replay(uncontrolled, None, n_workers=8, duration=duration)
+
+        controlled = SimulatedProvider(schedule)
+        controller = AdaptiveRateLimitController()
+        replay(controlled, controller, n_workers=8, duration=duration)
+
+        # A full bucket, and then the requests replenished during each phase
+        capacity = 40 + 40 + 20
+        logging.info(
+            f"Uncontrolled: {uncontrolled.accepted} accepted, {uncontrolled.rejected} rejected, "
+            f"controlled: {controlled.accepted} accepted, {controlled.rejected} rejected"
+            f" ({controlled.accepted / capacity:.0%} of the limit)"
+        )
+        assert controlled.rejected < uncontrolled.rejected / 10
+        assert controlled.accepted >= 0.75 * capacity